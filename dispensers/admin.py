@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Dispenser, DispenserProduct
+from .models import Dispenser, DispenserProduct, Planogram, PlanogramRow
 
 class DispenserProductInline(admin.TabularInline):
     model = DispenserProduct
@@ -20,4 +20,16 @@ class DispenserProductAdmin(admin.ModelAdmin):
     list_display = ('dispenser', 'row_number', 'product', 'current_inventory', 'max_capacity')
     list_filter = ('dispenser', 'row_number')
     search_fields = ('dispenser__location_name', 'product__product_name')
-    readonly_fields = ('created_at', 'updated_at')
\ No newline at end of file
+    readonly_fields = ('created_at', 'updated_at')
+
+class PlanogramRowInline(admin.TabularInline):
+    model = PlanogramRow
+    extra = 0
+    fields = ('row_number', 'product', 'max_capacity')
+
+@admin.register(Planogram)
+class PlanogramAdmin(admin.ModelAdmin):
+    list_display = ('name', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'updated_at')
+    inlines = [PlanogramRowInline]
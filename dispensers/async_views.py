@@ -0,0 +1,146 @@
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+
+from napkin_dispenser.async_api import async_api_view, json_response
+from .events import StreamFull, get_config as get_stream_config, inventory_events
+from .geo import dispenser_locator, get_config as get_geo_config, parse_radius
+from .models import Dispenser
+from .serializers import DispenserSerializer
+
+
+@async_api_view(['GET'], permission_classes=[IsAuthenticated])
+async def nearby(request):
+    """Async DispenserViewSet.nearby: dispensers around lat/lng, closest first"""
+    dispensers = Dispenser.objects.all().prefetch_related('rows', 'rows__product')
+    lat = request.GET.get('lat')
+    lng = request.GET.get('lng')
+
+    if lat is None or lng is None:
+        return json_response(DispenserSerializer([dispenser async for dispenser in dispensers], many=True).data)
+
+    config = get_geo_config()
+    try:
+        lat, lng = float(lat), float(lng)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError
+        radius = request.GET.get('radius')
+        radius = parse_radius(radius) if radius is not None else None
+        limit = int(request.GET.get('limit', config['DEFAULT_LIMIT']))
+        if limit <= 0:
+            raise ValueError
+    except (ValueError, TypeError):
+        return json_response({'error': 'Invalid lat, lng, radius or limit'},
+                             status=status.HTTP_400_BAD_REQUEST)
+    limit = min(limit, config['MAX_LIMIT'])
+
+    matches = await dispenser_locator.anearest(lat, lng, radius_km=radius, limit=limit)
+    by_pk = await dispensers.ain_bulk([pk for _, pk in matches])
+
+    data = []
+    for distance, pk in matches:
+        if pk not in by_pk:
+            continue
+        item = DispenserSerializer(by_pk[pk]).data
+        item['distance_km'] = round(distance, 3)
+        data.append(item)
+    return json_response(data)
+
+
+def _sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _inventory_events(waiter, dispenser_ids, cursor, reset, config):
+    loop, wake = waiter
+    deadline = loop.time() + config['MAX_DURATION']
+    try:
+        yield f'retry: {config["RETRY"]}\n\n'
+        if reset:
+            yield _sse({}, event='reset', event_id=cursor)
+        while True:
+            wake.clear()
+            events = inventory_events.since(cursor)
+            if events is None:
+                # Older than the buffer: the client has to refetch its snapshot
+                cursor = inventory_events.last_id
+                yield _sse({}, event='reset', event_id=cursor)
+                continue
+            for event_id, payload in events:
+                cursor = event_id
+                if payload is not None and (dispenser_ids is None or payload['dispenser_id'] in dispenser_ids):
+                    yield _sse(payload, event='inventory', event_id=event_id)
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(wake.wait(), min(config['HEARTBEAT_INTERVAL'], remaining))
+            except asyncio.TimeoutError:
+                # Carries the cursor so a filtered, quiet stream still resumes inside the buffer
+                yield f': heartbeat\nid: {cursor}\n\n'
+    finally:
+        inventory_events.unsubscribe(waiter)
+
+
+@async_api_view(['GET'], permission_classes=[IsAuthenticated])
+async def inventory_stream(request):
+    """Server-sent events with every committed change to a dispenser row's inventory.
+
+    ``dispensers`` optionally limits the stream to a comma-separated list of
+    dispenser ids. Reconnecting clients send Last-Event-ID (or the
+    ``last_event_id`` parameter) and get the events they missed from the
+    buffer, or a ``reset`` event when those are gone. Only served over
+    ASGI: a WSGI worker would collect the whole stream before sending any
+    of it. Django 4.2 does not notice disconnected clients, so every stream
+    ends after MAX_DURATION and the client resumes.
+    """
+    if not isinstance(request, ASGIRequest):
+        return json_response({'error': 'The inventory stream is only served over ASGI'},
+                             status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    config = get_stream_config()
+    dispenser_ids = None
+    if request.GET.get('dispensers'):
+        try:
+            dispenser_ids = {str(uuid.UUID(value.strip())) for value in request.GET['dispensers'].split(',')}
+        except ValueError:
+            return json_response({'error': 'Invalid dispenser id'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(dispenser_ids) > config['MAX_DISPENSERS']:
+            return json_response({'error': f'At most {config["MAX_DISPENSERS"]} dispensers per stream'},
+                                 status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        waiter = inventory_events.subscribe(asyncio.get_running_loop(), asyncio.Event())
+    except StreamFull:
+        return json_response({'error': 'Too many open inventory streams'},
+                             status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    # Taken now, so changes made before the client reads its first chunk are not lost
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    reset = False
+    try:
+        cursor = int(last_event_id) if last_event_id else await sync_to_async(inventory_events.current_id)()
+    except ValueError:
+        cursor = await sync_to_async(inventory_events.current_id)()
+        reset = True
+    except BaseException:
+        inventory_events.unsubscribe(waiter)
+        raise
+
+    response = StreamingHttpResponse(_inventory_events(waiter, dispenser_ids, cursor, reset, config),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,238 @@
+import bisect
+import collections
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Max
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BUFFER_SIZE': 1000,  # events kept per process for Last-Event-ID resumes
+    'POLL_INTERVAL': 0.5,  # seconds between reads of the events table while streams are open
+    'RETENTION': 24 * 60 * 60,  # seconds prune_inventory_events keeps events for
+    'HEARTBEAT_INTERVAL': 15,  # seconds between keep-alive comments
+    'RETRY': 3000,  # milliseconds EventSource waits before reconnecting
+    'MAX_DURATION': 3600,  # seconds before a stream is closed and the client resumes
+    'MAX_SUBSCRIBERS': 1000,  # open streams per process
+    'MAX_DISPENSERS': 100,  # dispensers a stream can filter on
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_STREAM', {})}
+
+
+class StreamFull(Exception):
+    pass
+
+
+def record_row_changes(keys, reason):
+    """Record (dispenser_id, row_number) rows as changed; call inside the transaction that changes them"""
+    from .models import InventoryEvent
+
+    InventoryEvent.objects.bulk_create([
+        InventoryEvent(dispenser_id=dispenser_id, row_number=row_number, reason=reason)
+        for dispenser_id, row_number in dict.fromkeys(keys)
+    ])
+    # Other processes see the events on their next poll; this one needn't wait for it
+    transaction.on_commit(inventory_events.wake)
+
+
+def row_event(row, reason):
+    return {
+        'dispenser_id': str(row.dispenser_id),
+        'row_number': row.row_number,
+        'product_id': str(row.product_id) if row.product_id else None,
+        'current_inventory': row.current_inventory,
+        'max_capacity': row.max_capacity,
+        'fill_ratio': row.fill_ratio,
+        'reason': reason,
+    }
+
+
+class InventoryEventBus:
+    """Per-process window onto the InventoryEvent table for the inventory streams.
+
+    While streams are open, a background thread reads new events every
+    ``POLL_INTERVAL`` seconds (at once after a local commit), adds the rows'
+    current state and keeps the last ``BUFFER_SIZE`` of them in memory, so
+    every process sees changes made by any process and streams resume from
+    memory. Event ids are the table's ids. With no open streams the
+    thread sleeps and nothing is read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset(self):
+        self._events = collections.deque()
+        self._ids = collections.deque()
+        # Buffered events are complete for ids in (_floor, _last_id]; None until the first poll
+        self._floor = None
+        self._last_id = None
+        self._generation = 0
+        self._waiters = set()
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def current_id(self):
+        """Id of the newest committed event; where a stream without Last-Event-ID starts"""
+        from .models import InventoryEvent
+
+        # Read from the table: the buffer may still be catching up
+        return InventoryEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+    def publish(self, events, generation=None):
+        """Buffer ``[(id, payload), ...]`` (ascending ids) and wake every open stream"""
+        if not events:
+            return
+        buffer_size = get_config()['BUFFER_SIZE']
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # Read before the buffer was restarted; the next poll reads them again
+                return
+            for event_id, payload in events:
+                self._events.append((event_id, payload))
+                self._ids.append(event_id)
+                self._last_id = event_id
+            while len(self._events) > buffer_size:
+                self._events.popleft()
+                self._floor = self._ids.popleft()
+        self._notify()
+
+    def _notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's event loop is already closed
+                self.unsubscribe((loop, event))
+
+    def since(self, cursor):
+        """Buffered [(id, payload), ...] after ``cursor``, or None if some of them are gone"""
+        with self._lock:
+            if self._floor is None or cursor >= (self._last_id or 0):
+                # Not started yet, or nothing newer than the client has seen
+                return []
+            if cursor < self._floor:
+                return None
+            return list(self._events)[bisect.bisect_right(self._ids, cursor):]
+
+    def poll(self):
+        """Read new events from the table into the buffer; returns how many were read"""
+        from .models import DispenserProduct, InventoryEvent
+
+        buffer_size = get_config()['BUFFER_SIZE']
+        with self._lock:
+            after, generation = self._last_id, self._generation
+        if after is None:
+            after = max(0, (InventoryEvent.objects.aggregate(last=Max('id'))['last'] or 0) - buffer_size)
+            with self._lock:
+                if generation != self._generation:
+                    return 0
+                self._floor = self._last_id = after
+            # Streams waiting for the buffer to start can now resume or reset
+            self._notify()
+
+        rows = list(InventoryEvent.objects.filter(id__gt=after).order_by('id')
+                    .values_list('id', 'dispenser_id', 'row_number', 'reason')[:buffer_size])
+        if not rows:
+            return 0
+        current = {
+            (row.dispenser_id, row.row_number): row
+            for row in DispenserProduct.objects.filter(dispenser_id__in={row[1] for row in rows}).order_by()
+        }
+        events = []
+        for event_id, dispenser_id, row_number, reason in rows:
+            row = current.get((dispenser_id, row_number))
+            # A deleted dispenser has no state left to send
+            events.append((event_id, row_event(row, reason) if row else None))
+        self.publish(events, generation)
+        return len(rows)
+
+    def subscribe(self, loop, event):
+        with self._lock:
+            if len(self._waiters) >= get_config()['MAX_SUBSCRIBERS']:
+                raise StreamFull()
+            if not self._waiters:
+                # Events that arrived while nobody listened were not read; start over from the table
+                self._events.clear()
+                self._ids.clear()
+                self._floor = self._last_id = None
+                self._generation += 1
+            waiter = (loop, event)
+            self._waiters.add(waiter)
+        self._ensure_thread()
+        self._wakeup.set()
+        return waiter
+
+    def unsubscribe(self, waiter):
+        with self._lock:
+            self._waiters.discard(waiter)
+
+    def wake(self):
+        if self._waiters:
+            self._wakeup.set()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inventory-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                if not self._waiters:
+                    self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+                close_old_connections()
+                try:
+                    full = self.poll() >= get_config()['BUFFER_SIZE']
+                except Exception:
+                    logger.exception('Failed to read inventory events')
+                    full = False
+                if not full:
+                    self._wakeup.wait(get_config()['POLL_INTERVAL'])
+                    self._wakeup.clear()
+        finally:
+            connections.close_all()
+
+
+inventory_events = InventoryEventBus()
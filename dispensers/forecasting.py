@@ -0,0 +1,205 @@
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Func, IntegerField
+from django.utils import timezone
+
+from transactions.models import Transaction
+from .models import DispenserProduct
+
+HOURS_PER_WEEK = 7 * 24
+
+StockoutForecast = namedtuple('StockoutForecast', ['rows', 'results'])
+
+DEFAULTS = {
+    'HISTORY_DAYS': 28,  # sales window the rates are learned from
+    'HORIZON_HOURS': 7 * 24,  # how far ahead stockouts are projected
+    'SHRINKAGE': 20,  # sales a row needs before its own weekly profile outweighs the fleet's
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DISPENSER_FORECAST', {})}
+
+
+def _hour_of_week(value):
+    """0..167 slot of a local datetime, Sunday 00:00 first"""
+    return (value.isoweekday() % 7) * 24 + value.hour
+
+
+class EpochHour(Func):
+    """Whole hours since the Unix epoch (UTC) of a datetime, computed natively by the database"""
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="(CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) / 3600)",
+                           **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / 3600)',
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='FLOOR(UNIX_TIMESTAMP(%(expressions)s) / 3600)',
+                           **extra_context)
+
+
+def _fetch_raw(queryset):
+    """Run a values_list() queryset and return its tuples without Django's per-value converters.
+
+    Columns come back in SQL order, so annotations must be listed last.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _hex(value):
+    return value.hex if isinstance(value, uuid.UUID) else value
+
+
+def _as_uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(value)
+
+
+def _utc_offsets(start_hour, hours):
+    """UTC offset in hours of TIME_ZONE for ``hours`` epoch hours from ``start_hour`` (follows DST)"""
+    zone = timezone.get_current_timezone()
+    return np.array([
+        datetime.fromtimestamp((start_hour + i) * 3600, zone).utcoffset().total_seconds() // 3600
+        for i in range(hours)
+    ], dtype=np.int64)
+
+
+def load_sales(rows, since, now):
+    """Units sold per row and local hour-of-week since ``since``, shape (rows, 168).
+
+    ``rows`` are (id, dispenser_id, row_number, ...) tuples. Sales are read
+    in one query with the UTC epoch hour computed by the database, then
+    matched to rows and bucketed into local hours-of-week with NumPy.
+    Tuples are read without Django's converters since per-value UUID and
+    datetime parsing is what dominates at fleet scale.
+    """
+    counts = np.zeros((len(rows), HOURS_PER_WEEK))
+    sales = _fetch_raw(Transaction.objects.filter(
+        timestamp__gte=since, status=Transaction.Status.SUCCESS
+    ).annotate(epoch_hour=EpochHour('timestamp')).order_by().values_list(
+        'dispenser_id', 'row_number', 'quantity', 'epoch_hour'))
+    if not sales:
+        return counts
+
+    dispenser_ids, row_numbers, units, epoch_hours = zip(*sales)
+    dispensers, dispenser_index = np.unique(np.array(dispenser_ids), return_inverse=True)
+    row_numbers = np.asarray(row_numbers, dtype=np.int64)
+    position = {_hex(dispenser_id): i for i, dispenser_id in enumerate(dispensers.tolist())}
+    lookup = np.full((len(dispensers), max(row_numbers.max(), max(row[2] for row in rows)) + 1), -1)
+    for i, (_, dispenser_id, row_number, *_) in enumerate(rows):
+        j = position.get(_hex(dispenser_id))
+        if j is not None:
+            lookup[j, row_number] = i
+    row_index = lookup[dispenser_index, row_numbers]
+
+    epoch_hours = np.asarray(epoch_hours, dtype=np.int64)
+    start_hour = int(since.timestamp() // 3600)
+    span = int(now.timestamp() // 3600) - start_hour + 1
+    offsets = _utc_offsets(start_hour, span)
+    local_hours = epoch_hours + offsets[np.clip(epoch_hours - start_hour, 0, span - 1)]
+    # The epoch began on a Thursday; shift so slot 0 is Sunday 00:00
+    slots = (local_hours + 4 * 24) % HOURS_PER_WEEK
+
+    known = row_index >= 0
+    np.add.at(counts, (row_index[known], slots[known]), np.asarray(units, dtype=np.float64)[known])
+    return counts
+
+
+def hourly_rates(counts, weeks, shrinkage):
+    """Expected units per hour-of-week for every row, shape (rows, 168).
+
+    Each row's own weekly profile is blended with its mean rate shaped by
+    the fleet-wide profile, weighted by how many units the row sold, so
+    sparse rows borrow the fleet's time-of-day/day-of-week pattern.
+    """
+    own = counts / weeks
+    totals = counts.sum(axis=1)
+    fleet = counts.sum(axis=0)
+    fleet_shape = fleet / fleet.mean() if fleet.any() else np.ones(HOURS_PER_WEEK)
+    mean_rate = totals / (weeks * HOURS_PER_WEEK)
+    weight = (totals / (totals + shrinkage))[:, None]
+    return weight * own + (1 - weight) * mean_rate[:, None] * fleet_shape
+
+
+def hours_to_empty(inventory, rates, start_slot, first_hour_fraction, horizon_hours):
+    """Hours until each row's inventory is used up, NaN if not within the horizon"""
+    slots = (start_slot + np.arange(horizon_hours)) % HOURS_PER_WEEK
+    demand = rates[:, slots]
+    demand[:, 0] *= first_hour_fraction
+    cumulative = np.cumsum(demand, axis=1)
+
+    reached = cumulative >= inventory[:, None]
+    hit = reached.any(axis=1) & (inventory > 0)
+    index = np.argmax(reached, axis=1)
+    rows = np.arange(len(inventory))
+    before = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0.0)
+    step = demand[rows, index]
+    partial = np.divide(inventory - before, step, out=np.zeros(len(inventory)), where=step > 0)
+    # The first slot only lasts first_hour_fraction of an hour
+    elapsed = np.where(index > 0, index - 1 + first_hour_fraction, 0.0) + partial * np.where(
+        index > 0, 1.0, first_hour_fraction)
+
+    result = np.full(len(inventory), np.nan)
+    result[hit] = elapsed[hit]
+    result[inventory <= 0] = 0.0
+    return result
+
+
+def forecast_stockouts(horizon_hours=None, history_days=None, dispenser_id=None, now=None):
+    """Project when every stocked row runs out.
+
+    Returns a StockoutForecast with the number of rows forecast and, for
+    the rows expected to empty within the horizon, one dict each with the
+    daily sales rate, ``hours_to_empty`` and ``stockout_at``, soonest first.
+    """
+    config = get_config()
+    horizon_hours = horizon_hours or config['HORIZON_HOURS']
+    history_days = history_days or config['HISTORY_DAYS']
+    now = timezone.localtime(now)
+
+    rows = DispenserProduct.objects.filter(product__isnull=False)
+    if dispenser_id:
+        rows = rows.filter(dispenser_id=dispenser_id)
+    rows = _fetch_raw(rows.order_by().values_list('id', 'dispenser_id', 'row_number', 'product_id',
+                                                  'current_inventory', 'max_capacity'))
+    if not rows:
+        return StockoutForecast(0, [])
+
+    counts = load_sales(rows, now - timedelta(days=history_days), now)
+    rates = hourly_rates(counts, history_days / 7, config['SHRINKAGE'])
+
+    inventory = np.fromiter((row[4] for row in rows), dtype=np.float64, count=len(rows))
+    first_hour_fraction = 1 - (now.minute * 60 + now.second) / 3600
+    hours = hours_to_empty(inventory, rates, _hour_of_week(now), first_hour_fraction, horizon_hours)
+    daily_rate = rates.sum(axis=1) / 7
+
+    at_risk = np.flatnonzero(~np.isnan(hours))
+    order = at_risk[np.lexsort((-daily_rate[at_risk], hours[at_risk]))]
+    results = []
+    for i in order.tolist():
+        row_id, row_dispenser_id, row_number, product_id, current_inventory, max_capacity = rows[i]
+        empty_in = round(float(hours[i]), 2)
+        results.append({
+            'id': _as_uuid(row_id),
+            'dispenser_id': _as_uuid(row_dispenser_id),
+            'row_number': row_number,
+            'product_id': _as_uuid(product_id),
+            'current_inventory': current_inventory,
+            'max_capacity': max_capacity,
+            'units_per_day': round(float(daily_rate[i]), 3),
+            'hours_to_empty': empty_in,
+            'stockout_at': now + timedelta(hours=empty_in),
+        })
+    return StockoutForecast(len(rows), results)
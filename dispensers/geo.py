@@ -0,0 +1,231 @@
+import heapq
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULTS = {
+    'CELL_SIZE': 0.05,  # degrees, roughly 5.5 km of latitude
+    'REBUILD_INTERVAL': 300,  # seconds
+    'DEFAULT_LIMIT': 20,
+    'MAX_LIMIT': 100,
+    'MAX_RADIUS_KM': 1000,  # largest radius a query may ask for
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DISPENSER_GEO_INDEX', {})}
+
+
+def parse_coordinates(gps_coordinates):
+    """Return (lat, lng) floats from a gps_coordinates value, or (None, None)"""
+    if not isinstance(gps_coordinates, dict):
+        return None, None
+    try:
+        lat = float(gps_coordinates['lat'])
+        lng = float(gps_coordinates['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None, None
+    return lat, lng
+
+
+def parse_radius(value):
+    """Radius in km from a query parameter; ValueError unless finite and within (0, MAX_RADIUS_KM]"""
+    radius = float(value)
+    # float() accepts 'inf' and 'nan', which the grid cannot bucket
+    if not math.isfinite(radius) or not 0 < radius <= get_config()['MAX_RADIUS_KM']:
+        raise ValueError(f'Invalid radius {value!r}')
+    return radius
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """Uniform lat/lng grid answering radius and k-nearest queries.
+
+    Queries only visit the cells around the query point, so their cost
+    depends on the local density and the result size, not on how many
+    points are indexed. Longitude wrap-around at +/-180 is not handled.
+    """
+
+    def __init__(self, cell_size=DEFAULTS['CELL_SIZE']):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def add(self, key, lat, lng):
+        self.remove(key)
+        cell = self._cell(lat, lng)
+        self._cells.setdefault(cell, {})[key] = (lat, lng)
+        self._points[key] = cell
+
+    def remove(self, key):
+        cell = self._points.pop(key, None)
+        if cell is not None:
+            bucket = self._cells[cell]
+            bucket.pop(key, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _ring(self, center, r):
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+        for dj in range(-r, r + 1):
+            yield (ci - r, cj + dj)
+            yield (ci + r, cj + dj)
+        for di in range(-r + 1, r):
+            yield (ci + di, cj - r)
+            yield (ci + di, cj + r)
+
+    def _covered_km(self, lat, r):
+        """Distance from the query point guaranteed to be covered by rings 0..r"""
+        # The query point can sit anywhere inside its own cell
+        edge_lat = min(89.9, abs(lat) + (r + 1) * self.cell_size)
+        return r * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+
+    def nearest(self, lat, lng, radius_km=None, limit=None):
+        """Return [(distance_km, key), ...] sorted by distance"""
+        if not self._points:
+            return []
+
+        if radius_km is not None:
+            dlat = radius_km / KM_PER_DEGREE
+            dlng = radius_km / (KM_PER_DEGREE * max(0.01, math.cos(math.radians(min(89.9, abs(lat) + dlat)))))
+            i0, j0 = self._cell(lat - dlat, lng - dlng)
+            i1, j1 = self._cell(lat + dlat, lng + dlng)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+                cells = list(self._cells)
+            else:
+                cells = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+            matches = []
+            for cell in cells:
+                for key, (plat, plng) in self._cells.get(cell, {}).items():
+                    distance = haversine_km(lat, lng, plat, plng)
+                    if distance <= radius_km:
+                        matches.append((distance, key))
+            matches.sort()
+            return matches[:limit] if limit else matches
+
+        # k-nearest: widen rings until the k-th match is closer than any unvisited cell
+        limit = limit or len(self._points)
+        center = self._cell(lat, lng)
+        heap = []
+        visited = 0
+        r = 0
+        while True:
+            if 8 * r > len(self._cells):
+                # The ring now has more cells than are occupied: scanning them all is cheaper
+                matches = ((haversine_km(lat, lng, plat, plng), key)
+                           for bucket in self._cells.values()
+                           for key, (plat, plng) in bucket.items())
+                return heapq.nsmallest(limit, matches)
+            for cell in self._ring(center, r):
+                for key, (plat, plng) in self._cells.get(cell, {}).items():
+                    visited += 1
+                    item = (-haversine_km(lat, lng, plat, plng), key)
+                    if len(heap) < limit:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+            if visited == len(self._points):
+                break
+            if len(heap) == limit and -heap[0][0] <= self._covered_km(lat, r):
+                break
+            r += 1
+        return sorted((-distance, key) for distance, key in heap)
+
+
+class DispenserLocator:
+    """Process-wide spatial index of dispensers.
+
+    Built lazily from the database, kept current by the Dispenser signals
+    and fully rebuilt every ``REBUILD_INTERVAL`` seconds to pick up changes
+    made by other worker processes.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+
+    def rebuild(self):
+        from .models import Dispenser
+
+        config = get_config()
+        index = SpatialIndex(cell_size=config['CELL_SIZE'])
+        rows = Dispenser.objects.filter(latitude__isnull=False, longitude__isnull=False) \
+            .values_list('dispenser_id', 'latitude', 'longitude')
+        for pk, lat, lng in rows.iterator(chunk_size=2000):
+            index.add(pk, lat, lng)
+        with self._lock:
+            self._index = index
+            self._built_at = time.monotonic()
+        return index
+
+    def get_index(self):
+        with self._lock:
+            index = self._index
+            fresh = time.monotonic() - self._built_at < get_config()['REBUILD_INTERVAL']
+        if index is None or not fresh:
+            index = self.rebuild()
+        return index
+
+    async def aget_index(self):
+        """get_index() for async code; a due rebuild runs in the ORM's thread"""
+        with self._lock:
+            index = self._index
+            fresh = time.monotonic() - self._built_at < get_config()['REBUILD_INTERVAL']
+        if index is None or not fresh:
+            index = await sync_to_async(self.rebuild)()
+        return index
+
+    def update(self, pk, lat, lng):
+        with self._lock:
+            if self._index is None:
+                return
+            if lat is None or lng is None:
+                self._index.remove(pk)
+            else:
+                self._index.add(pk, lat, lng)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(pk)
+
+    def nearest(self, lat, lng, radius_km=None, limit=None):
+        index = self.get_index()
+        with self._lock:
+            return index.nearest(lat, lng, radius_km=radius_km, limit=limit)
+
+    async def anearest(self, lat, lng, radius_km=None, limit=None):
+        index = await self.aget_index()
+        with self._lock:
+            return index.nearest(lat, lng, radius_km=radius_km, limit=limit)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+dispenser_locator = DispenserLocator()
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dispensers.forecasting import forecast_stockouts
+
+
+class Command(BaseCommand):
+    help = 'Project when each stocked dispenser row will run out from recent sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-hours', type=int, help='Default: DISPENSER_FORECAST HORIZON_HOURS')
+        parser.add_argument('--history-days', type=int, help='Default: DISPENSER_FORECAST HISTORY_DAYS')
+        parser.add_argument('--dispenser-id')
+        parser.add_argument('--limit', type=int, default=50, help='Rows to print (0 for all)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        forecast = forecast_stockouts(
+            horizon_hours=options['horizon_hours'],
+            history_days=options['history_days'],
+            dispenser_id=options['dispenser_id'],
+        )
+        elapsed = time.perf_counter() - started
+
+        shown = forecast.results[:options['limit']] if options['limit'] else forecast.results
+        self.stdout.write(f'{"dispenser":<38}{"row":>4}{"stock":>7}{"per day":>9}{"empty in":>10}  stockout at')
+        for row in shown:
+            self.stdout.write(
+                f'{str(row["dispenser_id"]):<38}{row["row_number"]:>4}'
+                f'{row["current_inventory"]:>7}{row["units_per_day"]:>9.2f}'
+                f'{row["hours_to_empty"]:>9.1f}h  {row["stockout_at"]:%Y-%m-%d %H:%M}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(forecast.results)} of {forecast.rows} rows run out within the horizon '
+            f'(forecast took {elapsed * 1000:.0f} ms).'
+        ))
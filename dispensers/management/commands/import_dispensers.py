@@ -0,0 +1,88 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dispensers.provisioning import BATCH_SIZE, DuplicateBeaconError, provision_dispensers
+from dispensers.serializers import DispenserProvisionSerializer
+from logs.services import audit_log, log_writer
+
+
+class Command(BaseCommand):
+    help = ('Provision dispensers from a CSV (ble_beacon_id, location_name, lat, lng) '
+            'or JSON (list of {ble_beacon_id, location_name, gps_coordinates}) file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=['csv', 'json'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without importing it')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'{path} does not exist')
+        file_format = options['file_format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Cannot tell the file format, pass --file-format csv or json')
+
+        records = self._read_csv(path) if file_format == 'csv' else self._read_json(path)
+        serializer = DispenserProvisionSerializer(data=records, many=True)
+        if not serializer.is_valid():
+            for number, errors in enumerate(serializer.errors, start=1):
+                if errors:
+                    self.stderr.write(f'Record {number}: {json.dumps(errors)}')
+            raise CommandError('Nothing imported, fix the records above')
+
+        entries = serializer.validated_data
+        if options['dry_run']:
+            self.stdout.write(f'{len(entries)} dispensers are valid.')
+            return
+
+        try:
+            dispensers = provision_dispensers(entries, batch_size=options['batch_size'])
+        except DuplicateBeaconError as e:
+            if e.duplicates:
+                self.stderr.write(f'Repeated in the file: {", ".join(e.duplicates)}')
+            if e.existing:
+                self.stderr.write(f'Already registered: {", ".join(e.existing)}')
+            raise CommandError('Nothing imported, ble_beacon_id must be unique')
+
+        audit_log(
+            level='info',
+            action='DISPENSERS_BULK_CREATED',
+            description=f'Provisioned {len(dispensers)} dispensers',
+            metadata={
+                'count': len(dispensers),
+                'source': 'import_dispensers',
+                'file': path.name
+            }
+        )
+        log_writer.flush()
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(dispensers)} dispensers.'))
+
+    def _read_csv(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            missing = {'ble_beacon_id', 'location_name', 'lat', 'lng'} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f'CSV is missing columns: {", ".join(sorted(missing))}')
+            return [{
+                'ble_beacon_id': row['ble_beacon_id'],
+                'location_name': row['location_name'],
+                'gps_coordinates': {'lat': row['lat'], 'lng': row['lng']},
+            } for row in reader]
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                records = json.load(f)
+        except ValueError as e:
+            raise CommandError(f'Invalid JSON: {e}')
+        if isinstance(records, dict):
+            records = records.get('dispensers')
+        if not isinstance(records, list):
+            raise CommandError('Expected a list of dispensers')
+        return records
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dispensers.events import get_config
+from dispensers.models import InventoryEvent
+
+
+class Command(BaseCommand):
+    help = "Delete inventory stream events older than INVENTORY_STREAM['RETENTION'] in bounded batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=get_config()['RETENTION'])
+        total = 0
+        while True:
+            ids = list(InventoryEvent.objects.filter(created_at__lt=cutoff)
+                       .values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += InventoryEvent.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} inventory events.'))
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+def backfill_lat_lng(apps, schema_editor):
+    Dispenser = apps.get_model('dispensers', 'Dispenser')
+    batch = []
+    for dispenser in Dispenser.objects.all().iterator(chunk_size=1000):
+        coordinates = dispenser.gps_coordinates
+        try:
+            dispenser.latitude = float(coordinates['lat'])
+            dispenser.longitude = float(coordinates['lng'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        batch.append(dispenser)
+        if len(batch) >= 1000:
+            Dispenser.objects.bulk_update(batch, ['latitude', 'longitude'])
+            batch = []
+    if batch:
+        Dispenser.objects.bulk_update(batch, ['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0002_rename_id_dispenser_dispenser_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispenser',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispenser',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(fields=['latitude', 'longitude'], name='dispensers_latitud_9ebced_idx'),
+        ),
+        migrations.RunPython(backfill_lat_lng, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_rename_id_product_product_id'),
+        ('dispensers', '0003_dispenser_lat_lng'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Planogram',
+            fields=[
+                ('planogram_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'planograms',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanogramRow',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('row_number', models.IntegerField()),
+                ('max_capacity', models.IntegerField(default=0)),
+                ('planogram', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='dispensers.planogram')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='planogram_rows', to='products.product')),
+            ],
+            options={
+                'db_table': 'planogram_rows',
+                'ordering': ['planogram', 'row_number'],
+                'unique_together': {('planogram', 'row_number')},
+            },
+        ),
+    ]
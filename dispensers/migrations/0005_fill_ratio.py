@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:17
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def backfill_fill_ratio(apps, schema_editor):
+    DispenserProduct = apps.get_model('dispensers', 'DispenserProduct')
+    DispenserProduct.objects.filter(max_capacity__gt=0).update(
+        fill_ratio=Cast(F('current_inventory'), FloatField()) / F('max_capacity')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0004_planogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispenserproduct',
+            name='fill_ratio',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_fill_ratio, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='dispenserproduct',
+            index=models.Index(fields=['fill_ratio', 'id'], name='dispenser_p_fill_ra_27da8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispenserproduct',
+            index=models.Index(fields=['product', 'fill_ratio'], name='dispenser_p_product_b44af3_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0005_fill_ratio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('row_number', models.IntegerField()),
+                ('reason', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('dispenser', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dispensers.dispenser')),
+            ],
+            options={
+                'db_table': 'inventory_events',
+                'indexes': [models.Index(fields=['created_at'], name='inventory_e_created_7e55ab_idx')],
+            },
+        ),
+    ]
@@ -1,11 +1,19 @@
 from django.db import models
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
 import uuid
 
+ROWS_PER_DISPENSER = 4
+
 class Dispenser(models.Model):
     dispenser_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     ble_beacon_id = models.CharField(max_length=100, unique=True)
     location_name = models.CharField(max_length=200)
     gps_coordinates = models.JSONField()  # {'lat': 24.7136, 'lng': 46.6753}
+    # Numeric copies of gps_coordinates, kept in sync on save
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
     install_date = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -13,10 +21,22 @@ class Dispenser(models.Model):
     class Meta:
         db_table = 'dispensers'
         ordering = ['location_name']
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
 
     def __str__(self):
         return f'{self.location_name} ({self.ble_beacon_id})'
 
+    def save(self, *args, **kwargs):
+        from .geo import parse_coordinates
+
+        self.latitude, self.longitude = parse_coordinates(self.gps_coordinates)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'gps_coordinates' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude'}
+        super().save(*args, **kwargs)
+
 class DispenserProduct(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     dispenser = models.ForeignKey(Dispenser, on_delete=models.CASCADE, related_name='rows')
@@ -25,6 +45,10 @@ class DispenserProduct(models.Model):
                                 null=True, blank=True, related_name='dispenser_products')
     current_inventory = models.IntegerField(default=0)
     max_capacity = models.IntegerField(default=0)
+    # current_inventory / max_capacity, NULL for rows without a capacity.
+    # Stored so low-stock lookups can use an index; kept in sync by save(),
+    # the purchase engine and the bulk restock path.
+    fill_ratio = models.FloatField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -32,7 +56,95 @@ class DispenserProduct(models.Model):
         db_table = 'dispenser_products'
         unique_together = ['dispenser', 'row_number']
         ordering = ['dispenser', 'row_number']
+        indexes = [
+            models.Index(fields=['fill_ratio', 'id']),
+            models.Index(fields=['product', 'fill_ratio']),
+        ]
+
+    @staticmethod
+    def fill_ratio_expression(inventory=F('current_inventory')):
+        """SQL expression for fill_ratio given the row's (new) inventory, for use in UPDATEs"""
+        return Case(
+            When(max_capacity__gt=0, then=Cast(inventory, FloatField()) / F('max_capacity')),
+            default=Value(None),
+            output_field=FloatField(),
+        )
+
+    def compute_fill_ratio(self):
+        max_capacity = int(self.max_capacity or 0)
+        self.fill_ratio = int(self.current_inventory or 0) / max_capacity if max_capacity > 0 else None
+        return self.fill_ratio
+
+    def save(self, *args, **kwargs):
+        self.compute_fill_ratio()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'current_inventory', 'max_capacity'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'fill_ratio'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def empty_rows(cls, dispenser):
+        """Unsaved empty rows 1..ROWS_PER_DISPENSER for a new dispenser"""
+        return [
+            cls(dispenser=dispenser, row_number=row_number, current_inventory=0, max_capacity=0)
+            for row_number in range(1, ROWS_PER_DISPENSER + 1)
+        ]
 
     def __str__(self):
         product_name = self.product.product_name if self.product else 'Empty'
-        return f'{self.dispenser.location_name} - Row {self.row_number}: {product_name}'
\ No newline at end of file
+        return f'{self.dispenser.location_name} - Row {self.row_number}: {product_name}'
+
+class Planogram(models.Model):
+    """Named row layout (product and capacity per row) applied to many dispensers at once"""
+    planogram_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'planograms'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class PlanogramRow(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    planogram = models.ForeignKey(Planogram, on_delete=models.CASCADE, related_name='rows')
+    row_number = models.IntegerField()
+    product = models.ForeignKey('products.Product', on_delete=models.SET_NULL,
+                                null=True, blank=True, related_name='planogram_rows')
+    max_capacity = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'planogram_rows'
+        unique_together = ['planogram', 'row_number']
+        ordering = ['planogram', 'row_number']
+
+    def __str__(self):
+        product_name = self.product.product_name if self.product else 'Empty'
+        return f'{self.planogram.name} - Row {self.row_number}: {product_name}'
+
+class InventoryEvent(models.Model):
+    """A committed change to one dispenser row's inventory.
+
+    Written in the same transaction as the change and tailed by every
+    process's inventory stream (see dispensers.events). Ids must become
+    visible in order, which SQLite's single writer guarantees.
+    """
+    id = models.BigAutoField(primary_key=True)
+    dispenser = models.ForeignKey(Dispenser, on_delete=models.CASCADE, related_name='+')
+    row_number = models.IntegerField()
+    reason = models.CharField(max_length=20)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'inventory_events'
+        indexes = [
+            # prune_inventory_events
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f'#{self.id} {self.reason}: {self.dispenser_id} row {self.row_number}'
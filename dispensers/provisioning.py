@@ -0,0 +1,74 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+
+from products.catalog import bump_catalog_version
+from .geo import dispenser_locator, parse_coordinates
+from .models import Dispenser, DispenserProduct
+
+BATCH_SIZE = 500
+
+
+class DuplicateBeaconError(Exception):
+    """Some ble_beacon_ids are repeated in the input or already registered"""
+
+    def __init__(self, duplicates, existing):
+        self.duplicates = sorted(duplicates)
+        self.existing = sorted(existing)
+        super().__init__(f'{len(self.duplicates) + len(self.existing)} ble_beacon_id conflicts')
+
+
+def registered_beacons(beacon_ids):
+    return list(Dispenser.objects.filter(ble_beacon_id__in=set(beacon_ids)).values_list('ble_beacon_id', flat=True))
+
+
+def provision_dispensers(entries, batch_size=BATCH_SIZE):
+    """Create dispensers and their empty rows with bulk INSERTs.
+
+    ``entries`` are validated dicts with ble_beacon_id, location_name and
+    gps_coordinates. Beacon ids are checked against the input and the
+    table in one query before anything is written, then dispensers and
+    rows are inserted ``batch_size`` at a time in a single transaction.
+    A beacon registered by a concurrent request in between fails the
+    unique constraint; that too rolls back and raises DuplicateBeaconError.
+    bulk_create skips Dispenser.save() and the post_save signals, so the
+    coordinates, spatial index and catalog version are handled here.
+    Returns the created dispensers.
+    """
+    beacon_ids = [entry['ble_beacon_id'] for entry in entries]
+    duplicates = [beacon_id for beacon_id, count in Counter(beacon_ids).items() if count > 1]
+    existing = registered_beacons(beacon_ids)
+    if duplicates or existing:
+        raise DuplicateBeaconError(duplicates, existing)
+
+    dispensers = []
+    for entry in entries:
+        latitude, longitude = parse_coordinates(entry['gps_coordinates'])
+        dispensers.append(Dispenser(
+            ble_beacon_id=entry['ble_beacon_id'],
+            location_name=entry['location_name'],
+            gps_coordinates=entry['gps_coordinates'],
+            latitude=latitude,
+            longitude=longitude,
+        ))
+
+    try:
+        with transaction.atomic():
+            Dispenser.objects.bulk_create(dispensers, batch_size=batch_size)
+            DispenserProduct.objects.bulk_create(
+                (row for dispenser in dispensers for row in DispenserProduct.empty_rows(dispenser)),
+                batch_size=batch_size,
+            )
+
+            def publish():
+                for dispenser in dispensers:
+                    dispenser_locator.update(dispenser.pk, dispenser.latitude, dispenser.longitude)
+                bump_catalog_version('dispensers')
+            transaction.on_commit(publish)
+    except IntegrityError:
+        existing = registered_beacons(beacon_ids)
+        if not existing:
+            raise
+        raise DuplicateBeaconError([], existing)
+
+    return dispensers
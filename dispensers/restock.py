@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils import timezone
+
+from products.catalog import bump_catalog_version
+from products.models import Product
+from .events import record_row_changes
+from .models import DispenserProduct
+
+
+def planogram_entries(planogram, dispenser_ids):
+    """Restock entries filling every row of ``dispenser_ids`` to the planogram's layout"""
+    layout = list(planogram.rows.all())
+    return [{
+        'dispenser_id': dispenser_id,
+        'row_number': row.row_number,
+        'product_id': row.product_id,
+        'max_capacity': row.max_capacity,
+        'current_inventory': row.max_capacity,
+    } for dispenser_id in dispenser_ids for row in layout]
+
+
+def apply_restock(entries):
+    """Set product, capacity and inventory of many dispenser rows at once.
+
+    Products and rows are each fetched with one query and every change is
+    written with a single bulk_update. Entries that cannot be applied
+    (unknown row, inactive product, a row repeated in the request) are
+    reported and skipped; the others are applied. Returns one result dict
+    per entry, in order.
+    """
+    product_ids = {entry['product_id'] for entry in entries if entry.get('product_id')}
+    products = Product.objects.filter(product_id__in=product_ids, is_active=True).in_bulk()
+    dispenser_ids = {entry['dispenser_id'] for entry in entries}
+    rows = {
+        (row.dispenser_id, row.row_number): row
+        for row in DispenserProduct.objects.filter(dispenser_id__in=dispenser_ids)
+    }
+
+    now = timezone.now()
+    results = []
+    changed = {}
+    for index, entry in enumerate(entries):
+        key = (entry['dispenser_id'], entry['row_number'])
+        result = {
+            'index': index,
+            'dispenser_id': str(entry['dispenser_id']),
+            'row_number': entry['row_number'],
+        }
+        results.append(result)
+
+        product_id = entry.get('product_id')
+        error = None
+        if key not in rows:
+            error = 'Dispenser row not found'
+        elif key in changed:
+            error = 'Row already changed by an earlier entry'
+        elif product_id and product_id not in products:
+            error = 'Product not found or inactive'
+        if error:
+            result.update(status='error', error=error)
+            continue
+
+        row = rows[key]
+        row.product = products[product_id] if product_id else None
+        row.max_capacity = entry['max_capacity']
+        row.current_inventory = entry.get('current_inventory', entry['max_capacity'])
+        row.compute_fill_ratio()
+        row.updated_at = now
+        changed[key] = row
+        result.update(
+            status='updated',
+            product_id=str(product_id) if product_id else None,
+            current_inventory=row.current_inventory,
+            max_capacity=row.max_capacity,
+        )
+
+    if changed:
+        with transaction.atomic():
+            DispenserProduct.objects.bulk_update(
+                changed.values(), ['product', 'current_inventory', 'max_capacity', 'fill_ratio', 'updated_at'],
+                batch_size=500,
+            )
+            record_row_changes(changed, 'restock')
+            transaction.on_commit(lambda: bump_catalog_version('dispensers'))
+    return results
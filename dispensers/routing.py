@@ -0,0 +1,190 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Min
+
+from .forecasting import forecast_stockouts, get_config as get_forecast_config
+from .geo import EARTH_RADIUS_KM
+from .models import Dispenser, DispenserProduct
+
+DEFAULTS = {
+    'URGENCY_WEIGHT': 1.0,  # km of detour worth reaching a fully urgent stop one km earlier
+    'MAX_STOPS': 1000,
+    'MAX_CREWS': 20,
+    'MAX_PASSES': 50,  # 2-opt sweeps over a route before giving up on convergence
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ROUTE_PLANNER', {})}
+
+
+def haversine_matrix(lats, lngs):
+    """Great-circle distances in km between every pair of points, shape (n, n)"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    dlat = lats[:, None] - lats[None, :]
+    dlng = lngs[:, None] - lngs[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lats)[:, None] * np.cos(lats)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def low_stock_stops(threshold):
+    """Dispensers with a stocked row below ``threshold``; urgency 1 for an empty row"""
+    rows = DispenserProduct.objects.filter(fill_ratio__lt=threshold, product__isnull=False) \
+        .values('dispenser_id').annotate(fill_ratio=Min('fill_ratio'), rows=Count('id')).order_by()
+    return {
+        row['dispenser_id']: {
+            'urgency': 1 - row['fill_ratio'] / threshold if threshold else 1.0,
+            'rows': row['rows'],
+        }
+        for row in rows
+    }
+
+
+def forecast_stops(horizon_hours):
+    """Dispensers with a row forecast to run out within ``horizon_hours``; urgency 1 when empty now"""
+    forecast = forecast_stockouts(horizon_hours=horizon_hours)
+    stops = {}
+    for row in forecast.results:
+        urgency = 1 - min(row['hours_to_empty'], horizon_hours) / horizon_hours
+        stop = stops.setdefault(row['dispenser_id'], {'urgency': urgency, 'rows': 0})
+        stop['urgency'] = max(stop['urgency'], urgency)
+        stop['rows'] += 1
+    return stops
+
+
+def _nearest_neighbour(distances, urgency, weight):
+    """Visit order of nodes 1..n-2 from node 0; each step prefers near and urgent stops"""
+    n = len(distances)
+    order = [0]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[0] = unvisited[n - 1] = False
+    current = 0
+    for _ in range(n - 2):
+        cost = distances[current] / (1 + weight * urgency)
+        # Ties (from an unset depot) go to the most urgent stop
+        cost = np.where(unvisited, cost - 1e-9 * urgency, np.inf)
+        current = int(np.argmin(cost))
+        order.append(current)
+        unvisited[current] = False
+    order.append(n - 1)
+    return np.array(order)
+
+
+def _two_opt(route, distances, urgency, weight, max_passes):
+    """Improve ``route`` in place with segment reversals.
+
+    The objective is the route length plus ``weight`` times each stop's
+    urgency multiplied by the distance travelled before reaching it, so
+    urgent stops are pulled forward. For a fixed segment start, the change
+    of every possible segment end is evaluated at once from prefix sums.
+    """
+    n = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 2):
+            legs = distances[route[:-1], route[1:]]
+            arrival = np.concatenate(([0.0], np.cumsum(legs)))
+            u = urgency[route]
+            u_prefix = np.concatenate(([0.0], np.cumsum(u)))
+            ut_prefix = np.concatenate(([0.0], np.cumsum(u * arrival)))
+
+            # Reverse route[i..j] for every j in i+1..n-2
+            j = np.arange(i + 1, n - 1)
+            a, first, last, b = route[i - 1], route[i], route[j], route[j + 1]
+            length_change = distances[a, last] + distances[first, b] - distances[a, first] - distances[last, b]
+            segment_urgency = u_prefix[j + 1] - u_prefix[i]
+            segment_ut = ut_prefix[j + 1] - ut_prefix[i]
+            # Inside the segment a stop is now reached at arrival[i-1] + d(a, last) + arrival[j] - arrival[k]
+            inside = (arrival[i - 1] + distances[a, last] + arrival[j]) * segment_urgency - 2 * segment_ut
+            after = length_change * (u_prefix[n] - u_prefix[j + 1])
+            change = length_change + weight * (inside + after)
+
+            best = int(np.argmin(change))
+            if change[best] < -1e-9:
+                route[i:j[best] + 1] = route[i:j[best] + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def _split_crews(lats, lngs, center, crews):
+    """Partition stops into ``crews`` contiguous angular sectors around ``center`` of near-equal size"""
+    angles = np.arctan2(np.asarray(lats) - center[0], (np.asarray(lngs) - center[1]) * np.cos(np.radians(center[0])))
+    order = np.argsort(angles)
+    if len(order) > 1:
+        # Start the sweep at the widest empty sector so no crew straddles it
+        gaps = np.diff(np.concatenate((angles[order], [angles[order[0]] + 2 * np.pi])))
+        order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    return [part for part in np.array_split(order, crews) if len(part)]
+
+
+def plan_routes(stops, crews=1, depot=None, urgency_weight=None, config=None):
+    """Order restock visits for ``crews`` crews.
+
+    ``stops`` are dicts with latitude, longitude and urgency (0..1). Stops
+    are split into angular sectors around the depot (or their centroid),
+    then each crew's route is built with an urgency-weighted nearest
+    neighbour pass and refined with 2-opt on a haversine distance matrix.
+    Routes start at ``depot`` (lat, lng) when given and are open-ended.
+    Returns one list of stops per crew with leg and cumulative distances.
+    """
+    config = config or get_config()
+    weight = config['URGENCY_WEIGHT'] if urgency_weight is None else urgency_weight
+    if not stops:
+        return []
+
+    lats = np.array([stop['latitude'] for stop in stops], dtype=np.float64)
+    lngs = np.array([stop['longitude'] for stop in stops], dtype=np.float64)
+    urgency = np.clip(np.array([stop['urgency'] for stop in stops], dtype=np.float64), 0.0, 1.0)
+    center = depot or (float(lats.mean()), float(lngs.mean()))
+
+    routes = []
+    for members in _split_crews(lats, lngs, center, min(crews, len(stops))):
+        # Node 0 is the start (the depot, or a free start when there is none),
+        # nodes 1..n are the stops and node n+1 a free end, so routes are open
+        n = len(members)
+        distances = np.zeros((n + 2, n + 2))
+        if depot:
+            distances[:n + 1, :n + 1] = haversine_matrix(np.concatenate(([depot[0]], lats[members])),
+                                                         np.concatenate(([depot[1]], lngs[members])))
+        else:
+            distances[1:n + 1, 1:n + 1] = haversine_matrix(lats[members], lngs[members])
+        node_urgency = np.concatenate(([0.0], urgency[members], [0.0]))
+
+        route = _nearest_neighbour(distances, node_urgency, weight)
+        route = _two_opt(route, distances, node_urgency, weight, config['MAX_PASSES'])
+
+        visits = []
+        cumulative = 0.0
+        previous = route[0]
+        for node in route[1:-1]:
+            leg = float(distances[previous, node])
+            cumulative += leg
+            visits.append({**stops[members[node - 1]], 'leg_km': round(leg, 3),
+                           'cumulative_km': round(cumulative, 3)})
+            previous = node
+        routes.append(visits)
+    return routes
+
+
+def restock_stops(source='low_stock', threshold=0.25, horizon_hours=None):
+    """Stops for dispensers needing a visit, most urgent first.
+
+    ``source`` is ``low_stock`` (rows under ``threshold``) or ``forecast``
+    (rows running out within ``horizon_hours``). Returns (stops, skipped)
+    where skipped counts dispensers without usable coordinates.
+    """
+    if source == 'forecast':
+        needs = forecast_stops(horizon_hours or get_forecast_config()['HORIZON_HOURS'])
+    else:
+        needs = low_stock_stops(threshold)
+
+    dispensers = Dispenser.objects.filter(dispenser_id__in=list(needs), latitude__isnull=False,
+                                          longitude__isnull=False) \
+        .values('dispenser_id', 'location_name', 'latitude', 'longitude')
+    stops = [{**dispenser, 'urgency': round(needs[dispenser['dispenser_id']]['urgency'], 3),
+              'rows': needs[dispenser['dispenser_id']]['rows']} for dispenser in dispensers]
+    stops.sort(key=lambda stop: -stop['urgency'])
+    return stops, len(needs) - len(stops)
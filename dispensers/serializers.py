@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Dispenser, DispenserProduct
+from .geo import parse_coordinates
+from .models import ROWS_PER_DISPENSER, Dispenser, DispenserProduct
 from products.serializers import ProductSerializer
 
 class DispenserProductSerializer(serializers.ModelSerializer):
@@ -19,4 +20,90 @@ class DispenserSerializer(serializers.ModelSerializer):
         model = Dispenser
         fields = ['dispenser_id', 'ble_beacon_id', 'location_name', 'gps_coordinates',
                   'install_date', 'created_at', 'rows']
-        read_only_fields = ['dispenser_id', 'install_date', 'created_at', 'rows']
\ No newline at end of file
+        read_only_fields = ['dispenser_id', 'install_date', 'created_at', 'rows']
+
+class DispenserSummarySerializer(serializers.ModelSerializer):
+    """Dispenser identity and location only, without the nested rows"""
+
+    class Meta:
+        model = Dispenser
+        fields = ['dispenser_id', 'location_name', 'gps_coordinates']
+        read_only_fields = fields
+
+class DispenserProvisionSerializer(serializers.Serializer):
+    """One dispenser of a bulk provisioning request; beacon uniqueness is checked in bulk"""
+    ble_beacon_id = serializers.CharField(max_length=100)
+    location_name = serializers.CharField(max_length=200)
+    gps_coordinates = serializers.JSONField()
+
+    def validate_gps_coordinates(self, value):
+        lat, lng = parse_coordinates(value)
+        if lat is None:
+            raise serializers.ValidationError('Expected {"lat": <-90..90>, "lng": <-180..180>}')
+        return {'lat': lat, 'lng': lng}
+
+class BulkDispenserSerializer(serializers.Serializer):
+    dispensers = DispenserProvisionSerializer(many=True, allow_empty=False, max_length=5000)
+
+class RestockEntrySerializer(serializers.Serializer):
+    dispenser_id = serializers.UUIDField()
+    row_number = serializers.IntegerField(min_value=1, max_value=ROWS_PER_DISPENSER)
+    product_id = serializers.UUIDField(required=False, allow_null=True)
+    max_capacity = serializers.IntegerField(min_value=0)
+    current_inventory = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data.get('current_inventory', 0) > data['max_capacity']:
+            raise serializers.ValidationError('current_inventory cannot exceed max_capacity')
+        return data
+
+class BulkRestockSerializer(serializers.Serializer):
+    """Either explicit ``entries`` or a ``planogram`` name applied to ``dispenser_ids``"""
+    entries = RestockEntrySerializer(many=True, required=False, allow_empty=False, max_length=2000)
+    planogram = serializers.CharField(required=False, max_length=100)
+    dispenser_ids = serializers.ListField(child=serializers.UUIDField(), required=False,
+                                          allow_empty=False, max_length=500)
+
+    def validate(self, data):
+        if 'entries' in data:
+            if 'planogram' in data or 'dispenser_ids' in data:
+                raise serializers.ValidationError('Send either entries or planogram with dispenser_ids, not both')
+        elif 'planogram' not in data or 'dispenser_ids' not in data:
+            raise serializers.ValidationError('Send entries, or planogram with dispenser_ids')
+        return data
+
+class LowStockRowSerializer(serializers.ModelSerializer):
+    dispenser = DispenserSummarySerializer(read_only=True)
+    product_name = serializers.CharField(source='product.product_name', read_only=True, default=None)
+
+    class Meta:
+        model = DispenserProduct
+        fields = ['id', 'dispenser', 'row_number', 'product_id', 'product_name',
+                  'current_inventory', 'max_capacity', 'fill_ratio', 'updated_at']
+        read_only_fields = fields
+
+class StockoutForecastSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    dispenser_id = serializers.UUIDField()
+    row_number = serializers.IntegerField()
+    product_id = serializers.UUIDField()
+    current_inventory = serializers.IntegerField()
+    max_capacity = serializers.IntegerField()
+    units_per_day = serializers.FloatField()
+    hours_to_empty = serializers.FloatField(allow_null=True)
+    stockout_at = serializers.DateTimeField(allow_null=True)
+
+class RouteStopSerializer(serializers.Serializer):
+    dispenser_id = serializers.UUIDField()
+    location_name = serializers.CharField()
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+    urgency = serializers.FloatField()
+    rows = serializers.IntegerField()
+    leg_km = serializers.FloatField()
+    cumulative_km = serializers.FloatField()
+
+class RestockRouteSerializer(serializers.Serializer):
+    crew = serializers.IntegerField()
+    distance_km = serializers.FloatField()
+    stops = RouteStopSerializer(many=True)
@@ -1,15 +1,32 @@
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .events import record_row_changes
+from .geo import dispenser_locator
 from .models import Dispenser, DispenserProduct
 
 @receiver(post_save, sender=Dispenser)
 def create_dispenser_rows(sender, instance, created, **kwargs):
-    """Create 4 empty rows when a new dispenser is created"""
+    """Create the empty rows of a new dispenser in one INSERT"""
     if created:
-        for row_number in range(1, 5):
-            DispenserProduct.objects.create(
-                dispenser=instance,
-                row_number=row_number,
-                current_inventory=0,
-                max_capacity=0
-            )
\ No newline at end of file
+        DispenserProduct.objects.bulk_create(DispenserProduct.empty_rows(instance))
+
+@receiver(post_save, sender=Dispenser)
+def update_dispenser_location(sender, instance, **kwargs):
+    """Keep the in-memory spatial index in step with committed coordinates
+
+    The values are bound at save time: the instance may change again before
+    the commit, and a rolled-back save never reaches the index.
+    """
+    transaction.on_commit(partial(dispenser_locator.update, instance.pk, instance.latitude, instance.longitude))
+
+@receiver(post_delete, sender=Dispenser)
+def remove_dispenser_location(sender, instance, **kwargs):
+    transaction.on_commit(partial(dispenser_locator.remove, instance.pk))
+
+@receiver(post_save, sender=DispenserProduct)
+def record_row_change(sender, instance, **kwargs):
+    """Feed the saved row to the inventory streams, in the saving transaction"""
+    record_row_changes([(instance.dispenser_id, instance.row_number)], 'update')
@@ -1,3 +1,556 @@
-from django.test import TestCase
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import AsyncClient
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from logs.testing import AuditLogTestMixin
+from products.models import Product
+from transactions.models import Transaction
+from transactions.services import purchase
+from users.models import User, Wallet
+from users.views import AuthViewSet
+from . import provisioning
+from .events import InventoryEventBus, inventory_events
+from .forecasting import HOURS_PER_WEEK, forecast_stockouts, hourly_rates, hours_to_empty
+from .geo import SpatialIndex, dispenser_locator, haversine_km
+from .models import Dispenser, DispenserProduct, InventoryEvent, Planogram, PlanogramRow
+from .restock import apply_restock
+from .routing import _split_crews, _two_opt, plan_routes
+
+
+def create_dispenser(index=0):
+    return Dispenser.objects.create(
+        ble_beacon_id=f'beacon-{index}',
+        location_name=f'Location {index}',
+        gps_coordinates={'lat': 24.7, 'lng': 46.6},
+    )
+
+
+class SpatialIndexTests(SimpleTestCase):
+    def test_points_are_bucketed_by_cell(self):
+        index = SpatialIndex(cell_size=1.0)
+        index.add('a', 0.5, 0.5)
+        index.add('b', 1.5, -0.5)
+        index.add('c', 0.9, 0.1)
+        self.assertEqual({cell: set(bucket) for cell, bucket in index._cells.items()},
+                         {(0, 0): {'a', 'c'}, (1, -1): {'b'}})
+        # Moving a point leaves its old cell, and empty cells are dropped
+        index.add('b', 0.2, 0.2)
+        index.remove('a')
+        self.assertEqual({cell: set(bucket) for cell, bucket in index._cells.items()}, {(0, 0): {'b', 'c'}})
+        self.assertEqual(len(index), 2)
+
+    def test_radius_cutoff(self):
+        index = SpatialIndex()
+        # About 1 km apart along a parallel
+        for k in range(6):
+            index.add(k, 24.7, 46.6 + 0.01 * k)
+        matches = index.nearest(24.7, 46.6, radius_km=2.5)
+        self.assertEqual([key for _, key in matches], [0, 1, 2])
+        self.assertTrue(all(distance <= 2.5 for distance, _ in matches))
+        self.assertEqual(index.nearest(24.7, 46.6, radius_km=2.5, limit=2), matches[:2])
+
+    def test_nearest_matches_a_full_scan(self):
+        rng = np.random.default_rng(5)
+        index = SpatialIndex()
+        points = {key: (24.5 + rng.random(), 46.5 + rng.random()) for key in range(300)}
+        for key, (lat, lng) in points.items():
+            index.add(key, lat, lng)
+        scan = sorted((haversine_km(24.9, 46.9, lat, lng), key) for key, (lat, lng) in points.items())
+
+        self.assertEqual(index.nearest(24.9, 46.9, limit=10), scan[:10])
+        self.assertEqual(index.nearest(24.9, 46.9, radius_km=20), [match for match in scan if match[0] <= 20])
+
+
+class NearbyTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        dispenser_locator.clear()
+        self.addCleanup(dispenser_locator.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001'))
+        # 0, ~1, ~2 and ~3 km east of the query point
+        self.dispensers = [
+            Dispenser.objects.create(ble_beacon_id=f'beacon-{k}', location_name=f'Location {k}',
+                                     gps_coordinates={'lat': 24.7, 'lng': 46.6 + 0.01 * k})
+            for k in (2, 0, 3, 1)
+        ]
+
+    def _nearby(self, query=''):
+        return self.client.get(f'/api/dispensers/nearby/?lat=24.7&lng=46.6{query}')
+
+    def _names(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['location_name'] for item in response.data]
+
+    def test_closest_first_within_radius_and_limit(self):
+        response = self._nearby()
+        self.assertEqual(self._names(response), ['Location 0', 'Location 1', 'Location 2', 'Location 3'])
+        self.assertEqual([item['distance_km'] for item in response.data], sorted(
+            item['distance_km'] for item in response.data))
+        self.assertEqual(self._names(self._nearby('&radius=2.5')), ['Location 0', 'Location 1', 'Location 2'])
+        self.assertEqual(self._names(self._nearby('&limit=2')), ['Location 0', 'Location 1'])
+
+    def test_invalid_radius_is_rejected(self):
+        for radius in ('inf', '-inf', 'nan', '1e308', '0', '-1', '1001', 'abc'):
+            self.assertEqual(self._nearby(f'&radius={radius}').status_code, 400, radius)
+
+    async def test_invalid_radius_is_rejected_by_the_async_route(self):
+        user = await User.objects.aget(phone_number='+966500000001')
+        headers = {'Authorization': f'Bearer {AuthViewSet()._generate_token(user)}'}
+        for radius in ('inf', 'nan'):
+            response = await AsyncClient().get(f'/api/async/dispensers/nearby/?lat=24.7&lng=46.6&radius={radius}',
+                                               headers=headers)
+            self.assertEqual(response.status_code, 400, radius)
+
+    def _indexed(self):
+        return [pk for _, pk in dispenser_locator.nearest(24.7, 46.6)]
+
+    def test_index_follows_saves_and_deletes(self):
+        indexed = self._indexed()
+        farthest = self.dispensers[2]
+        farthest.gps_coordinates = {'lat': 24.7, 'lng': 46.595}
+        with self.captureOnCommitCallbacks(execute=True):
+            farthest.save()
+            self.dispensers[1].delete()
+            # Not before the commit
+            self.assertEqual(self._indexed(), indexed)
+        self.assertEqual(self._names(self._nearby()), ['Location 3', 'Location 1', 'Location 2'])
+
+    def test_rolled_back_saves_leave_the_index_alone(self):
+        indexed = self._indexed()
+        farthest = self.dispensers[2]
+        farthest.gps_coordinates = {'lat': 24.7, 'lng': 46.595}
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                farthest.save()
+                self.dispensers[1].delete()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self._indexed(), indexed)
+
+
+class LowStockTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        dispenser_locator.clear()
+        self.addCleanup(dispenser_locator.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001',
+                                                                user_type=User.UserType.MAINTENANCE))
+        self.napkins = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.wipes = Product.objects.create(product_name='Wipes', credit_cost=1)
+        near = Dispenser.objects.create(ble_beacon_id='near', location_name='Near',
+                                        gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        far = Dispenser.objects.create(ble_beacon_id='far', location_name='Far',
+                                       gps_coordinates={'lat': 25.7, 'lng': 46.6})
+        for dispenser, row_number, product, inventory in ((near, 1, self.napkins, 1), (near, 2, self.wipes, 5),
+                                                          (far, 1, self.napkins, 2)):
+            row = DispenserProduct.objects.get(dispenser=dispenser, row_number=row_number)
+            row.product, row.current_inventory, row.max_capacity = product, inventory, 10
+            row.save()
+
+    def _rows(self, query=''):
+        response = self.client.get(f'/api/dispensers/low_stock/?{query}')
+        self.assertEqual(response.status_code, 200, query)
+        return [(row['dispenser']['location_name'], row['row_number'], row['fill_ratio'])
+                for row in response.data['results']]
+
+    def test_threshold_emptiest_first(self):
+        # Unstocked rows have no fill ratio and are never listed
+        self.assertEqual(self._rows(), [('Near', 1, 0.1), ('Far', 1, 0.2)])
+        self.assertEqual(self._rows('threshold=0.6'), [('Near', 1, 0.1), ('Far', 1, 0.2), ('Near', 2, 0.5)])
+        self.assertEqual(self._rows('threshold=0'), [])
+
+    def test_product_and_area_filters(self):
+        self.assertEqual(self._rows(f'threshold=0.6&product_id={self.wipes.product_id}'), [('Near', 2, 0.5)])
+        self.assertEqual(self._rows('lat=24.7&lng=46.6&radius=10'), [('Near', 1, 0.1)])
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('threshold=2', 'threshold=nan', 'product_id=abc', 'lat=24.7&lng=46.6&radius=inf',
+                      'lat=24.7&lng=46.6&radius=nan', 'lat=24.7&lng=46.6', 'radius=5'):
+            self.assertEqual(self.client.get(f'/api/dispensers/low_stock/?{query}').status_code, 400, query)
+
+
+class ProvisioningTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001', user_type='admin'))
+        create_dispenser()
+
+    def _provision(self, *beacon_ids):
+        return self.client.post('/api/dispensers/bulk_create/', {'dispensers': [
+            {'ble_beacon_id': beacon_id, 'location_name': 'Lobby', 'gps_coordinates': {'lat': 24.7, 'lng': 46.6}}
+            for beacon_id in beacon_ids
+        ]}, format='json')
+
+    def test_creates_dispensers_with_their_rows(self):
+        response = self._provision('beacon-1', 'beacon-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(DispenserProduct.objects.filter(dispenser__ble_beacon_id='beacon-2').count(), 4)
+
+    def test_duplicate_beacons_are_refused(self):
+        response = self._provision('beacon-0', 'beacon-1', 'beacon-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['duplicates'], ['beacon-1'])
+        self.assertEqual(response.data['existing'], ['beacon-0'])
+        self.assertEqual(Dispenser.objects.count(), 1)
+
+    def test_beacon_registered_after_the_check_is_refused(self):
+        registered_beacons = provisioning.registered_beacons
+        checks = []
+
+        def registered_concurrently(beacon_ids):
+            # The first check runs before the other request commits
+            checks.append(beacon_ids)
+            return registered_beacons(beacon_ids) if len(checks) > 1 else []
+
+        with mock.patch.object(provisioning, 'registered_beacons', side_effect=registered_concurrently):
+            response = self._provision('beacon-1', 'beacon-0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['existing'], ['beacon-0'])
+        self.assertEqual(Dispenser.objects.count(), 1)
+
+
+class ForecastingTests(TestCase):
+    def test_sparse_rows_borrow_the_fleet_profile(self):
+        counts = np.zeros((2, HOURS_PER_WEEK))
+        counts[0, 0] = 4
+        counts[1, [0, 1]] = 2
+        rates = hourly_rates(counts, weeks=2, shrinkage=4)
+        # Half its own profile (2/h in slot 0), half its mean rate shaped like the fleet
+        fleet_shape = np.zeros(HOURS_PER_WEEK)
+        fleet_shape[[0, 1]] = [6 * HOURS_PER_WEEK / 8, 2 * HOURS_PER_WEEK / 8]
+        expected = 0.5 * counts / 2 + 0.5 * (4 / (2 * HOURS_PER_WEEK)) * fleet_shape
+        np.testing.assert_allclose(rates, expected)
+        self.assertAlmostEqual(rates[0].sum(), 2.0)
+
+    def test_hours_to_empty(self):
+        rates = np.full((4, HOURS_PER_WEEK), 2.0)
+        hours = hours_to_empty(np.array([3.0, 0.5, 0.0, 1000.0]), rates, start_slot=0,
+                               first_hour_fraction=0.5, horizon_hours=24)
+        # Half an hour sells 1 unit, then 2 an hour; 1000 units outlast the horizon
+        np.testing.assert_allclose(hours[:3], [1.5, 0.25, 0.0])
+        self.assertTrue(np.isnan(hours[3]))
+
+    def test_forecast_from_recorded_sales(self):
+        now = timezone.make_aware(datetime(2024, 3, 6, 12))
+        product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        dispenser = create_dispenser()
+        DispenserProduct.objects.filter(dispenser=dispenser, row_number=1).update(
+            product=product, current_inventory=7, max_capacity=10)
+        customer = User.objects.create_user(phone_number='+966500000001')
+        # One unit every hour of the last week
+        sales = Transaction.objects.bulk_create([
+            Transaction(user=customer, dispenser=dispenser, product=product, row_number=1, credits_used=1)
+            for _ in range(HOURS_PER_WEEK)
+        ])
+        for hours_ago, sale in enumerate(sales, start=1):
+            sale.timestamp = now - timedelta(hours=hours_ago)
+        Transaction.objects.bulk_update(sales, ['timestamp'])
+
+        forecast = forecast_stockouts(history_days=28, horizon_hours=48, now=now)
+        self.assertEqual(forecast.rows, 1)
+        # 168 units over 4 weeks is a flat 0.25 an hour, so 7 units last 28 hours
+        [row] = forecast.results
+        self.assertEqual(row['units_per_day'], 6.0)
+        self.assertEqual(row['hours_to_empty'], 28.0)
+        self.assertEqual(row['stockout_at'], now + timedelta(hours=28))
+
+        self.assertEqual(forecast_stockouts(history_days=28, horizon_hours=24, now=now).results, [])
+
+    def test_forecast_endpoint_validates_its_parameters(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(phone_number='+966500000001', user_type='admin'))
+        dispenser = create_dispenser()
+        self.assertEqual(client.get(f'/api/dispensers/forecast/?dispenser_id={dispenser.dispenser_id}').status_code,
+                         200)
+        for query in ('dispenser_id=abc', 'horizon_hours=0', 'limit=x'):
+            self.assertEqual(client.get(f'/api/dispensers/forecast/?{query}').status_code, 400, query)
+
+
+def line_distances(positions):
+    """Distance matrix of points on a line, plus a free end node at zero distance from all"""
+    points = np.asarray(positions, dtype=np.float64)
+    distances = np.zeros((len(points) + 1, len(points) + 1))
+    distances[:-1, :-1] = np.abs(points[:, None] - points[None, :])
+    return distances
+
+
+def route_cost(route, distances, urgency, weight):
+    """Route length plus weight x urgency x arrival distance, computed stop by stop"""
+    arrival = np.concatenate(([0.0], np.cumsum(distances[route[:-1], route[1:]])))
+    return arrival[-1] + weight * float(np.sum(urgency[route] * arrival))
+
+
+class RoutingTests(SimpleTestCase):
+    def test_two_opt_untangles_a_route(self):
+        # Depot at 0, stops at 1..4 on a line
+        distances = line_distances([0, 1, 2, 3, 4])
+        urgency = np.zeros(6)
+        route = _two_opt(np.array([0, 3, 1, 4, 2, 5]), distances, urgency, 0.0, max_passes=50)
+        self.assertEqual(route.tolist(), [0, 1, 2, 3, 4, 5])
+
+    def test_two_opt_pulls_urgent_stops_forward(self):
+        # A is 1 km behind the depot, B 2 km ahead and urgent: B first costs 1 km more
+        distances = line_distances([0, -1, 2])
+        urgency = np.array([0.0, 0.0, 1.0, 0.0])
+        self.assertEqual(_two_opt(np.array([0, 1, 2, 3]), distances, urgency, 0.0, 50).tolist(), [0, 1, 2, 3])
+        # ...but reaches B 2 km earlier, worth 2 km at weight 1
+        self.assertEqual(_two_opt(np.array([0, 1, 2, 3]), distances, urgency, 1.0, 50).tolist(), [0, 2, 1, 3])
+
+    def test_two_opt_ends_at_a_local_optimum(self):
+        rng = np.random.default_rng(3)
+        points = rng.random((9, 2))
+        distances = np.zeros((10, 10))
+        distances[:9, :9] = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+        urgency = np.concatenate(([0.0], rng.random(8), [0.0]))
+        route = _two_opt(np.arange(10), distances, urgency, 0.5, max_passes=50)
+
+        cost = route_cost(route, distances, urgency, 0.5)
+        for i in range(1, 8):
+            for j in range(i + 1, 9):
+                reversed_route = route.copy()
+                reversed_route[i:j + 1] = route[i:j + 1][::-1]
+                self.assertGreaterEqual(route_cost(reversed_route, distances, urgency, 0.5), cost - 1e-9)
+
+    def test_split_crews_into_contiguous_sectors(self):
+        # Two clusters of bearings around the centre, 80 and 240 degrees apart
+        angles = np.radians([200, 100, 210, 120, 220, 110])
+        crews = _split_crews(np.sin(angles), np.cos(angles), (0.0, 0.0), 2)
+        self.assertEqual(sorted(sorted(crew.tolist()) for crew in crews), [[0, 2, 4], [1, 3, 5]])
+        # More crews than stops leaves no crew empty
+        self.assertEqual(len(_split_crews(np.sin(angles[:2]), np.cos(angles[:2]), (0.0, 0.0), 5)), 2)
+
+    def test_plan_routes_reports_leg_distances(self):
+        stops = [{'location_name': name, 'latitude': 24.7, 'longitude': 46.6 + 0.01 * i, 'urgency': 0.5}
+                 for name, i in (('far', 2), ('depot', 0), ('near', 1))]
+        [route] = plan_routes(stops, crews=1, depot=(24.7, 46.6), urgency_weight=0)
+        self.assertEqual([stop['location_name'] for stop in route], ['depot', 'near', 'far'])
+        self.assertEqual(route[0]['leg_km'], 0.0)
+        self.assertAlmostEqual(route[-1]['cumulative_km'], sum(stop['leg_km'] for stop in route), places=2)
+
+
+
+class RestockRouteEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001',
+                                                                user_type=User.UserType.MAINTENANCE))
+
+    def test_valid_parameters_plan_routes(self):
+        response = self.client.get('/api/dispensers/restock_routes/?urgency_weight=0.5&depot_lat=24.7&depot_lng=46.6')
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_finite_parameters_are_rejected(self):
+        for query in ('urgency_weight=inf', 'urgency_weight=nan', 'urgency_weight=-1',
+                      'depot_lat=nan&depot_lng=46.6', 'depot_lat=24.7&depot_lng=inf',
+                      'depot_lat=-inf&depot_lng=46.6', 'depot_lat=24.7'):
+            self.assertEqual(self.client.get(f'/api/dispensers/restock_routes/?{query}').status_code, 400, query)
+
+
+class BulkRestockTests(AuditLogTestMixin, TestCase):
+    url = '/api/dispensers/bulk_restock/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001',
+                                                                user_type=User.UserType.MAINTENANCE))
+        self.napkins = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.retired = Product.objects.create(product_name='Retired', credit_cost=1, is_active=False)
+        self.dispensers = [create_dispenser(i) for i in range(3)]
+
+    def _row(self, dispenser, row_number):
+        return DispenserProduct.objects.get(dispenser=dispenser, row_number=row_number)
+
+    def test_mixed_batch_applies_valid_entries_and_reports_each(self):
+        dispenser = self.dispensers[0]
+        entries = [
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 1, 'product_id': self.napkins.product_id,
+             'max_capacity': 10, 'current_inventory': 4},
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 2, 'product_id': self.retired.product_id,
+             'max_capacity': 10},
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 1, 'max_capacity': 5},
+            {'dispenser_id': uuid.uuid4(), 'row_number': 1, 'max_capacity': 5},
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 3, 'max_capacity': 6},
+        ]
+        response = self.client.post(self.url, {'entries': entries}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['failed']), (2, 3))
+        results = [(result['index'], result['status'], result.get('error')) for result in response.data['results']]
+        self.assertEqual(results, [
+            (0, 'updated', None),
+            (1, 'error', 'Product not found or inactive'),
+            (2, 'error', 'Row already changed by an earlier entry'),
+            (3, 'error', 'Dispenser row not found'),
+            (4, 'updated', None),
+        ])
+
+        first = self._row(dispenser, 1)
+        self.assertEqual((first.product_id, first.current_inventory, first.max_capacity),
+                         (self.napkins.product_id, 4, 10))
+        self.assertEqual(first.fill_ratio, 0.4)
+        self.assertEqual(self._row(dispenser, 2).product_id, None)
+
+    def test_inventory_is_bounded_by_capacity(self):
+        dispenser = self.dispensers[0]
+        # Omitted inventory fills the row to its capacity
+        response = self.client.post(self.url, {'entries': [
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 1, 'product_id': self.napkins.product_id,
+             'max_capacity': 12},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['current_inventory'], 12)
+        self.assertEqual(self._row(dispenser, 1).fill_ratio, 1.0)
+
+        response = self.client.post(self.url, {'entries': [
+            {'dispenser_id': dispenser.dispenser_id, 'row_number': 2, 'max_capacity': 5, 'current_inventory': 6},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._row(dispenser, 2).max_capacity, 0)
+
+    def test_nothing_applied_is_a_bad_request(self):
+        response = self.client.post(self.url, {'entries': [
+            {'dispenser_id': uuid.uuid4(), 'row_number': 1, 'max_capacity': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 1)
+
+    def test_planogram_is_applied_to_every_dispenser(self):
+        planogram = Planogram.objects.create(name='Lobby')
+        PlanogramRow.objects.create(planogram=planogram, row_number=1, product=self.napkins, max_capacity=20)
+        PlanogramRow.objects.create(planogram=planogram, row_number=2, max_capacity=0)
+        targets = self.dispensers[:2]
+
+        response = self.client.post(self.url, {'planogram': 'Lobby',
+                                               'dispenser_ids': [d.dispenser_id for d in targets]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['failed']), (4, 0))
+        for dispenser in targets:
+            self.assertEqual((self._row(dispenser, 1).product_id, self._row(dispenser, 1).current_inventory),
+                             (self.napkins.product_id, 20))
+            self.assertIsNone(self._row(dispenser, 2).product_id)
+        self.assertIsNone(self._row(self.dispensers[2], 1).product_id)
+
+        response = self.client.post(self.url, {'planogram': 'Missing',
+                                               'dispenser_ids': [targets[0].dispenser_id]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(self.url, {'planogram': 'Lobby'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+class InventoryEventTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.dispenser = create_dispenser()
+        self.row = DispenserProduct.objects.get(dispenser=self.dispenser, row_number=1)
+        self.row.product = self.product
+        self.row.current_inventory = self.row.max_capacity = 10
+        self.row.save()
+        self.bus = InventoryEventBus()
+
+    def _events(self, cursor=0):
+        return [(event_id, payload) for event_id, payload in self.bus.since(cursor)]
+
+    def test_save_purchase_and_restock_record_events(self):
+        customer = User.objects.create_user(phone_number='+966500000001')
+        Wallet.objects.create(user=customer, balance=5)
+        purchase(customer, self.dispenser.dispenser_id, 1, self.product.product_id)
+        apply_restock([{'dispenser_id': self.dispenser.dispenser_id, 'row_number': 2,
+                        'product_id': self.product.product_id, 'max_capacity': 8}])
+
+        self.assertEqual(self.bus.poll(), 3)
+        payloads = [payload for _, payload in self._events()]
+        self.assertEqual([payload['reason'] for payload in payloads], ['update', 'purchase', 'restock'])
+        # Events carry the row's state when they are read
+        self.assertEqual(payloads[1]['current_inventory'], 9)
+        self.assertEqual(payloads[1]['fill_ratio'], 0.9)
+        self.assertEqual(payloads[2]['row_number'], 2)
+        self.assertEqual(payloads[2]['current_inventory'], 8)
+
+    def test_since_resumes_after_the_cursor(self):
+        for inventory in (9, 8, 7):
+            DispenserProduct.objects.filter(pk=self.row.pk).update(current_inventory=inventory)
+            self.row.refresh_from_db()
+            self.row.save()
+        self.bus.poll()
+        ids = [event_id for event_id, _ in self._events()]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual([event_id for event_id, _ in self._events(ids[1])], ids[2:])
+        self.assertEqual(self._events(ids[-1]), [])
+
+    @override_settings(INVENTORY_STREAM={'BUFFER_SIZE': 2})
+    def test_since_asks_for_a_reset_once_events_left_the_buffer(self):
+        first = InventoryEvent.objects.get().id
+        self.bus.poll()
+        self.row.save()
+        self.row.save()
+        self.assertEqual(self.bus.poll(), 2)
+
+        self.assertIsNone(self.bus.since(first - 1))
+        self.assertIsNone(self.bus.since(0))
+        self.assertEqual(len(self.bus.since(first)), 2)
+
+    def test_deleted_dispensers_send_no_state(self):
+        other = create_dispenser(1)
+        DispenserProduct.objects.get(dispenser=other, row_number=1).save()
+        other.delete()
+        self.row.save()
+        self.bus.poll()
+        self.assertEqual([payload['dispenser_id'] for _, payload in self._events()],
+                         [str(self.dispenser.dispenser_id)] * 2)
+
+
+class InventoryStreamWSGITests(AuditLogTestMixin, TestCase):
+    def test_refused_outside_asgi(self):
+        user = User.objects.create_user(phone_number='+966500000001')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AuthViewSet()._generate_token(user)}')
+        response = client.get('/api/async/dispensers/stream/')
+        self.assertEqual(response.status_code, 501)
+
+
+@override_settings(INVENTORY_STREAM={'MAX_DURATION': 1, 'POLL_INTERVAL': 0.05})
+class InventoryStreamTests(AuditLogTestMixin, TransactionTestCase):
+    """The events table is read by the bus's own thread, so the data has to be committed"""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(inventory_events.stop)
+        user = User.objects.create_user(phone_number='+966500000001')
+        self.headers = {'Authorization': f'Bearer {AuthViewSet()._generate_token(user)}'}
+        self.dispenser = create_dispenser()
+        self.other = create_dispenser(1)
+        for dispenser in (self.dispenser, self.other):
+            DispenserProduct.objects.get(dispenser=dispenser, row_number=1).save()
+
+    async def _stream(self, path, **headers):
+        response = await AsyncClient().get(path, headers={**self.headers, **headers})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_resume_filtered_by_dispenser(self):
+        body = await self._stream(f'/api/async/dispensers/stream/?dispensers={self.dispenser.dispenser_id}',
+                                  **{'Last-Event-ID': '0'})
+        self.assertTrue(body.startswith('retry: '))
+        self.assertEqual(body.count('event: inventory'), 1)
+        self.assertIn(str(self.dispenser.dispenser_id), body)
+        self.assertNotIn(str(self.other.dispenser_id), body)
+
+    async def test_unknown_event_id_resets(self):
+        body = await self._stream('/api/async/dispensers/stream/', **{'Last-Event-ID': 'stale'})
+        self.assertIn('event: reset', body)
+        self.assertNotIn('event: inventory', body)
+
+    async def test_invalid_dispenser_filter(self):
+        response = await AsyncClient().get('/api/async/dispensers/stream/?dispensers=abc', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
@@ -1,40 +1,275 @@
+import math
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from .models import Dispenser, DispenserProduct
-from .serializers import DispenserSerializer, DispenserProductSerializer
+from .forecasting import forecast_stockouts, get_config as get_forecast_config
+from .geo import dispenser_locator, get_config as get_geo_config, parse_radius
+from .models import Dispenser, DispenserProduct, Planogram
+from .provisioning import DuplicateBeaconError, provision_dispensers
+from .restock import apply_restock, planogram_entries
+from .routing import get_config as get_route_config, plan_routes, restock_stops
+from .serializers import (BulkDispenserSerializer, BulkRestockSerializer, DispenserProductSerializer,
+                          DispenserSerializer, DispenserSummarySerializer, LowStockRowSerializer,
+                          RestockRouteSerializer, StockoutForecastSerializer)
 from users.permissions import IsAdmin, IsAdminOrMaintenance
-from logs.models import Log
+from logs.services import audit_log
+from products.catalog import catalog_cached
 from products.models import Product
+from napkin_dispenser.pagination import FillRatioCursorPagination
+from napkin_dispenser.query_params import parse_uuid_param
+
+def live_inventory(data):
+    """Copy of cached dispenser data with current_inventory read fresh, plus a token of it.
+
+    Sales change inventory far too often to be part of the catalog version,
+    so the cached responses keep the rest and this fills in inventory with
+    one primary-key lookup of the rows shown.
+    """
+    dispensers = data['results'] if 'results' in data else [data]
+    row_ids = [row['id'] for dispenser in dispensers for row in dispenser['rows']]
+    inventory = {
+        str(row_id): current_inventory
+        for row_id, current_inventory in DispenserProduct.objects.filter(id__in=row_ids)
+        .values_list('id', 'current_inventory')
+    }
+
+    def fresh(dispenser):
+        rows = [{**row, 'current_inventory': inventory.get(row['id'], row['current_inventory'])}
+                for row in dispenser['rows']]
+        return {**dispenser, 'rows': rows}
+
+    token = ','.join(f'{row_id}={inventory.get(row_id)}' for row_id in row_ids)
+    if 'results' in data:
+        return {**data, 'results': [fresh(dispenser) for dispenser in dispensers]}, token
+    return fresh(data), token
+
 
 class DispenserViewSet(viewsets.ModelViewSet):
     queryset = Dispenser.objects.all().prefetch_related('rows', 'rows__product')
     serializer_class = DispenserSerializer
     permission_classes = [IsAuthenticated]
+    LOW_STOCK_THRESHOLD = 0.25
     
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'bulk_create', 'update', 'partial_update', 'destroy']:
             return [IsAdmin()]
-        return [IsAuthenticated()]
+        # Other actions use the permission_classes given to @action
+        return super().get_permissions()
     
     def get_queryset(self):
         # All authenticated users can view dispensers
         return Dispenser.objects.all().prefetch_related('rows', 'rows__product')
+
+    @catalog_cached('dispensers', live=live_inventory)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_cached('dispensers', live=live_inventory)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """Provision many dispensers, each with its empty rows, in one request"""
+        serializer = BulkDispenserSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = serializer.validated_data['dispensers']
+        try:
+            dispensers = provision_dispensers(entries)
+        except DuplicateBeaconError as e:
+            return Response({
+                'error': 'ble_beacon_id must be unique',
+                'duplicates': e.duplicates,
+                'existing': e.existing
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        audit_log(
+            level='info',
+            action='DISPENSERS_BULK_CREATED',
+            description=f'Provisioned {len(dispensers)} dispensers',
+            user_id=request.user.id,
+            ip_address=self._get_client_ip(request),
+            metadata={
+                'count': len(dispensers),
+                'source': 'api'
+            }
+        )
+
+        return Response({
+            'created': len(dispensers),
+            'dispensers': DispenserSummarySerializer(dispensers, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'])
     def nearby(self, request):
-        """Get nearby dispensers (simplified for MVP)"""
+        """Get dispensers around lat/lng, closest first
+
+        Optional ``radius`` (km) restricts results to that distance and
+        ``limit`` caps how many of the nearest dispensers are returned.
+        """
         lat = request.query_params.get('lat')
         lng = request.query_params.get('lng')
-        
-        # In production, implement geospatial query
-        # For MVP, return all dispensers
-        dispensers = self.get_queryset()
-        serializer = self.get_serializer(dispensers, many=True)
-        return Response(serializer.data)
-    
+
+        if lat is None or lng is None:
+            dispensers = self.get_queryset()
+            serializer = self.get_serializer(dispensers, many=True)
+            return Response(serializer.data)
+
+        config = get_geo_config()
+        try:
+            lat, lng = float(lat), float(lng)
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise ValueError
+            radius = request.query_params.get('radius')
+            radius = parse_radius(radius) if radius is not None else None
+            limit = int(request.query_params.get('limit', config['DEFAULT_LIMIT']))
+            if limit <= 0:
+                raise ValueError
+        except (ValueError, TypeError):
+            return Response({'error': 'Invalid lat, lng, radius or limit'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, config['MAX_LIMIT'])
+
+        matches = dispenser_locator.nearest(lat, lng, radius_km=radius, limit=limit)
+        dispensers = self.get_queryset().in_bulk([pk for _, pk in matches])
+
+        data = []
+        for distance, pk in matches:
+            if pk not in dispensers:
+                continue
+            item = self.get_serializer(dispensers[pk]).data
+            item['distance_km'] = round(distance, 3)
+            data.append(item)
+        return Response(data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrMaintenance])
+    def low_stock(self, request):
+        """Rows whose fill ratio is below ``threshold`` (default 0.25), emptiest first
+
+        Optional ``product_id`` and ``lat``/``lng``/``radius`` (km) narrow the
+        search. Reads the indexed fill_ratio column, paginated by cursor.
+        """
+        try:
+            threshold = float(request.query_params.get('threshold', self.LOW_STOCK_THRESHOLD))
+            if not 0 <= threshold <= 1:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'threshold must be a number between 0 and 1'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        rows = DispenserProduct.objects.filter(fill_ratio__lt=threshold) \
+            .select_related('dispenser', 'product')
+
+        product_id = parse_uuid_param(request, 'product_id')
+        if product_id:
+            rows = rows.filter(product_id=product_id)
+
+        lat = request.query_params.get('lat')
+        lng = request.query_params.get('lng')
+        radius = request.query_params.get('radius')
+        if lat is not None or lng is not None or radius is not None:
+            try:
+                lat, lng, radius = float(lat), float(lng), parse_radius(radius)
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                    raise ValueError
+            except (ValueError, TypeError):
+                return Response({'error': 'Area filter needs valid lat, lng and radius'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            matches = dispenser_locator.nearest(lat, lng, radius_km=radius)
+            rows = rows.filter(dispenser_id__in=[pk for _, pk in matches])
+
+        paginator = FillRatioCursorPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        serializer = LowStockRowSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrMaintenance])
+    def forecast(self, request):
+        """Rows projected to run out within ``horizon_hours``, soonest first
+
+        Rates come from recent sales shaped by hour of day and day of week.
+        Optional ``dispenser_id``; ``limit`` caps the result (default 50).
+        """
+        config = get_forecast_config()
+        try:
+            horizon_hours = int(request.query_params.get('horizon_hours', config['HORIZON_HOURS']))
+            limit = int(request.query_params.get('limit', 50))
+            if not 1 <= horizon_hours <= 4 * 7 * 24 or not 1 <= limit <= 1000:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'horizon_hours must be 1-672 and limit 1-1000'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        forecast = forecast_stockouts(horizon_hours=horizon_hours,
+                                      dispenser_id=parse_uuid_param(request, 'dispenser_id'))
+        return Response({
+            'horizon_hours': horizon_hours,
+            'rows_forecast': forecast.rows,
+            'rows_at_risk': len(forecast.results),
+            'results': StockoutForecastSerializer(forecast.results[:limit], many=True).data
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrMaintenance])
+    def restock_routes(self, request):
+        """Visiting order for dispensers that need restocking, split across ``crews``
+
+        ``source`` is ``low_stock`` (rows under ``threshold``) or ``forecast``
+        (rows running out within ``horizon_hours``). Optional ``depot_lat``/
+        ``depot_lng`` start every route there; ``urgency_weight`` trades
+        distance for visiting urgent dispensers first (0 = shortest routes).
+        """
+        config = get_route_config()
+        source = request.query_params.get('source', 'low_stock')
+        if source not in ('low_stock', 'forecast'):
+            return Response({'error': 'source must be low_stock or forecast'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            threshold = float(request.query_params.get('threshold', self.LOW_STOCK_THRESHOLD))
+            horizon_hours = int(request.query_params.get('horizon_hours', get_forecast_config()['HORIZON_HOURS']))
+            crews = int(request.query_params.get('crews', 1))
+            urgency_weight = float(request.query_params.get('urgency_weight', config['URGENCY_WEIGHT']))
+            if (not 0 <= threshold <= 1 or not 1 <= horizon_hours <= 4 * 7 * 24
+                    or not 1 <= crews <= config['MAX_CREWS']
+                    or not math.isfinite(urgency_weight) or urgency_weight < 0):
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'Invalid threshold, horizon_hours, crews or urgency_weight'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        depot = None
+        depot_lat = request.query_params.get('depot_lat')
+        depot_lng = request.query_params.get('depot_lng')
+        if depot_lat is not None or depot_lng is not None:
+            try:
+                depot = (float(depot_lat), float(depot_lng))
+                if not (all(math.isfinite(value) for value in depot)
+                        and -90 <= depot[0] <= 90 and -180 <= depot[1] <= 180):
+                    raise ValueError
+            except (ValueError, TypeError):
+                return Response({'error': 'depot_lat and depot_lng must be valid coordinates'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
+        stops, skipped = restock_stops(source, threshold=threshold, horizon_hours=horizon_hours)
+        truncated = max(len(stops) - config['MAX_STOPS'], 0)
+        stops = stops[:config['MAX_STOPS']]
+
+        routes = plan_routes(stops, crews=crews, depot=depot, urgency_weight=urgency_weight, config=config)
+        data = [{'crew': crew, 'distance_km': route[-1]['cumulative_km'], 'stops': route}
+                for crew, route in enumerate(routes, start=1)]
+        return Response({
+            'source': source,
+            'stops': len(stops),
+            'without_coordinates': skipped,
+            'truncated': truncated,
+            'distance_km': round(sum(route['distance_km'] for route in data), 3),
+            'routes': RestockRouteSerializer(data, many=True).data
+        })
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdminOrMaintenance])
     def add_product(self, request, pk=None):
         """Add or update product in dispenser row"""
@@ -57,7 +292,7 @@ class DispenserViewSet(viewsets.ModelViewSet):
         product = None
         if product_id:
             try:
-                product = Product.objects.get(id=product_id, is_active=True)
+                product = Product.objects.get(product_id=product_id, is_active=True)
             except Product.DoesNotExist:
                 return Response({'error': 'Product not found or inactive'}, 
                               status=status.HTTP_404_NOT_FOUND)
@@ -75,16 +310,16 @@ class DispenserViewSet(viewsets.ModelViewSet):
                 )
                 
                 action_type = 'added' if created else 'updated'
-                Log.objects.create(
+                audit_log(
                     level='info',
                     action='DISPENSER_PRODUCT_UPDATED',
                     description=f'Product {action_type} to dispenser {dispenser.location_name} row {row_number}',
                     user_id=request.user.id,
                     ip_address=self._get_client_ip(request),
                     metadata={
-                        'dispenser_id': str(dispenser.id),
+                        'dispenser_id': str(dispenser.dispenser_id),
                         'row_number': row_number,
-                        'product_id': str(product.id) if product else None,
+                        'product_id': str(product.product_id) if product else None,
                         'max_capacity': max_capacity,
                         'current_inventory': current_inventory
                     }
@@ -95,7 +330,7 @@ class DispenserViewSet(viewsets.ModelViewSet):
                               status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
                 
         except Exception as e:
-            Log.objects.create(
+            audit_log(
                 level='error',
                 action='DISPENSER_PRODUCT_UPDATE_ERROR',
                 description=f'Failed to update dispenser product: {str(e)}',
@@ -105,6 +340,46 @@ class DispenserViewSet(viewsets.ModelViewSet):
             )
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrMaintenance])
+    def bulk_restock(self, request):
+        """Restock many dispenser rows, or apply a planogram to many dispensers, in one request"""
+        serializer = BulkRestockSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        planogram = None
+        if 'planogram' in data:
+            planogram = Planogram.objects.filter(name=data['planogram']).first()
+            if planogram is None:
+                return Response({'error': 'Planogram not found'}, status=status.HTTP_404_NOT_FOUND)
+            entries = planogram_entries(planogram, data['dispenser_ids'])
+        else:
+            entries = data['entries']
+
+        results = apply_restock(entries)
+        updated = sum(1 for result in results if result['status'] == 'updated')
+
+        audit_log(
+            level='info' if updated == len(results) else 'warn',
+            action='DISPENSERS_BULK_RESTOCKED',
+            description=f'Restocked {updated} of {len(results)} dispenser rows',
+            user_id=request.user.id,
+            ip_address=self._get_client_ip(request),
+            metadata={
+                'planogram': planogram.name if planogram else None,
+                'dispenser_count': len({entry['dispenser_id'] for entry in entries}),
+                'updated': updated,
+                'failed': len(results) - updated
+            }
+        )
+
+        return Response({
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results
+        }, status=status.HTTP_200_OK if updated else status.HTTP_400_BAD_REQUEST)
+
     def _get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
\ No newline at end of file
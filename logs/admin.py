@@ -1,10 +1,18 @@
 from django.contrib import admin
-from .models import Log
+from .models import Log, LogRollup
 
 @admin.register(Log)
 class LogAdmin(admin.ModelAdmin):
-    list_display = ('action', 'level', 'user', 'ip_address', 'timestamp')
+    # Logs live in their own database, so no lookups or joins through user
+    list_display = ('action', 'level', 'user_id', 'ip_address', 'timestamp')
     list_filter = ('level', 'action', 'timestamp')
-    search_fields = ('action', 'description', 'user__phone_number', 'ip_address')
-    readonly_fields = ('timestamp',)
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    search_fields = ('action', 'description', 'ip_address')
+    readonly_fields = ('user', 'timestamp')
+    date_hierarchy = 'timestamp'
+
+@admin.register(LogRollup)
+class LogRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'level', 'action', 'count')
+    list_filter = ('level', 'bucket')
+    search_fields = ('action',)
+    date_hierarchy = 'bucket'
\ No newline at end of file
@@ -0,0 +1,203 @@
+import gzip
+import json
+import os
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Log
+
+DEFAULTS = {
+    'DIR': None,  # defaults to BASE_DIR / 'log_archive'
+    'RETENTION_DAYS': 90,
+    'PART_SIZE': 100000,  # rows per archive file
+    'CHUNK_SIZE': 2000,  # rows fetched per query
+    'DELETE_BATCH_SIZE': 1000,  # rows removed per DELETE
+    'COMPRESS_LEVEL': 6,
+}
+
+FIELDS = [
+    'id', 'level', 'action', 'description', 'user_id', 'ip_address', 'user_agent',
+    'request_method', 'request_url', 'request_body', 'response_status', 'response_body',
+    'error_message', 'error_stack', 'metadata', 'timestamp',
+]
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'LOG_ARCHIVE', {})}
+    config['DIR'] = Path(config['DIR'] or settings.BASE_DIR / 'log_archive')
+    return config
+
+
+def day_bounds(day):
+    """Aware [start, end) datetimes of a calendar day in TIME_ZONE"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def day_directory(day, config=None):
+    config = config or get_config()
+    return config['DIR'] / f'{day:%Y}' / f'{day:%m}' / f'{day:%Y-%m-%d}'
+
+
+def archived_days(config=None):
+    """Days that have at least one archive file, oldest first"""
+    config = config or get_config()
+    days = []
+    for path in sorted(config['DIR'].glob('*/*/*')):
+        if path.is_dir() and any(path.glob('*.ndjson.gz')):
+            days.append(datetime.strptime(path.name, '%Y-%m-%d').date())
+    return days
+
+
+def _after(key):
+    """Rows strictly after a (timestamp, id) key in cursor order"""
+    timestamp, pk = key
+    return Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+
+
+def _chunks(queryset, chunk_size):
+    """Yield lists of rows by keyset pagination so no cursor stays open across chunks"""
+    key = None
+    while True:
+        page = queryset if key is None else queryset.filter(_after(key))
+        rows = list(page.order_by('timestamp', 'id').values(*FIELDS)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        key = (rows[-1]['timestamp'], rows[-1]['id'])
+
+
+class LogArchiver:
+    """Move logs of whole past days from the database into gzip NDJSON files.
+
+    A day's logs are written to one or more part files of at most
+    ``PART_SIZE`` rows under ``DIR/YYYY/MM/YYYY-MM-DD/``. A part is written
+    to a temporary file, fsynced and renamed before any of its rows are
+    deleted, and rows are then deleted ``DELETE_BATCH_SIZE`` at a time so
+    no statement holds the write lock for long. Rows are never deleted
+    before they are in a committed part, but a run interrupted between
+    the rename and the last delete leaves the rest of the part in the
+    database; the next run archives those rows again in a new part, and
+    ``read_archived_day`` skips the duplicates by id.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+
+    def cutoff_day(self, retention_days=None):
+        """First local day that is kept"""
+        days = self.config['RETENTION_DAYS'] if retention_days is None else retention_days
+        return timezone.localdate() - timedelta(days=days)
+
+    def days_to_archive(self, cutoff_day):
+        oldest = Log.objects.aggregate(oldest=Min('timestamp'))['oldest']
+        if oldest is None:
+            return
+        day = timezone.localtime(oldest).date()
+        while day < cutoff_day:
+            yield day
+            day += timedelta(days=1)
+
+    def archive_day(self, day, dry_run=False):
+        """Archive and delete every log of ``day``; returns the number of rows archived"""
+        start, end = day_bounds(day)
+        queryset = Log.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        if dry_run:
+            return queryset.count()
+
+        total = 0
+        part_rows = 0
+        writer = None
+        for rows in _chunks(queryset, self.config['CHUNK_SIZE']):
+            for row in rows:
+                if writer is None:
+                    writer = _PartWriter(day_directory(day, self.config), day, row, self.config)
+                    first_key = (row['timestamp'], row['id'])
+                writer.write(row)
+                part_rows += 1
+                if part_rows >= self.config['PART_SIZE']:
+                    last_key = (row['timestamp'], row['id'])
+                    writer.commit()
+                    self._delete(queryset, first_key, last_key)
+                    total += part_rows
+                    writer, part_rows = None, 0
+        if writer is not None:
+            writer.commit()
+            self._delete(queryset, first_key, (row['timestamp'], row['id']))
+            total += part_rows
+        return total
+
+    def _delete(self, queryset, first_key, last_key):
+        """Delete the archived key range in bounded batches"""
+        archived = queryset.filter(
+            Q(timestamp__gt=first_key[0]) | Q(timestamp=first_key[0], id__gte=first_key[1]),
+            Q(timestamp__lt=last_key[0]) | Q(timestamp=last_key[0], id__lte=last_key[1]),
+        )
+        batch_size = self.config['DELETE_BATCH_SIZE']
+        while True:
+            ids = list(archived.order_by('timestamp', 'id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            Log.objects.filter(id__in=ids).delete()
+
+
+class _PartWriter:
+    def __init__(self, directory, day, first_row, config):
+        directory.mkdir(parents=True, exist_ok=True)
+        # Local time of the first row, so file names sort in log order
+        started = timezone.localtime(first_row['timestamp'])
+        name = f'logs-{day:%Y-%m-%d}-{started:%H%M%S%f}-{first_row["id"].hex[:12]}.ndjson.gz'
+        self.path = directory / name
+        self.tmp_path = directory / f'.{name}.tmp'
+        self._raw = open(self.tmp_path, 'wb')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=config['COMPRESS_LEVEL'])
+
+    def write(self, row):
+        # Full microsecond precision; DjangoJSONEncoder would cut it to milliseconds
+        row = {**row, 'timestamp': row['timestamp'].isoformat()}
+        line = json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':'))
+        self._file.write(line.encode('utf-8') + b'\n')
+
+    def commit(self):
+        self._file.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def read_archived_day(day, level=None, action=None, user_id=None, start=None, end=None, config=None):
+    """Stream the archived logs of ``day`` as dicts, optionally filtered.
+
+    Files are decompressed line by line, so only the ids already read are
+    held in memory, not the entries. Rows archived twice by an interrupted
+    run are yielded once. ``start``/``end`` are aware datetimes bounding
+    the timestamp (inclusive).
+    """
+    directory = day_directory(day, config)
+    seen = set()
+    for path in sorted(directory.glob('*.ndjson.gz')):
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                entry = json.loads(line)
+                if entry['id'] in seen:
+                    continue
+                seen.add(entry['id'])
+                if level and entry['level'] != level:
+                    continue
+                if action and entry['action'] != action:
+                    continue
+                if user_id and entry['user_id'] != str(user_id):
+                    continue
+                if start or end:
+                    timestamp = parse_datetime(entry['timestamp'])
+                    if (start and timestamp < start) or (end and timestamp > end):
+                        continue
+                yield entry
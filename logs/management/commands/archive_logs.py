@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.archive import LogArchiver, get_config
+
+
+class Command(BaseCommand):
+    help = ('Move logs older than the retention period into compressed, per-day NDJSON '
+            'archives and delete them from the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Keep this many days of logs (default: LOG_ARCHIVE RETENTION_DAYS)')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per query')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many logs each day would archive')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['chunk_size']:
+            config['CHUNK_SIZE'] = options['chunk_size']
+        if options['batch_size']:
+            config['DELETE_BATCH_SIZE'] = options['batch_size']
+        if options['days'] is not None and options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        archiver = LogArchiver(config)
+        cutoff = archiver.cutoff_day(options['days'])
+        total = 0
+        for day in archiver.days_to_archive(cutoff):
+            count = archiver.archive_day(day, dry_run=options['dry_run'])
+            if count:
+                self.stdout.write(f'{day:%Y-%m-%d}: {count} logs')
+            total += count
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {total} logs older than {cutoff:%Y-%m-%d} to {config["DIR"]}.'
+        ))
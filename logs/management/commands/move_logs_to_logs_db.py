@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from logs.models import Log, LogRollup
+from logs.routers import LOGS_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Copy logs and rollups written before the logs database existed from the main '
+            'database into the logs database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delete', action='store_true',
+                            help='Empty the old tables in the main database once copied')
+
+    def handle(self, *args, **options):
+        tables = connections[DEFAULT_DB_ALIAS].introspection.table_names()
+        missing = [model._meta.db_table for model in (Log, LogRollup) if model._meta.db_table not in tables]
+        if len(missing) == 2:
+            self.stdout.write('No log tables in the main database, nothing to copy.')
+            return
+
+        for model in (Log, LogRollup):
+            if model._meta.db_table in missing:
+                continue
+            copied = self._copy(model, options['batch_size'])
+            self.stdout.write(f'Copied {copied} {model._meta.verbose_name_plural}.')
+            if options['delete']:
+                with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {connections[DEFAULT_DB_ALIAS].ops.quote_name(model._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def _copy(self, model, batch_size):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        source = model.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        copied = 0
+        batch = []
+        for row in source.iterator(chunk_size=batch_size):
+            row._state.db = None
+            batch.append(row)
+            if len(batch) >= batch_size:
+                copied += self._insert(model, batch)
+                batch = []
+        if batch:
+            copied += self._insert(model, batch)
+        return copied
+
+    def _insert(self, model, batch):
+        # Rows already copied by an earlier run are skipped
+        with transaction.atomic(using=LOGS_DB_ALIAS):
+            model.objects.using(LOGS_DB_ALIAS).bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from logs.archive import archived_days, read_archived_day
+
+
+class Command(BaseCommand):
+    help = 'Print archived logs of one day as NDJSON without restoring them into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date', nargs='?', help='Archived day (YYYY-MM-DD); omit to list archived days')
+        parser.add_argument('--level')
+        parser.add_argument('--action')
+        parser.add_argument('--user-id')
+        parser.add_argument('--start', help='ISO datetime lower bound')
+        parser.add_argument('--end', help='ISO datetime upper bound')
+        parser.add_argument('--count', action='store_true', help='Only print the number of matching logs')
+
+    def handle(self, *args, **options):
+        if not options['date']:
+            for day in archived_days():
+                self.stdout.write(f'{day:%Y-%m-%d}')
+            return
+
+        day = parse_date(options['date'])
+        if day is None:
+            raise CommandError('date must be YYYY-MM-DD')
+        bounds = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                value = parse_datetime(options[name])
+                if value is None:
+                    raise CommandError(f'--{name} must be an ISO datetime')
+                bounds[name] = timezone.make_aware(value) if timezone.is_naive(value) else value
+
+        entries = read_archived_day(day, level=options['level'], action=options['action'],
+                                    user_id=options['user_id'], **bounds)
+        if options['count']:
+            self.stdout.write(str(sum(1 for _ in entries)))
+            return
+        for entry in entries:
+            self.stdout.write(json.dumps(entry, separators=(',', ':')))
@@ -0,0 +1,52 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from logs.models import Log, LogRollup, truncate_to_hour
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly LogRollup counters from the raw logs table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='ISO datetime to rebuild from. Defaults to the oldest log still in the table, '
+                 'so counters for archived logs are kept.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('--since must be an ISO datetime')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        else:
+            since = Log.objects.aggregate(oldest=Min('timestamp'))['oldest']
+            if since is None:
+                self.stdout.write('No logs to roll up.')
+                return
+        since = truncate_to_hour(since)
+
+        counts = Log.objects.filter(timestamp__gte=since).annotate(
+            bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc)
+        ).values('bucket', 'level', 'action').annotate(count=Count('id')).order_by()
+
+        with transaction.atomic(using=router.db_for_write(LogRollup)):
+            deleted, _ = LogRollup.objects.filter(bucket__gte=since).delete()
+            created = LogRollup.objects.bulk_create(
+                (LogRollup(**row) for row in counts.iterator()),
+                batch_size=options['batch_size'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rollups since {since:%Y-%m-%d %H:00} UTC: '
+            f'removed {deleted}, created {len(created)} counters.'
+        ))
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_log_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='log',
+            name='logs_level_de2b3a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='log',
+            name='logs_action_68aa90_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='log',
+            name='logs_timesta_e5126f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='log',
+            name='logs_user_id_2f2997_idx',
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['timestamp', 'id'], name='logs_timesta_04f348_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['level', 'timestamp', 'id'], name='logs_level_260e21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='logs_action_4ebd15_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='logs_user_id_ee2ba4_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('level', models.CharField(choices=[('info', 'Info'), ('warn', 'Warning'), ('error', 'Error'), ('debug', 'Debug'), ('security', 'Security')], max_length=20)),
+                ('action', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'log_rollups',
+                'ordering': ['-bucket'],
+                'unique_together': {('bucket', 'level', 'action')},
+            },
+        ),
+    ]
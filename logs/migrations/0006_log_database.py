@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logs', '0005_log_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='logs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
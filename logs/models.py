@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.utils import timezone
 import uuid
+from collections import Counter
+from datetime import timezone as dt_timezone
 
 class Log(models.Model):
     class Level(models.TextChoices):
@@ -13,7 +16,9 @@ class Log(models.Model):
     level = models.CharField(max_length=20, choices=Level.choices, default=Level.INFO)
     action = models.CharField(max_length=100)
     description = models.TextField(null=True, blank=True)
-    user = models.ForeignKey('users.User', on_delete=models.SET_NULL, 
+    # Users live in another database: no FK constraint, and deleting a
+    # user leaves their audit trail untouched
+    user = models.ForeignKey('users.User', on_delete=models.DO_NOTHING, db_constraint=False,
                            null=True, blank=True, related_name='logs')
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)
@@ -25,17 +30,57 @@ class Log(models.Model):
     error_message = models.TextField(null=True, blank=True)
     error_stack = models.TextField(null=True, blank=True)
     metadata = models.JSONField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'logs'
         ordering = ['-timestamp']
         indexes = [
-            models.Index(fields=['level']),
-            models.Index(fields=['action']),
-            models.Index(fields=['timestamp']),
-            models.Index(fields=['user', 'timestamp']),
+            # Composite keys back the (timestamp, id) cursor pagination of
+            # LogViewSet, with or without its level/action/user filters
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['level', 'timestamp', 'id']),
+            models.Index(fields=['action', 'timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
         ]
     
     def __str__(self):
-        return f'[{self.level}] {self.action} - {self.timestamp}'
\ No newline at end of file
+        return f'[{self.level}] {self.action} - {self.timestamp}'
+
+def truncate_to_hour(value):
+    """Start of the UTC hour containing ``value``"""
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+class LogRollup(models.Model):
+    """Number of log entries per hour for one (level, action) pair"""
+    bucket = models.DateTimeField()  # start of the hour, UTC
+    level = models.CharField(max_length=20, choices=Log.Level.choices)
+    action = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'log_rollups'
+        ordering = ['-bucket']
+        unique_together = ['bucket', 'level', 'action']
+
+    def __str__(self):
+        return f'{self.bucket:%Y-%m-%d %H:00} [{self.level}] {self.action}: {self.count}'
+
+    @classmethod
+    def add_logs(cls, logs):
+        """Add a batch of Log entries to their hourly counters"""
+        cls.add_counts(Counter((truncate_to_hour(log.timestamp), log.level, log.action) for log in logs))
+
+    @classmethod
+    def add_counts(cls, counts):
+        """Add ``{(bucket, level, action): count}`` to the hourly counters, without Log rows"""
+        for (bucket, level, action), count in counts.items():
+            rollups = cls.objects.filter(bucket=bucket, level=level, action=action)
+            if rollups.update(count=models.F('count') + count):
+                continue
+            try:
+                with transaction.atomic(using=router.db_for_write(cls)):
+                    cls.objects.create(bucket=bucket, level=level, action=action, count=count)
+            except IntegrityError:
+                # Another writer created the counter first
+                rollups.update(count=models.F('count') + count)
\ No newline at end of file
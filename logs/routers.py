@@ -0,0 +1,32 @@
+LOGS_DB_ALIAS = 'logs'
+
+
+class LogsRouter:
+    """Keep the logs app in its own database so audit writes never take the main write lock.
+
+    Log.user points at users in the main database without a database-level
+    constraint; it is resolved with a separate query, never a join.
+    """
+    app_label = 'logs'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return LOGS_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return LOGS_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.app_label in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == self.app_label:
+            return db == LOGS_DB_ALIAS
+        if db == LOGS_DB_ALIAS:
+            return False
+        return None
@@ -16,4 +16,9 @@ class LogStatsSerializer(serializers.Serializer):
 
 class ActionStatsSerializer(serializers.Serializer):
     action = serializers.CharField()
+    count = serializers.IntegerField()
+
+class LogSeriesSerializer(serializers.Serializer):
+    period = serializers.DateTimeField()
+    level = serializers.CharField()
     count = serializers.IntegerField()
\ No newline at end of file
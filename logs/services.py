@@ -0,0 +1,195 @@
+import atexit
+import functools
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.utils import timezone
+
+from .models import Log, LogRollup
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BUFFERED': True,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'STRICT_LEVELS': [Log.Level.SECURITY],
+}
+
+
+class LogWriter:
+    """Queue Log rows in memory and write them in batches from a background thread.
+
+    Entries are flushed with ``bulk_create`` once ``BATCH_SIZE`` rows are
+    pending or every ``FLUSH_INTERVAL`` seconds, whichever comes first.
+    Levels listed in ``STRICT_LEVELS`` (and every entry when ``BUFFERED`` is
+    off) are written synchronously, together with anything still queued so
+    ordering is preserved. Pending rows are flushed when the process exits.
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._atexit_registered = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @property
+    def config(self):
+        return {**DEFAULTS, **getattr(settings, 'LOG_WRITER', {})}
+
+    def write(self, **fields):
+        """Record a Log entry; returns the (possibly not yet saved) instance"""
+        fields.setdefault('timestamp', timezone.now())
+        entry = Log(**fields)
+        config = self.config
+
+        if not config['BUFFERED'] or entry.level in config['STRICT_LEVELS']:
+            self.flush(extra=[entry])
+            return entry
+
+        if not self._enqueue(entry, config):
+            # Apply backpressure instead of dropping audit entries
+            self.flush(extra=[entry])
+        return entry
+
+    async def awrite(self, **fields):
+        """write() for async views: queueing stays inline, any database write runs in a thread"""
+        fields.setdefault('timestamp', timezone.now())
+        entry = Log(**fields)
+        config = self.config
+
+        if config['BUFFERED'] and entry.level not in config['STRICT_LEVELS'] and self._enqueue(entry, config):
+            return entry
+        await sync_to_async(self.flush)(extra=[entry])
+        return entry
+
+    def _enqueue(self, entry, config):
+        """Queue ``entry`` for the background thread; False if the queue is full"""
+        self._ensure_thread()
+        with self._lock:
+            if len(self._queue) >= config['MAX_QUEUE_SIZE']:
+                return False
+            self._queue.append(entry)
+            pending = len(self._queue)
+        if pending >= config['BATCH_SIZE']:
+            self._wakeup.set()
+        return True
+
+    def flush(self, extra=()):
+        """Write every queued entry (plus ``extra``) to the database now"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+            batch.extend(extra)
+            if batch:
+                self._write_batch(batch)
+
+    def stop(self, timeout=5.0):
+        """Stop the background thread and flush whatever is still queued"""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def _write_batch(self, batch):
+        try:
+            with transaction.atomic(using=router.db_for_write(Log)):
+                Log.objects.bulk_create(batch, batch_size=self.config['BATCH_SIZE'])
+                LogRollup.add_logs(batch)
+        except Exception:
+            logger.exception('Failed to write %d log entries', len(batch))
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            # Left set by stop(); a restarted thread would otherwise flush at once
+            self._wakeup.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(self.config['FLUSH_INTERVAL'])
+                self._wakeup.clear()
+                close_old_connections()
+                self.flush()
+        finally:
+            connections.close_all()
+
+    def _reset_after_fork(self):
+        # Entries queued in the parent are flushed by the parent, not by each worker
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+
+log_writer = LogWriter()
+
+
+_on_commit = ContextVar('audit_log_on_commit', default=False)
+
+
+@contextmanager
+def audit_logs_on_commit():
+    """Hold audit_log entries made inside the block until the default database commits
+
+    For actions whose writes may still be rolled back: entries of a
+    rolled-back transaction are dropped with it instead of describing work
+    that never happened.
+    """
+    token = _on_commit.set(True)
+    try:
+        yield
+    finally:
+        _on_commit.reset(token)
+
+
+def audit_log(**fields):
+    """Queue a Log entry; takes the same keyword arguments as ``Log``
+
+    Returns the entry, or None when it is held by ``audit_logs_on_commit``.
+    """
+    if _on_commit.get():
+        # Stamped now, not when the transaction commits
+        fields.setdefault('timestamp', timezone.now())
+        transaction.on_commit(functools.partial(log_writer.write, **fields))
+        return None
+    return log_writer.write(**fields)
+
+
+async def aaudit_log(**fields):
+    """audit_log() for async views"""
+    return await log_writer.awrite(**fields)
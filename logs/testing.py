@@ -0,0 +1,22 @@
+from django.test.utils import override_settings
+
+from .services import log_writer
+
+
+class AuditLogTestMixin:
+    """For tests whose code paths call audit_log.
+
+    Declares the logs alias, so the logs test database is created instead of
+    the real one being written to, and writes entries synchronously inside
+    the test's transaction. Anything the background writer still holds is
+    flushed before the test databases are rolled back or torn down.
+    """
+    databases = {'default', 'logs'}
+
+    def setUp(self):
+        super().setUp()
+        log_writer.stop()
+        override = override_settings(LOG_WRITER={'BUFFERED': False})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(log_writer.stop)
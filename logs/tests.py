@@ -1,3 +1,228 @@
-from django.test import TestCase
+import tempfile
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from users.models import User
+
+from .archive import LogArchiver, day_bounds, day_directory, get_config as get_archive_config, read_archived_day
+from .models import Log, LogRollup, truncate_to_hour
+from .services import audit_log, log_writer
+from .testing import AuditLogTestMixin
+
+
+class LogWriterTests(TransactionTestCase):
+    # The background thread writes through its own connection, outside any test transaction
+    databases = {'default', 'logs'}
+
+    def tearDown(self):
+        log_writer.stop()
+
+    @override_settings(LOG_WRITER={'BUFFERED': True, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60})
+    def test_buffered_entries_are_written_on_flush(self):
+        audit_log(level='info', action='TEST', description='one')
+        audit_log(level='info', action='TEST', description='two')
+        self.assertEqual(Log.objects.count(), 0)
+        self.assertEqual(log_writer.pending, 2)
+
+        log_writer.flush()
+        self.assertEqual(Log.objects.count(), 2)
+        self.assertEqual(LogRollup.objects.get(action='TEST').count, 2)
+
+    @override_settings(LOG_WRITER={'BUFFERED': True, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60})
+    def test_strict_levels_are_written_with_the_queue(self):
+        audit_log(level='info', action='QUEUED', description='queued')
+        audit_log(level='security', action='STRICT', description='strict')
+        self.assertEqual(log_writer.pending, 0)
+        self.assertEqual(list(Log.objects.order_by('timestamp').values_list('action', flat=True)),
+                         ['QUEUED', 'STRICT'])
+
+
+class AuditLogTestMixinTests(AuditLogTestMixin, TestCase):
+    def test_entries_are_written_to_the_logs_test_database(self):
+        audit_log(level='info', action='TEST', description='sync')
+        self.assertEqual(Log.objects.filter(action='TEST').count(), 1)
+
+
+class LogViewSetTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001', user_type='admin'))
+
+    def test_date_and_user_filters(self):
+        audit_log(level='info', action='TEST', description='sync')
+        self.assertEqual(len(self.client.get('/api/logs/?start_date=2000-01-01').data['results']), 1)
+        self.assertEqual(len(self.client.get('/api/logs/?end_date=2000-01-01T00:00:00Z').data['results']), 0)
+
+    def test_invalid_filters_are_rejected(self):
+        for url in ('/api/logs/?user_id=abc', '/api/logs/?start_date=abc', '/api/logs/stats/?end_date=2024-13-01'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_pages_through_shared_timestamps_without_skips_or_repeats(self):
+        now = timezone.now()
+        # Seven rows in one instant around pages of two, with neighbours on either side
+        timestamps = [now - timedelta(seconds=1)] + [now] * 7 + [now + timedelta(seconds=1)]
+        logs = [Log.objects.create(action=f'TEST_{i}', timestamp=timestamp) for i, timestamp in enumerate(timestamps)]
+
+        seen = []
+        url = '/api/logs/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [entry['id'] for entry in response.data['results']]
+            url = response.data['next']
+        expected = sorted(logs, key=lambda log: (log.timestamp, log.id), reverse=True)
+        self.assertEqual(seen, [str(log.id) for log in expected])
+
+        # ...and back again from the last page
+        url, back = response.data['previous'], []
+        while url:
+            response = self.client.get(url)
+            back = [entry['id'] for entry in response.data['results']] + back
+            url = response.data['previous']
+        self.assertEqual(back, seen[:len(back)])
+        self.assertEqual(len(back), len(seen) - 1)
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ('not-base64!', 'cD1hYmM=', 'cD0yMDI0LTEzLTAx', 'bz14'):
+            self.assertEqual(self.client.get(f'/api/logs/?cursor={cursor}').status_code, 400, cursor)
+
+
+class LogRollupTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001', user_type='admin'))
+        # 23:30 and 00:10 in Riyadh: two UTC hours that also fall on two local days
+        base = datetime(2024, 3, 10, 20, 0, tzinfo=dt_timezone.utc)
+        self.logs = [
+            Log.objects.create(level=level, action=action, timestamp=base + timedelta(minutes=minutes))
+            for level, action, minutes in (('info', 'LOGIN', 30), ('info', 'LOGIN', 45), ('error', 'PURCHASE', 50),
+                                           ('info', 'PURCHASE', 70), ('error', 'PURCHASE', 80))
+        ]
+        LogRollup.add_logs(self.logs)
+
+    def _series(self, granularity):
+        data = self.client.get(f'/api/logs/stats/?granularity={granularity}').data['series']
+        return {(parse_datetime(row['period']), row['level']): row['count'] for row in data}
+
+    def _rollups(self):
+        return {(rollup.bucket, rollup.level, rollup.action): rollup.count for rollup in LogRollup.objects.all()}
+
+    def test_hour_and_day_series_match_the_logs(self):
+        hours = Counter((truncate_to_hour(log.timestamp), log.level) for log in self.logs)
+        self.assertEqual(self._series('hour'), dict(hours))
+
+        days = Counter((timezone.make_aware(datetime.combine(timezone.localdate(log.timestamp), time.min)), log.level)
+                       for log in self.logs)
+        self.assertEqual(len({day for day, _ in days}), 2)
+        self.assertEqual(self._series('day'), dict(days))
+
+        stats = self.client.get('/api/logs/stats/').data
+        self.assertEqual(stats['recent_activity']['total_logs'], 5)
+        self.assertEqual({row['level']: row['count'] for row in stats['levels']}, {'error': 2, 'info': 3})
+
+    def test_rebuild_reproduces_the_counts_from_the_logs(self):
+        expected = self._rollups()
+        LogRollup.objects.filter(level='error').delete()
+        LogRollup.objects.update(count=99)
+        LogRollup.objects.create(bucket=truncate_to_hour(self.logs[0].timestamp), level='debug', action='STALE',
+                                 count=1)
+
+        call_command('rebuild_log_rollups', stdout=StringIO())
+        self.assertEqual(self._rollups(), expected)
+
+    def test_rebuild_since_keeps_older_counters(self):
+        older = LogRollup.objects.create(bucket=datetime(2024, 1, 1, tzinfo=dt_timezone.utc), level='info',
+                                         action='ARCHIVED', count=7)
+        call_command('rebuild_log_rollups', since='2024-03-10T20:00:00Z', stdout=StringIO())
+        self.assertEqual(LogRollup.objects.get(pk=older.pk).count, 7)
+        self.assertEqual(sum(LogRollup.objects.exclude(pk=older.pk).values_list('count', flat=True)), 5)
+
+
+class LogArchiverTests(TestCase):
+    databases = {'default', 'logs'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.config = {**get_archive_config(), 'DIR': Path(directory.name),
+                       'PART_SIZE': 3, 'CHUNK_SIZE': 2, 'DELETE_BATCH_SIZE': 1}
+        self.archiver = LogArchiver(self.config)
+        self.day = timezone.localdate() - timedelta(days=10)
+        noon = day_bounds(self.day)[0] + timedelta(hours=12)
+        self.logs = [Log.objects.create(level='warn' if i % 2 else 'info', action=f'TEST_{i}',
+                                        metadata={'i': i}, timestamp=noon + timedelta(seconds=i, microseconds=i))
+                     for i in range(5)]
+
+    def _archived_ids(self):
+        return [entry['id'] for entry in read_archived_day(self.day, config=self.config)]
+
+    def test_parts_are_written_before_their_rows_are_deleted(self):
+        delete = LogArchiver._delete
+
+        def check_then_delete(archiver, queryset, first_key, last_key):
+            part = {str(log.id) for log in self.logs if first_key <= (log.timestamp, log.id) <= last_key}
+            self.assertLessEqual(part, set(self._archived_ids()))
+            delete(archiver, queryset, first_key, last_key)
+
+        with mock.patch.object(LogArchiver, '_delete', autospec=True, side_effect=check_then_delete) as patched:
+            self.assertEqual(self.archiver.archive_day(self.day), 5)
+        self.assertEqual(patched.call_count, 2)
+        self.assertFalse(Log.objects.exists())
+
+        Log.objects.create(action='KEPT', timestamp=self.logs[0].timestamp)
+        with mock.patch('logs.archive._PartWriter.commit', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.archiver.archive_day(self.day)
+        self.assertTrue(Log.objects.filter(action='KEPT').exists())
+
+    def test_only_days_before_the_cutoff_are_archived(self):
+        recent = Log.objects.create(action='RECENT')
+        cutoff = self.archiver.cutoff_day(retention_days=5)
+        self.assertEqual(list(self.archiver.days_to_archive(cutoff))[0], self.day)
+        self.assertNotIn(timezone.localdate(), list(self.archiver.days_to_archive(cutoff)))
+
+        for day in self.archiver.days_to_archive(cutoff):
+            self.archiver.archive_day(day)
+        self.assertEqual(list(Log.objects.values_list('id', flat=True)), [recent.id])
+
+    def test_rerun_after_an_interrupted_delete_archives_each_row_once(self):
+        def delete_one_batch(archiver, queryset, first_key, last_key):
+            Log.objects.filter(id=self.logs[0].id).delete()
+            raise KeyboardInterrupt
+
+        with mock.patch.object(LogArchiver, '_delete', autospec=True, side_effect=delete_one_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.archiver.archive_day(self.day)
+        self.assertEqual(Log.objects.count(), 4)
+
+        self.assertEqual(self.archiver.archive_day(self.day), 4)
+        self.assertEqual(self.archiver.archive_day(self.day), 0)
+        self.assertFalse(Log.objects.exists())
+        self.assertEqual(len(list(day_directory(self.day, self.config).glob('*.ndjson.gz'))), 3)
+        self.assertEqual(self._archived_ids(), [str(log.id) for log in self.logs])
+
+    def test_read_archived_day_round_trip(self):
+        self.archiver.archive_day(self.day)
+        entries = list(read_archived_day(self.day, config=self.config))
+        self.assertEqual([(entry['action'], entry['metadata'], parse_datetime(entry['timestamp']))
+                          for entry in entries],
+                         [(log.action, log.metadata, log.timestamp) for log in self.logs])
+
+        def actions(**filters):
+            return [entry['action'] for entry in read_archived_day(self.day, config=self.config, **filters)]
+
+        self.assertEqual(actions(level='warn'), ['TEST_1', 'TEST_3'])
+        self.assertEqual(actions(action='TEST_2'), ['TEST_2'])
+        self.assertEqual(actions(start=self.logs[1].timestamp, end=self.logs[3].timestamp),
+                         ['TEST_1', 'TEST_2', 'TEST_3'])
@@ -1,20 +1,31 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncHour
 from django.utils import timezone
 from datetime import timedelta
-from .models import Log
-from .serializers import LogSerializer, LogStatsSerializer, ActionStatsSerializer
+from .models import Log, LogRollup, truncate_to_hour
+from .serializers import LogSerializer, LogStatsSerializer, ActionStatsSerializer, LogSeriesSerializer
+from napkin_dispenser.export import export_response
+from napkin_dispenser.pagination import TimestampCursorPagination
+from napkin_dispenser.query_params import parse_datetime_param, parse_uuid_param
 from users.permissions import IsAdmin
 
 class LogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = LogSerializer
+    pagination_class = TimestampCursorPagination
     permission_classes = [IsAdmin]
-    queryset = Log.objects.all().select_related('user').order_by('-timestamp')
+    GRANULARITIES = {'hour': TruncHour, 'day': TruncDay}
+    EXPORT_FIELDS = ['id', 'timestamp', 'level', 'action', 'description', 'user_id',
+                     'ip_address', 'user_agent', 'request_method', 'request_url',
+                     'request_body', 'response_status', 'response_body',
+                     'error_message', 'error_stack', 'metadata']
+    queryset = Log.objects.all().order_by('-timestamp')
     
     def get_queryset(self):
-        queryset = Log.objects.all().select_related('user')
+        queryset = Log.objects.all()
         
         # Apply filters
         level = self.request.query_params.get('level')
@@ -25,46 +36,87 @@ class LogViewSet(viewsets.ReadOnlyModelViewSet):
         if action:
             queryset = queryset.filter(action=action)
         
-        user_id = self.request.query_params.get('user_id')
+        user_id = parse_uuid_param(self.request, 'user_id')
         if user_id:
             queryset = queryset.filter(user_id=user_id)
         
-        start_date = self.request.query_params.get('start_date')
+        start_date = parse_datetime_param(self.request, 'start_date')
         if start_date:
             queryset = queryset.filter(timestamp__gte=start_date)
         
-        end_date = self.request.query_params.get('end_date')
+        end_date = parse_datetime_param(self.request, 'end_date')
         if end_date:
             queryset = queryset.filter(timestamp__lte=end_date)
         
-        return queryset.order_by('-timestamp')
+        return queryset.order_by('-timestamp', '-id')
     
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every matching log as NDJSON or CSV
+
+        Takes the list filters plus ``file_format`` (ndjson or csv) and
+        ``gzip``.
+        """
+        return export_response(request, self.get_queryset(), self.EXPORT_FIELDS, 'logs')
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Get log statistics"""
+        """Get log statistics from the hourly rollups
+
+        Optional ``start_date``/``end_date`` restrict the window and
+        ``granularity`` (hour or day) adds a per-level time series.
+        """
+        rollups = LogRollup.objects.all()
+        try:
+            start_date = parse_datetime_param(request, 'start_date')
+            end_date = parse_datetime_param(request, 'end_date')
+        except ValidationError:
+            return Response({'error': 'Invalid start_date or end_date'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if start_date:
+            rollups = rollups.filter(bucket__gte=truncate_to_hour(start_date))
+        if end_date:
+            rollups = rollups.filter(bucket__lte=end_date)
+
+        granularity = request.query_params.get('granularity')
+        if granularity and granularity not in self.GRANULARITIES:
+            return Response({'error': f'granularity must be one of {", ".join(self.GRANULARITIES)}'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
         # Level statistics
-        level_stats = Log.objects.values('level').annotate(
-            count=Count('id')
+        level_stats = rollups.values('level').annotate(
+            count=Sum('count')
         ).order_by('level')
-        
+
         # Top actions
-        action_stats = Log.objects.values('action').annotate(
-            count=Count('id')
+        action_stats = rollups.values('action').annotate(
+            count=Sum('count')
         ).order_by('-count')[:10]
-        
-        # Recent activity
-        last_24h = timezone.now() - timedelta(days=1)
+
+        # Recent activity, at hour granularity: the current hour plus the 23 before it
+        last_24h = LogRollup.objects.filter(
+            bucket__gte=truncate_to_hour(timezone.now()) - timedelta(hours=23)
+        )
         recent_stats = {
-            'total_logs': Log.objects.count(),
-            'last_24h': Log.objects.filter(timestamp__gte=last_24h).count(),
-            'errors_last_24h': Log.objects.filter(
-                timestamp__gte=last_24h,
+            'total_logs': rollups.aggregate(total=Sum('count'))['total'] or 0,
+            'last_24h': last_24h.aggregate(total=Sum('count'))['total'] or 0,
+            'errors_last_24h': last_24h.filter(
                 level=Log.Level.ERROR
-            ).count(),
+            ).aggregate(total=Sum('count'))['total'] or 0,
         }
-        
-        return Response({
+
+        data = {
             'levels': LogStatsSerializer(level_stats, many=True).data,
             'top_actions': ActionStatsSerializer(action_stats, many=True).data,
             'recent_activity': recent_stats
-        })
\ No newline at end of file
+        }
+
+        if granularity:
+            series = rollups.annotate(
+                period=self.GRANULARITIES[granularity]('bucket')
+            ).values('period', 'level').annotate(
+                count=Sum('count')
+            ).order_by('period', 'level')
+            data['series'] = LogSeriesSerializer(series, many=True).data
+
+        return Response(data)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class NapkinDispenserConfig(AppConfig):
+    name = 'napkin_dispenser'
+    verbose_name = 'Napkin Dispenser'
+
+    def ready(self):
+        import napkin_dispenser.db  # noqa: F401 - connects the SQLite pragma hook
@@ -2,6 +2,8 @@
 ASGI config for napkin_dispenser project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The async endpoints under ``api/async/`` only avoid holding a thread per
+request when served from here, e.g. by uvicorn or gunicorn's UvicornWorker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
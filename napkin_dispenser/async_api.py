@@ -0,0 +1,71 @@
+import functools
+import json
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed
+
+from users.authentication import CachedJWTAuthentication
+
+_authentication = CachedJWTAuthentication()
+
+
+def json_response(data, status=status.HTTP_200_OK, **kwargs):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder, **kwargs)
+
+
+def client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+
+def request_json(request):
+    """Decoded JSON body, or None if it is missing or malformed"""
+    try:
+        return json.loads(request.body or b'null')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def async_api_view(methods, permission_classes=()):
+    """Plain Django async view with the API's JWT auth, permissions and error shapes.
+
+    DRF 3.14 views are sync-only, so the ``api/async/`` endpoints are
+    coroutines that authenticate with CachedJWTAuthentication.aauthenticate
+    (no SQL on a warm auth cache), check the same DRF permission classes
+    against ``request.user`` and answer errors the way DRF would.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                                     status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                result = await _authentication.aauthenticate(request)
+            except AuthenticationFailed as e:
+                return json_response({'detail': e.detail}, status=e.status_code,
+                                     headers={'WWW-Authenticate': 'Bearer'})
+            request.user = result[0] if result else AnonymousUser()
+
+            for permission_class in permission_classes:
+                if not permission_class().has_permission(request, None):
+                    if not request.user.is_authenticated:
+                        return json_response({'detail': 'Authentication credentials were not provided.'},
+                                             status=status.HTTP_401_UNAUTHORIZED,
+                                             headers={'WWW-Authenticate': 'Bearer'})
+                    return json_response({'detail': 'You do not have permission to perform this action.'},
+                                         status=status.HTTP_403_FORBIDDEN)
+            try:
+                return await view(request, *args, **kwargs)
+            except APIException as e:
+                return json_response(e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail},
+                                     status=e.status_code)
+        # Token auth, no cookies; csrf_exempt() itself would hide the coroutine on Django 4.2
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
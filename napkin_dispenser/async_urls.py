@@ -0,0 +1,13 @@
+"""Async (ASGI) variants of the hot endpoints, mounted under api/async/"""
+from django.urls import path
+
+from dispensers.async_views import inventory_stream, nearby
+from products.async_views import product_list
+from transactions.async_views import purchase
+
+urlpatterns = [
+    path('dispensers/nearby/', nearby, name='async-dispenser-nearby'),
+    path('dispensers/stream/', inventory_stream, name='async-dispenser-stream'),
+    path('products/', product_list, name='async-product-list'),
+    path('transactions/purchase/', purchase, name='async-transaction-purchase'),
+]
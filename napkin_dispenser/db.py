@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+READ_ONLY_ALIAS = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_only_request = ContextVar('read_only_request', default=False)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the SQLITE_PRAGMAS configured for this alias on every new connection"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}).get(connection.alias, {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def read_only_request():
+    """Route ORM reads made inside the block to the read-only alias"""
+    token = _read_only_request.set(True)
+    try:
+        yield
+    finally:
+        _read_only_request.reset(token)
+
+
+class ReadOnlyRequestMiddleware:
+    """Mark GET/HEAD/OPTIONS requests so their reads use the read-only connection.
+
+    Async-capable so it does not push ASGI requests through a thread; the
+    flag is a ContextVar, which sync_to_async carries into the ORM's thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS:
+            return self.get_response(request)
+        with read_only_request():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in SAFE_METHODS:
+            return await self.get_response(request)
+        with read_only_request():
+            return await self.get_response(request)
+
+
+class ReadOnlyRouter:
+    """Send reads of safe-method requests to the read-only alias, everything else to default.
+
+    Reads stay on default inside an atomic block so a request always sees
+    its own writes. Writes always go to default, including saves of
+    instances that were loaded through the read-only alias.
+    """
+
+    def _has_read_only_alias(self):
+        return READ_ONLY_ALIAS in settings.DATABASES
+
+    def db_for_read(self, model, **hints):
+        if (_read_only_request.get() and self._has_read_only_alias()
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return READ_ONLY_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        primary = {DEFAULT_DB_ALIAS, READ_ONLY_ALIAS}
+        if obj1._state.db in primary and obj2._state.db in primary:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == READ_ONLY_ALIAS:
+            return False
+        return None
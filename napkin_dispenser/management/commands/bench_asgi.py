@@ -0,0 +1,196 @@
+import asyncio
+import io
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Value
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from dispensers.models import DispenserProduct
+from dispensers.provisioning import provision_dispensers
+from logs.routers import LOGS_DB_ALIAS
+from logs.services import log_writer
+from napkin_dispenser.db import READ_ONLY_ALIAS
+from products.models import Product
+from users.models import User, Wallet
+from users.views import AuthViewSet
+
+ENDPOINTS = ('nearby', 'products', 'purchase')
+
+
+class Command(BaseCommand):
+    help = ('Load-test the sync (WSGI) and async (ASGI) nearby, product list and purchase '
+            'endpoints in-process against a throwaway test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, nargs='+', default=[8, 32, 128],
+                            help='Concurrent client connections to try')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and run')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='WSGI worker threads, like gunicorn --threads')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_names = {}
+        for alias in (DEFAULT_DB_ALIAS, LOGS_DB_ALIAS):
+            old_names[alias] = connections[alias].settings_dict['NAME']
+            connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if READ_ONLY_ALIAS in connections:
+            connections[READ_ONLY_ALIAS].creation.set_as_test_mirror(connections[DEFAULT_DB_ALIAS].settings_dict)
+        try:
+            # Stock and credits for every purchase: each run plus its warm-up, on both servers
+            requests = self._setup_fixtures((options['requests'] + 1) * len(options['connections']) * 2)
+            self.stdout.write(f'{"endpoint":<10}{"conns":>6}{"server":>8}{"req/s":>9}'
+                              f'{"p50":>10}{"p99":>10}{"errors":>8}')
+            for endpoint in options['endpoints']:
+                for concurrency in options['connections']:
+                    for server in ('wsgi', 'asgi'):
+                        result = self._run(server, requests[endpoint], concurrency,
+                                           options['requests'], options['workers'])
+                        self._report(endpoint, concurrency, server, result)
+        finally:
+            log_writer.stop()
+            for alias, old_name in old_names.items():
+                connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _setup_fixtures(self, purchases):
+        rng = random.Random(7)
+        products = [Product(product_name=f'Bench napkins {i}', credit_cost=1) for i in range(40)]
+        Product.objects.bulk_create(products)
+        provision_dispensers([{
+            'ble_beacon_id': f'bench-{i}',
+            'location_name': f'Bench {i}',
+            'gps_coordinates': {'lat': 24.6 + rng.random() * 0.3, 'lng': 46.6 + rng.random() * 0.3},
+        } for i in range(200)])
+        DispenserProduct.objects.update(product=products[0], max_capacity=purchases)
+        # A second UPDATE, so fill_ratio is computed against the new max_capacity
+        DispenserProduct.objects.update(current_inventory=purchases,
+                                        fill_ratio=DispenserProduct.fill_ratio_expression(Value(purchases)))
+        row = DispenserProduct.objects.select_related('dispenser').first()
+
+        user = User.objects.create_user(phone_number='+966500000000', user_type=User.UserType.CUSTOMER)
+        Wallet.objects.create(user=user, balance=purchases)
+        auth = f'Bearer {AuthViewSet()._generate_token(user)}'
+        body = json.dumps({
+            'dispenser_id': str(row.dispenser_id),
+            'product_id': str(products[0].product_id),
+            'row_number': row.row_number,
+        }).encode('utf-8')
+        return {
+            'nearby': ('GET', 'dispensers/nearby/', 'lat=24.75&lng=46.75&limit=10', auth, b''),
+            'products': ('GET', 'products/', '', auth, b''),
+            'purchase': ('POST', 'transactions/purchase/', '', auth, body),
+        }
+
+    def _run(self, server, request, concurrency, total, workers):
+        runner = self._run_wsgi if server == 'wsgi' else self._run_asgi
+        # One untimed pass warms caches and lazily built state
+        runner(request, 1, 1, workers)
+        started = time.perf_counter()
+        latencies, errors = runner(request, concurrency, total, workers)
+        return {'elapsed': time.perf_counter() - started, 'latencies': latencies, 'errors': errors}
+
+    def _run_wsgi(self, request, concurrency, total, workers):
+        """``concurrency`` clients share a pool of ``workers`` threads; waiting for one counts as latency"""
+        method, path, query, auth, body = request
+        handler = WSGIHandler()
+
+        def call():
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': f'/api/{path}', 'QUERY_STRING': query,
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1',
+                'HTTP_HOST': 'localhost', 'HTTP_AUTHORIZATION': auth,
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+            }
+            statuses = []
+            for chunk in handler(environ, lambda status, headers: statuses.append(status)):
+                pass
+            return int(statuses[0].split()[0])
+
+        latencies, errors = [], 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def client(count):
+                nonlocal errors
+                for _ in range(count):
+                    started = time.perf_counter()
+                    status = pool.submit(call).result()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    errors += status >= 400
+            with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                for future in [clients.submit(client, count) for count in _split(total, concurrency)]:
+                    future.result()
+        for connection in connections.all():
+            connection.close()
+        return latencies, errors
+
+    def _run_asgi(self, request, concurrency, total, workers):
+        """``concurrency`` clients on one event loop, like a single uvicorn worker"""
+        method, path, query, auth, body = request
+        handler = ASGIHandler()
+
+        async def call():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': method, 'scheme': 'http', 'path': f'/api/async/{path}', 'raw_path': b'',
+                'query_string': query.encode('ascii'), 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'authorization', auth.encode('ascii')),
+                            (b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('ascii'))],
+                'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            disconnect = asyncio.Event()
+            statuses = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            await handler(scope, receive, send)
+            disconnect.set()
+            return statuses[0]
+
+        async def client(count, latencies):
+            errors = 0
+            for _ in range(count):
+                started = time.perf_counter()
+                status = await call()
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += status >= 400
+            return errors
+
+        async def main():
+            latencies = []
+            errors = await asyncio.gather(*(client(count, latencies) for count in _split(total, concurrency)))
+            return latencies, sum(errors)
+
+        return asyncio.run(main())
+
+    def _report(self, endpoint, concurrency, server, result):
+        latencies = sorted(result['latencies'])
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f'{endpoint:<10}{concurrency:>6}{server:>8}{len(latencies) / result["elapsed"]:>9.0f}'
+            f'{quantiles[49]:>8.1f}ms{quantiles[98]:>8.1f}ms{result["errors"]:>8}'
+        )
+
+
+def _split(total, parts):
+    """``total`` requests spread over ``parts`` clients"""
+    return [total // parts + (i < total % parts) for i in range(parts)]
@@ -0,0 +1,137 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from dispensers.models import Dispenser, DispenserProduct
+from logs.routers import LOGS_DB_ALIAS
+from logs.services import log_writer
+from napkin_dispenser.db import READ_ONLY_ALIAS
+from products.models import Product
+from users.models import User, Wallet
+from users.views import AuthViewSet
+
+
+class Command(BaseCommand):
+    help = ('Compare read latency under concurrent purchases with default SQLite journaling and the '
+            'production profile (run with DB_PROFILE=production to use its full pragmas)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per profile')
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_names = {}
+        for alias in (DEFAULT_DB_ALIAS, LOGS_DB_ALIAS):
+            old_names[alias] = connections[alias].settings_dict['NAME']
+            connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if READ_ONLY_ALIAS in connections:
+            connections[READ_ONLY_ALIAS].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            payload = self._setup_fixtures()
+            results = {}
+            profiles = (
+                ('delete', {'default': {'journal_mode': 'DELETE'}}, 5),
+                ('wal', settings.SQLITE_PRAGMAS or {'default': {'journal_mode': 'WAL'}}, 20),
+            )
+            for name, pragmas, timeout in profiles:
+                connections.close_all()
+                options_ = {**connection.settings_dict['OPTIONS'], 'timeout': timeout}
+                with override_settings(SQLITE_PRAGMAS=pragmas, LOG_WRITER={'BUFFERED': False}):
+                    connection.settings_dict['OPTIONS'] = options_
+                    connection.ensure_connection()
+                    results[name] = self._run(payload, options['writers'], options['readers'], options['duration'])
+                connections.close_all()
+            self._report(results)
+        finally:
+            log_writer.stop()
+            for alias, old_name in old_names.items():
+                connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _setup_fixtures(self):
+        product = Product.objects.create(product_name='Bench napkins', credit_cost=1)
+        dispenser = Dispenser.objects.create(
+            ble_beacon_id='bench-beacon',
+            location_name='Bench',
+            gps_coordinates={'lat': 24.7136, 'lng': 46.6753},
+        )
+        DispenserProduct.objects.filter(dispenser=dispenser, row_number=1).update(
+            product=product, current_inventory=10 ** 9, max_capacity=10 ** 9
+        )
+        return {
+            'dispenser_id': str(dispenser.dispenser_id),
+            'product_id': str(product.product_id),
+            'row_number': 1,
+        }
+
+    def _client_for(self, phone_number):
+        user, created = User.objects.get_or_create(phone_number=phone_number)
+        if created:
+            Wallet.objects.create(user=user, balance=10 ** 9)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AuthViewSet()._generate_token(user)}')
+        return client
+
+    def _run(self, payload, writers, readers, duration):
+        clients = [self._client_for(f'+9665200000{i:02d}') for i in range(max(writers, readers))]
+        stop = threading.Event()
+        latencies = []
+        read_errors = []
+        purchases = []
+
+        def write(client):
+            try:
+                while not stop.is_set():
+                    purchases.append(client.post('/api/transactions/purchase/', payload, format='json').status_code)
+            finally:
+                connection.close()
+
+        def read(client):
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    response = client.get('/api/transactions/', {'page_size': 20})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        read_errors.append(response.status_code)
+            except Exception as e:
+                read_errors.append(type(e).__name__)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(clients[i],)) for i in range(writers)]
+        threads += [threading.Thread(target=read, args=(clients[i],)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'latencies': latencies,
+            'read_errors': len(read_errors),
+            'purchases': purchases.count(201),
+            'write_errors': len(purchases) - purchases.count(201),
+            'duration': duration,
+        }
+
+    def _report(self, results):
+        self.stdout.write(f'{"profile":<10}{"reads":>8}{"p50":>10}{"p99":>10}{"max":>10}'
+                          f'{"rd err":>8}{"sold/s":>8}{"wr err":>8}')
+        for name, result in results.items():
+            latencies = sorted(result['latencies']) or [0.0, 0.0]
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f'{name:<10}{len(latencies):>8}{quantiles[49]:>8.2f}ms{quantiles[98]:>8.2f}ms'
+                f'{latencies[-1]:>8.2f}ms{result["read_errors"]:>8}'
+                f'{result["purchases"] / result["duration"]:>8.0f}{result["write_errors"]:>8}'
+            )
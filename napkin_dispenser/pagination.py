@@ -0,0 +1,38 @@
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class TimestampCursorPagination(CursorPagination):
+    """Keyset pagination over (timestamp, id), newest first.
+
+    Pages are fetched with ``WHERE timestamp < <cursor>`` on a composite
+    (timestamp, id) index instead of OFFSET, and no COUNT(*) is issued, so
+    every page costs the same however deep it is. Rows sharing the cursor's
+    timestamp are skipped with a small offset that DRF encodes in the cursor.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def decode_cursor(self, request):
+        """A malformed cursor is a bad request, not a missing page or a database error"""
+        try:
+            cursor = super().decode_cursor(request)
+        except NotFound:
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+        if cursor is not None and cursor.position is not None:
+            try:
+                valid = parse_datetime(cursor.position) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+        return cursor
+
+
+class FillRatioCursorPagination(CursorPagination):
+    """Keyset pagination over (fill_ratio, id), emptiest rows first"""
+    ordering = ('fill_ratio', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
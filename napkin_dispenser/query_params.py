@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _value(request, name):
+    return request.query_params.get(name) or None
+
+
+def parse_datetime_param(request, name):
+    """Aware datetime from an ISO date (midnight) or datetime query parameter, or None if absent"""
+    value = _value(request, name)
+    if value is None:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            parsed = datetime.combine(day, time.min)
+    except ValueError:
+        # Malformed, or well formed but out of range (2024-02-30)
+        raise ValidationError({name: 'Expected an ISO date or datetime'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_uuid_param(request, name):
+    """UUID query parameter, or None if absent"""
+    value = _value(request, name)
+    if value is None:
+        return None
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        raise ValidationError({name: 'Expected a UUID'})
+
+
+def parse_choice_param(request, name, choices):
+    """Query parameter that must be one of ``choices``, or None if absent"""
+    value = _value(request, name)
+    if value is not None and value not in choices:
+        raise ValidationError({name: f'Must be one of {", ".join(choices)}'})
+    return value
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
+    'napkin_dispenser',
     'users',
     'products',
     'dispensers',
@@ -49,7 +50,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'napkin_dispenser.middleware.StaticFilesMiddleware',
+    'napkin_dispenser.db.ReadOnlyRequestMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,13 +84,81 @@ WSGI_APPLICATION = 'napkin_dispenser.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DB_PROFILE=development (the default) keeps SQLite's defaults and a single
+# connection. Deployments set DB_PROFILE=production, which enables WAL
+# journaling and tuned pragmas, plus a read-only connection that serves GET
+# requests.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Seconds a connection waits for the write lock before "database is locked"
+            'timeout': 20,
+        },
+        # File-backed test database so background threads (log writer,
+        # benchmarks) can open their own connections to it
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Audit logs and their rollups (see logs.routers.LogsRouter)
+    'logs': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'logs.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'TEST': {
+            'NAME': BASE_DIR / 'test_logs.sqlite3',
+        },
+    },
 }
 
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    SQLITE_PRAGMAS = {
+        'default': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,  # ms
+            'cache_size': -20000,  # KiB
+            'mmap_size': 268435456,  # bytes
+            'temp_store': 'MEMORY',
+        },
+        'logs': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,
+            'cache_size': -20000,
+            'temp_store': 'MEMORY',
+        },
+        'replica': {
+            'busy_timeout': 20000,
+            'cache_size': -20000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+    }
+
+DATABASE_ROUTERS = [
+    'logs.routers.LogsRouter',
+    'napkin_dispenser.db.ReadOnlyRouter',
+]
+
 #DATABASES = {
 #    'default': {
 #        'ENGINE': 'django.db.backends.postgresql',
@@ -146,6 +216,14 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 #STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Cache shared by all workers on the host (catalog versions)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -163,13 +241,41 @@ CORS_ALLOW_ALL_ORIGINS = False
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'users.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Reverse proxies in front of the app that append to X-Forwarded-For.
+    # Throttles key on the address the outermost of them saw; with 0 the
+    # header is ignored and REMOTE_ADDR is used, so clients cannot pick
+    # their own address.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Password hashing (users.hashing). Stored hashes with a different cost are
+# rehashed on the next successful login.
+BCRYPT = {
+    'ROUNDS': 12,
+    'MAX_WORKERS': None,  # defaults to the CPU count
+    'MAX_PENDING': 32,
+    'QUEUE_TIMEOUT': 2.0,  # seconds before a 503 when hashing is saturated
+}
+
+# Token-bucket throttles on login and register (users.throttling), per client
+# IP and per phone number/email, stored in the shared cache. Rejections are
+# counted per bucket in the log rollups (e.g. LOGIN_IP_THROTTLED), not logged.
+AUTH_THROTTLE = {
+    'ENABLED': True,
+    'BUCKETS': {
+        'login_ip': {'CAPACITY': 30, 'REFILL_PER_MINUTE': 10},
+        'login_identity': {'CAPACITY': 10, 'REFILL_PER_MINUTE': 2},
+        'register_ip': {'CAPACITY': 10, 'REFILL_PER_MINUTE': 2},
+        'register_identity': {'CAPACITY': 3, 'REFILL_PER_MINUTE': 1},
+    },
+    'FLUSH_INTERVAL': 60,  # seconds
 }
 
 # JWT Settings
@@ -177,5 +283,78 @@ JWT_SECRET_KEY = SECRET_KEY
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_DELTA = timedelta(days=7)
 
+# Per-process cache of user auth state used by CachedJWTAuthentication.
+# TTL bounds how long a deactivation or token revocation made in another
+# worker can take to be enforced.
+JWT_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,  # seconds
+}
+
 # Custom User Model
-AUTH_USER_MODEL = 'users.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'users.User'
+
+# Audit log writer (logs.services.LogWriter)
+LOG_WRITER = {
+    'BUFFERED': True,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,  # seconds
+    'MAX_QUEUE_SIZE': 10000,
+    'STRICT_LEVELS': ['security'],
+}
+
+# Log retention (logs.archive, manage.py archive_logs / read_log_archive)
+LOG_ARCHIVE = {
+    'DIR': BASE_DIR / 'log_archive',
+    'RETENTION_DAYS': 90,
+    'PART_SIZE': 100000,  # rows per gzip NDJSON file
+    'CHUNK_SIZE': 2000,  # rows fetched per query
+    'DELETE_BATCH_SIZE': 1000,  # rows removed per DELETE
+}
+
+# In-memory spatial index behind DispenserViewSet.nearby (dispensers.geo)
+DISPENSER_GEO_INDEX = {
+    'CELL_SIZE': 0.05,  # degrees
+    'REBUILD_INTERVAL': 300,  # seconds; picks up changes made by other workers
+    'DEFAULT_LIMIT': 20,
+    'MAX_LIMIT': 100,
+    'MAX_RADIUS_KM': 1000,
+}
+
+# Server-sent inventory events behind api/async/dispensers/stream/ (dispensers.events)
+INVENTORY_STREAM = {
+    'BUFFER_SIZE': 1000,  # events kept per process for Last-Event-ID resumes
+    'POLL_INTERVAL': 0.5,  # seconds between reads of the shared events table
+    'RETENTION': 24 * 60 * 60,  # seconds; prune_inventory_events deletes older events
+    'HEARTBEAT_INTERVAL': 15,  # seconds
+    'MAX_DURATION': 3600,  # seconds before a stream is closed and resumed
+    'MAX_SUBSCRIBERS': 1000,  # open streams per process
+}
+
+# Stockout forecasts behind DispenserViewSet.forecast (dispensers.forecasting)
+DISPENSER_FORECAST = {
+    'HISTORY_DAYS': 28,
+    'HORIZON_HOURS': 7 * 24,
+    'SHRINKAGE': 20,  # units a row must sell before its own weekly profile dominates
+}
+
+# Restock route planning behind DispenserViewSet.restock_routes (dispensers.routing)
+ROUTE_PLANNER = {
+    'URGENCY_WEIGHT': 1.0,  # 0 plans the shortest routes regardless of urgency
+    'MAX_STOPS': 1000,
+    'MAX_CREWS': 20,
+}
+
+# Idempotency-Key handling for purchase and add_credits (transactions.idempotency)
+IDEMPOTENCY = {
+    'TTL': 24 * 60 * 60,  # seconds a stored response can be replayed
+    'CACHE_SIZE': 10000,  # completed responses kept in memory per process
+    'WAIT_TIMEOUT': 10,  # seconds a concurrent duplicate waits for the original
+    'LEASE': 60,  # seconds before a key left pending by a dead worker can be taken over
+}
+
+# Per-process response cache for catalog endpoints (products.catalog)
+CATALOG_CACHE = {
+    'MAX_ENTRIES': 1000,
+    'TTL': 300,  # seconds
+}
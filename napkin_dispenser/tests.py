@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.db import connections, router
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from logs.models import Log
+from products.models import Product
+from .db import READ_ONLY_ALIAS, ReadOnlyRequestMiddleware, ReadOnlyRouter, read_only_request
+
+
+@mock.patch.object(ReadOnlyRouter, '_has_read_only_alias', return_value=True)
+class ReadOnlyRouterTests(SimpleTestCase):
+    def test_reads_of_read_only_requests_use_the_replica(self, _):
+        self.assertEqual(Product.objects.all().db, 'default')
+        with read_only_request():
+            self.assertEqual(Product.objects.all().db, READ_ONLY_ALIAS)
+            # Logs keep their own database
+            self.assertEqual(Log.objects.all().db, 'logs')
+
+    def test_writes_stay_on_default(self, _):
+        with read_only_request():
+            product = Product(product_name='Napkins', credit_cost=1)
+            product._state.db = READ_ONLY_ALIAS
+            self.assertEqual(router.db_for_write(Product, instance=product), 'default')
+            other = Product(product_name='Wipes', credit_cost=1)
+            other._state.db = 'default'
+            self.assertTrue(router.allow_relation(product, other))
+        self.assertFalse(router.allow_migrate_model(READ_ONLY_ALIAS, Product))
+
+    def test_reads_inside_an_atomic_block_stay_on_default(self, _):
+        with read_only_request(), mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_no_replica_configured(self, has_read_only_alias):
+        has_read_only_alias.return_value = False
+        with read_only_request():
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_middleware_marks_only_safe_methods(self, _):
+        middleware = ReadOnlyRequestMiddleware(lambda request: Product.objects.all().db)
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.get('/')), READ_ONLY_ALIAS)
+        self.assertEqual(middleware(factory.head('/')), READ_ONLY_ALIAS)
+        self.assertEqual(middleware(factory.post('/')), 'default')
+        self.assertEqual(middleware(factory.delete('/')), 'default')
+
+
+class SqlitePragmaTests(SimpleTestCase):
+    def _pragmas(self, *names):
+        connection = connections.create_connection('default')
+        try:
+            with connection.cursor() as cursor:
+                values = {}
+                for name in names:
+                    cursor.execute(f'PRAGMA {name}')
+                    values[name] = cursor.fetchone()[0]
+                return values
+        finally:
+            connection.close()
+
+    @override_settings(SQLITE_PRAGMAS={'default': {'cache_size': -1234, 'busy_timeout': 4321, 'temp_store': 'MEMORY'}})
+    def test_pragmas_are_applied_on_connect(self):
+        # temp_store reads back as 2 for MEMORY
+        self.assertEqual(self._pragmas('cache_size', 'busy_timeout', 'temp_store'),
+                         {'cache_size': -1234, 'busy_timeout': 4321, 'temp_store': 2})
+
+    @override_settings(SQLITE_PRAGMAS={'logs': {'cache_size': -1234}})
+    def test_pragmas_of_other_aliases_are_not_applied(self):
+        self.assertNotEqual(self._pragmas('cache_size')['cache_size'], -1234)
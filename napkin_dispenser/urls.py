@@ -35,5 +35,6 @@ router.register(r'logs', LogViewSet, basename='log')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/async/', include('napkin_dispenser.async_urls')),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
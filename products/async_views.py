@@ -0,0 +1,56 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from napkin_dispenser.async_api import async_api_view, json_response
+from .catalog import catalog_digest, count_not_modified, get_catalog_version, get_response_cache
+from .models import Product
+from .serializers import ProductSerializer
+
+
+@async_api_view(['GET'])
+async def product_list(request):
+    """Async ProductViewSet.list: same pages, cache and ETags as the sync endpoint"""
+    # The version lives in the shared (file) cache, which is blocking I/O
+    version = await sync_to_async(get_catalog_version)('products')
+    digest = catalog_digest('products', version, request, 'json')
+    etag = f'"{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        count_not_modified()
+        return HttpResponseNotModified(headers=headers)
+
+    data = get_response_cache().get(digest)
+    if data is None:
+        if request.user.is_authenticated and request.user.is_admin:
+            products = Product.objects.all()
+        else:
+            products = Product.objects.filter(is_active=True)
+
+        page_size = api_settings.PAGE_SIZE
+        try:
+            page = int(request.GET.get('page', 1))
+            if page < 1:
+                raise ValueError
+        except ValueError:
+            return json_response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+        count = await products.acount()
+        if page > 1 and (page - 1) * page_size >= count:
+            return json_response({'detail': 'Invalid page.'}, status=status.HTTP_404_NOT_FOUND)
+
+        offset = (page - 1) * page_size
+        results = [product async for product in products[offset:offset + page_size]]
+        url = request.build_absolute_uri()
+        data = {
+            'count': count,
+            'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+            'previous': (None if page == 1 else remove_query_param(url, 'page') if page == 2
+                         else replace_query_param(url, 'page', page - 1)),
+            'results': ProductSerializer(results, many=True).data,
+        }
+        get_response_cache().set(digest, data)
+    return json_response(data, headers=headers)
@@ -0,0 +1,134 @@
+import functools
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from napkin_dispenser.cache import TTLCache
+
+DEFAULTS = {
+    'MAX_ENTRIES': 1000,
+    'TTL': 300,  # seconds
+}
+
+_responses = None
+_not_modified = 0
+_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CATALOG_CACHE', {})}
+
+
+def get_response_cache():
+    global _responses
+    if _responses is None:
+        config = get_config()
+        _responses = TTLCache(maxsize=config['MAX_ENTRIES'], ttl=config['TTL'])
+    return _responses
+
+
+def _version_key(namespace):
+    return f'catalog:version:{namespace}'
+
+
+def get_catalog_version(namespace):
+    """Current version token of a catalog namespace ('products' or 'dispensers')"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(namespace), version, timeout=None):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def bump_catalog_version(*namespaces):
+    """Invalidate cached responses and ETags of the given namespaces.
+
+    Versions are random tokens rather than integers so two workers bumping
+    at once through a non-atomic cache backend can never end on a version
+    that was already handed out.
+    """
+    for namespace in namespaces:
+        cache.set(_version_key(namespace), uuid.uuid4().hex, timeout=None)
+
+
+def catalog_digest(namespace, version, request, renderer):
+    """Cache key and ETag body of a catalog response.
+
+    Admins get their own entries since they may see inactive products.
+    """
+    variant = 'admin' if request.user.is_authenticated and request.user.is_admin else 'public'
+    return hashlib.sha1(
+        f'{namespace}:{version}:{variant}:{renderer}:{request.get_full_path()}'.encode('utf-8')
+    ).hexdigest()
+
+
+def count_not_modified():
+    global _not_modified
+    with _lock:
+        _not_modified += 1
+
+
+def cache_stats():
+    stats = get_response_cache().stats()
+    stats['not_modified'] = _not_modified
+    return stats
+
+
+def catalog_cached(namespace, live=None):
+    """Serve a read-only viewset action from the catalog response cache.
+
+    Responses carry a strong ETag derived from the namespace version and
+    the request; a matching If-None-Match is answered with 304 before the
+    view (and the ORM) runs.
+
+    ``live(data)`` may return ``(data, token)``: a copy of the cached data
+    with fields that change too often to be versioned (live inventory)
+    filled in, and a token of those values that becomes part of the ETag.
+    The 304 check then happens after it.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            renderer = request.accepted_renderer.format
+            digest = catalog_digest(namespace, get_catalog_version(namespace), request, renderer)
+
+            if live is None and f'"{digest}"' in parse_etags(request.headers.get('If-None-Match', '')):
+                count_not_modified()
+                return _not_modified_response(f'"{digest}"')
+
+            data = get_response_cache().get(digest)
+            if data is None:
+                response = view(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                get_response_cache().set(digest, data)
+
+            etag = f'"{digest}"'
+            if live is not None:
+                data, token = live(data)
+                etag = f'"{hashlib.sha1(f"{digest}:{token}".encode("utf-8")).hexdigest()}"'
+                if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                    count_not_modified()
+                    return _not_modified_response(etag)
+
+            response = Response(data)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _not_modified_response(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
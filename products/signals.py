@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from dispensers.models import Dispenser, DispenserProduct
+from .catalog import bump_catalog_version
+from .models import Product
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_catalog(sender, **kwargs):
+    """Products are embedded in dispenser rows, so both namespaces change"""
+    transaction.on_commit(lambda: bump_catalog_version('products', 'dispensers'))
+
+@receiver(post_save, sender=Dispenser)
+@receiver(post_delete, sender=Dispenser)
+@receiver(post_delete, sender=DispenserProduct)
+def invalidate_dispenser_catalog(sender, **kwargs):
+    transaction.on_commit(lambda: bump_catalog_version('dispensers'))
+
+# Filled in per request by dispensers.views.live_inventory, so not versioned
+LIVE_ROW_FIELDS = {'current_inventory', 'fill_ratio', 'updated_at'}
+
+@receiver(post_save, sender=DispenserProduct)
+def invalidate_dispenser_row(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= LIVE_ROW_FIELDS:
+        return
+    transaction.on_commit(lambda: bump_catalog_version('dispensers'))
@@ -1,3 +1,86 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from dispensers.models import Dispenser, DispenserProduct
+from logs.testing import AuditLogTestMixin
+from transactions.services import purchase
+from users.models import User, Wallet
+from .catalog import get_catalog_version, get_response_cache
+from .models import Product
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_response_cache().clear()
+        self.admin = User.objects.create_user(phone_number='+966500000001', user_type='admin')
+        self.customer = User.objects.create_user(phone_number='+966500000002')
+        self.product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        Product.objects.create(product_name='Retired', credit_cost=1, is_active=False)
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_matching_etag_is_not_modified(self):
+        client = self._client(self.customer)
+        response = client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        stats = self._client(self.admin).get('/api/products/cache_stats/').data
+        self.assertGreaterEqual(stats['not_modified'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_admin_and_public_variants(self):
+        public = self._client(self.customer).get('/api/products/')
+        admin = self._client(self.admin).get('/api/products/')
+        self.assertEqual(public.data['count'], 1)
+        self.assertEqual(admin.data['count'], 2)
+        self.assertNotEqual(public['ETag'], admin['ETag'])
+
+    def test_product_changes_invalidate(self):
+        client = self._client(self.customer)
+        etag = client.get('/api/products/')['ETag']
+        self.product.product_name = 'Soft napkins'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['product_name'], 'Soft napkins')
+
+    def test_cache_stats_is_admin_only(self):
+        self.assertEqual(self._client(self.customer).get('/api/products/cache_stats/').status_code, 403)
+
+    def test_sales_keep_the_dispenser_catalog_cached(self):
+        dispenser = Dispenser.objects.create(ble_beacon_id='beacon', location_name='Lobby',
+                                             gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        DispenserProduct.objects.filter(dispenser=dispenser, row_number=1).update(
+            product=self.product, current_inventory=5, max_capacity=5)
+        Wallet.objects.create(user=self.customer, balance=5)
+        client = self._client(self.customer)
+        url = f'/api/dispensers/{dispenser.dispenser_id}/'
+        etag = client.get(url)['ETag']
+        version = get_catalog_version('dispensers')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            purchase(self.customer, dispenser.dispenser_id, 1, self.product.product_id)
+        self.assertEqual(get_catalog_version('dispensers'), version)
+        # Served from the cache; only the live inventory is read
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        row = next(row for row in response.data['rows'] if row['row_number'] == 1)
+        self.assertEqual(row['current_inventory'], 4)
+
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        listed = client.get('/api/dispensers/').data['results'][0]
+        self.assertEqual(next(row for row in listed['rows'] if row['row_number'] == 1)['current_inventory'], 4)
@@ -1,6 +1,7 @@
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from .catalog import cache_stats, catalog_cached
 from .models import Product
 from .serializers import ProductSerializer
 from users.permissions import IsAdmin
@@ -12,16 +13,33 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdmin()]
-        return [permissions.AllowAny()]
+        if self.action in ['list', 'retrieve', 'active']:
+            return [permissions.AllowAny()]
+        # Extra actions use the permission_classes given to @action
+        return super().get_permissions()
     
     def get_queryset(self):
         if self.request.user.is_authenticated and self.request.user.is_admin:
             return Product.objects.all()
         return Product.objects.filter(is_active=True)
     
+    @catalog_cached('products')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_cached('products')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
+    @catalog_cached('products')
     def active(self, request):
         """Get only active products (public endpoint)"""
         products = Product.objects.filter(is_active=True)
         serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def cache_stats(self, request):
+        """Hit/miss counters of this worker's catalog response cache"""
+        return Response(cache_stats())
\ No newline at end of file
@@ -0,0 +1,52 @@
+from asgiref.sync import sync_to_async
+
+from logs.services import aaudit_log
+from napkin_dispenser.async_api import async_api_view, client_ip, json_response, request_json
+from users.permissions import IsCustomer
+from .idempotency import HEADER
+from .outcomes import completed_purchase, failed_purchase, invalid_purchase, refused_purchase
+from .serializers import TransactionCreateSerializer
+from .services import PurchaseError, purchase as purchase_engine
+from .views import TransactionViewSet
+
+_sync_purchase = TransactionViewSet.as_view({'post': 'purchase'})
+
+
+def _idempotent_purchase(request):
+    response = _sync_purchase(request)
+    response.render()
+    return response
+
+
+@async_api_view(['POST'], permission_classes=[IsCustomer])
+async def purchase(request):
+    """Async TransactionViewSet.purchase.
+
+    Validation and logging stay on the event loop and the purchase engine
+    runs through sync_to_async, since transactions need a sync connection.
+    Requests carrying an Idempotency-Key go to the sync view in a thread so
+    their replay semantics are exactly those of the sync endpoint.
+    """
+    if request.headers.get(HEADER):
+        return await sync_to_async(_idempotent_purchase)(request)
+
+    user = request.user
+    ip_address = client_ip(request)
+    payload = request_json(request)
+    serializer = TransactionCreateSerializer(data=payload if isinstance(payload, dict) else {})
+    if not serializer.is_valid():
+        outcome = invalid_purchase(user, ip_address, payload, serializer.errors)
+    else:
+        data = serializer.validated_data
+        try:
+            result = await sync_to_async(purchase_engine)(user, data['dispenser_id'], data['row_number'],
+                                                          data['product_id'])
+        except PurchaseError as e:
+            outcome = refused_purchase(user, ip_address, e)
+        except Exception as e:
+            outcome = failed_purchase(user, ip_address, payload, e)
+        else:
+            outcome = completed_purchase(user, ip_address, result)
+
+    await aaudit_log(**outcome.log)
+    return json_response(outcome.body, status=outcome.status)
@@ -0,0 +1,175 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from logs.services import audit_logs_on_commit
+from napkin_dispenser.cache import TTLCache
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+DEFAULTS = {
+    'TTL': 24 * 60 * 60,  # seconds a stored response can be replayed
+    'CACHE_SIZE': 10000,  # completed responses kept in memory per process
+    'WAIT_TIMEOUT': 10,  # seconds a duplicate waits for the original request
+    'LEASE': 60,  # seconds before a key left pending (worker died) can be taken over
+    'POLL_INTERVAL': 0.05,
+}
+
+_responses = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def get_response_cache():
+    """In-memory front for completed responses: (request_hash, status, body)"""
+    global _responses
+    if _responses is None:
+        config = get_config()
+        _responses = TTLCache(maxsize=config['CACHE_SIZE'], ttl=config['TTL'])
+    return _responses
+
+
+def _request_hash(request, kwargs):
+    body = json.dumps([request.data, kwargs], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def _replay(request_hash, stored_hash, response_status, response_body):
+    if request_hash != stored_hash:
+        return Response({'error': f'{HEADER} was already used with a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(response_body, status=response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lease_expired(record, config):
+    return (record.status == IdempotencyKey.Status.PENDING
+            and record.created_at <= timezone.now() - timedelta(seconds=config['LEASE']))
+
+
+def _claim(user, endpoint, key, request_hash, config):
+    """Insert a pending record for the key, or return the existing one"""
+    expires_at = timezone.now() + timedelta(seconds=config['TTL'])
+    try:
+        with transaction.atomic():
+            return True, IdempotencyKey.objects.create(
+                user=user, endpoint=endpoint, key=key,
+                request_hash=request_hash, expires_at=expires_at,
+            )
+    except IntegrityError:
+        pass
+
+    existing = IdempotencyKey.objects.filter(user=user, endpoint=endpoint, key=key).first()
+    if existing is not None and (existing.expires_at <= timezone.now() or _lease_expired(existing, config)):
+        # Only one of several requests taking the record over deletes it; the others find the new one
+        IdempotencyKey.objects.filter(pk=existing.pk, status=existing.status).delete()
+        return _claim(user, endpoint, key, request_hash, config)
+    return False, existing
+
+
+def _wait_for_completion(record, config):
+    """The completed record, None once the key can be claimed again, or the pending record on timeout"""
+    deadline = time.monotonic() + config['WAIT_TIMEOUT']
+    while time.monotonic() < deadline:
+        time.sleep(config['POLL_INTERVAL'])
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None or _lease_expired(record, config):
+            return None
+        if record.status == IdempotencyKey.Status.COMPLETED:
+            return record
+    return record
+
+
+def idempotent(endpoint):
+    """Make a viewset action replay its first response for a repeated Idempotency-Key.
+
+    The first request with a given key runs normally and its response is
+    stored in the database (and in a per-process cache) for
+    ``IDEMPOTENCY['TTL']`` seconds. Retries get the stored response back
+    without running the action again; a duplicate arriving while the first
+    request is still running waits for it to finish. Server errors are not
+    stored, so those requests can be retried.
+
+    A key left pending by a worker that died can be taken over once it is
+    ``IDEMPOTENCY['LEASE']`` seconds old. The action's writes commit together
+    with its stored response, so a request whose key was taken over rolls
+    back instead of running the action twice; its audit_log entries are
+    held until the commit and dropped with the rollback.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({'error': f'{HEADER} must be at most 255 characters'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            config = get_config()
+            user = request.user
+            request_hash = _request_hash(request, kwargs)
+            cache_key = (str(user.pk), endpoint, key)
+
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                return _replay(request_hash, *cached)
+
+            while True:
+                claimed, record = _claim(user, endpoint, key, request_hash, config)
+                if claimed:
+                    break
+                if record is not None and record.status == IdempotencyKey.Status.PENDING:
+                    record = _wait_for_completion(record, config)
+                    if record is None:
+                        # The first attempt failed and released the key, or its lease ran out
+                        continue
+                    if record.status == IdempotencyKey.Status.PENDING:
+                        return Response({'error': f'A request with this {HEADER} is still being processed'},
+                                        status=status.HTTP_409_CONFLICT)
+                if record is not None:
+                    get_response_cache().set(cache_key, (record.request_hash, record.response_status,
+                                                         record.response_body))
+                    return _replay(request_hash, record.request_hash,
+                                   record.response_status, record.response_body)
+
+            completed = False
+            try:
+                with audit_logs_on_commit(), transaction.atomic():
+                    response = view(self, request, *args, **kwargs)
+                    if response.status_code < 500:
+                        completed = IdempotencyKey.objects.filter(
+                            pk=record.pk, status=IdempotencyKey.Status.PENDING,
+                        ).update(status=IdempotencyKey.Status.COMPLETED,
+                                 response_status=response.status_code, response_body=response.data)
+                        if not completed:
+                            # Our lease ran out and a retry took the key over; it owns the action now
+                            transaction.set_rollback(True)
+            except Exception:
+                record.delete()
+                raise
+
+            if response.status_code >= 500:
+                record.delete()
+                return response
+            if not completed:
+                return Response({'error': f'A request with this {HEADER} is still being processed'},
+                                status=status.HTTP_409_CONFLICT)
+
+            get_response_cache().set(cache_key, (request_hash, response.status_code, response.data))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,139 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from dispensers.models import Dispenser, DispenserProduct
+from logs.models import Log
+from logs.routers import LOGS_DB_ALIAS
+from logs.services import log_writer
+from products.models import Product
+from users.models import User, Wallet
+from users.views import AuthViewSet
+
+
+class Command(BaseCommand):
+    help = 'Benchmark /api/transactions/purchase/ latency against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent buyers for the throughput run (0 to skip)')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_names = {}
+        for alias in (DEFAULT_DB_ALIAS, LOGS_DB_ALIAS):
+            old_names[alias] = connections[alias].settings_dict['NAME']
+            connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            client, payload = self._setup_fixtures(options['requests'] + options['warmup'])
+            results = {}
+            for mode, buffered in (('sync', False), ('buffered', True)):
+                with override_settings(LOG_WRITER={'BUFFERED': buffered}):
+                    results[mode] = self._run(client, payload, options['requests'], options['warmup'])
+                    log_writer.flush()
+            self._report(results)
+            if options['threads']:
+                self._run_concurrent(payload, options['threads'], options['requests'])
+        finally:
+            log_writer.stop()
+            for alias, old_name in old_names.items():
+                connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _setup_fixtures(self, purchases):
+        total = purchases * 2
+        product = Product.objects.create(product_name='Bench napkins', credit_cost=1)
+        dispenser = Dispenser.objects.create(
+            ble_beacon_id='bench-beacon',
+            location_name='Bench',
+            gps_coordinates={'lat': 24.7136, 'lng': 46.6753},
+        )
+        DispenserProduct.objects.filter(dispenser=dispenser, row_number=1).update(
+            product=product, current_inventory=total, max_capacity=total
+        )
+        client = self._client_for('+966500000000', total)
+        payload = {
+            'dispenser_id': str(dispenser.dispenser_id),
+            'product_id': str(product.product_id),
+            'row_number': 1,
+        }
+        return client, payload
+
+    def _client_for(self, phone_number, balance):
+        user = User.objects.create_user(phone_number=phone_number, password='bench-pass')
+        Wallet.objects.create(user=user, balance=balance)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AuthViewSet()._generate_token(user)}')
+        return client
+
+    def _run_concurrent(self, payload, threads, requests):
+        """Race buyers for one row holding fewer units than they try to buy"""
+        row = DispenserProduct.objects.get(dispenser_id=payload['dispenser_id'], row_number=1)
+        inventory = requests // 2
+        row.current_inventory = inventory
+        row.save()
+        per_thread = requests // threads
+        clients = [self._client_for(f'+9665100000{i:02d}', per_thread) for i in range(threads)]
+        statuses = []
+
+        def buy(client):
+            try:
+                for _ in range(per_thread):
+                    statuses.append(client.post('/api/transactions/purchase/', payload, format='json').status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(client,)) for client in clients]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        sold = statuses.count(201)
+        row.refresh_from_db()
+        balances = Wallet.objects.filter(user__phone_number__startswith='+9665100000') \
+            .values_list('balance', flat=True)
+        self.stdout.write(
+            f'{threads} threads: {len(statuses)} attempts, {sold} sold in {elapsed:.2f}s '
+            f'({sold / elapsed:.0f} purchases/s, {len(statuses) / elapsed:.0f} requests/s)'
+        )
+        consistent = (row.current_inventory == inventory - sold >= 0
+                      and sum(balances) == threads * per_thread - sold
+                      and min(balances) >= 0)
+        self.stdout.write(f'Inventory {row.current_inventory}/{inventory}, '
+                          f'no oversell or negative balance: {consistent}')
+
+    def _run(self, client, payload, requests, warmup):
+        for _ in range(warmup):
+            client.post('/api/transactions/purchase/', payload, format='json')
+
+        latencies = []
+        errors = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.post('/api/transactions/purchase/', payload, format='json')
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 201:
+                errors += 1
+        return {'latencies': latencies, 'errors': errors}
+
+    def _report(self, results):
+        self.stdout.write(f'{"mode":<10}{"mean":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"errors":>8}')
+        for mode, result in results.items():
+            latencies = sorted(result['latencies'])
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'{mode:<10}{statistics.mean(latencies):>9.2f}ms{quantiles[49]:>8.2f}ms'
+                f'{quantiles[94]:>8.2f}ms{quantiles[98]:>8.2f}ms{result["errors"]:>8}'
+            )
+        speedup = statistics.mean(results['sync']['latencies']) / statistics.mean(results['buffered']['latencies'])
+        self.stdout.write(f'Buffered logging mean speedup: {speedup:.2f}x ({Log.objects.count()} log rows written)')
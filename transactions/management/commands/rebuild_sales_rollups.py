@@ -0,0 +1,55 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from transactions.models import SalesRollup, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily SalesRollup counters from the transactions table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Local date (YYYY-MM-DD) to rebuild from. Defaults to the first transaction.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+        else:
+            oldest = Transaction.objects.aggregate(oldest=Min('timestamp'))['oldest']
+            if oldest is None:
+                self.stdout.write('No transactions to roll up.')
+                return
+            since = timezone.localdate(oldest)
+
+        # TruncDate converts to TIME_ZONE first, matching SalesRollup.add_transactions
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        counts = Transaction.objects.filter(
+            timestamp__gte=start, status=Transaction.Status.SUCCESS
+        ).annotate(
+            date=TruncDate('timestamp')
+        ).values('date', 'dispenser_id', 'product_id').annotate(
+            units=Sum('quantity'), credits=Sum('credits_used'), transactions=Count('id')
+        ).order_by()
+
+        with transaction.atomic(using=router.db_for_write(SalesRollup)):
+            deleted, _ = SalesRollup.objects.filter(date__gte=since).delete()
+            created = SalesRollup.objects.bulk_create(
+                (SalesRollup(**row) for row in counts.iterator()),
+                batch_size=options['batch_size'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt sales rollups since {since:%Y-%m-%d}: '
+            f'removed {deleted}, created {len(created)} counters.'
+        ))
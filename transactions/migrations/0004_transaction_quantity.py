@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
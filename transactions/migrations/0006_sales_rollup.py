@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_rename_id_product_product_id'),
+        ('dispensers', '0005_fill_ratio'),
+        ('transactions', '0005_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('credits', models.PositiveIntegerField(default=0)),
+                ('transactions', models.PositiveIntegerField(default=0)),
+                ('dispenser', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='dispensers.dispenser')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='products.product')),
+            ],
+            options={
+                'db_table': 'sales_rollups',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['product', 'date'], name='sales_rollu_product_ee1243_idx'), models.Index(fields=['dispenser', 'date'], name='sales_rollu_dispens_71b628_idx')],
+                'unique_together': {('date', 'dispenser', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'timestamp', 'dispenser', 'row_number', 'quantity'], name='transaction_status_69cac2_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+from collections import Counter, defaultdict
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction as db_transaction
+from django.utils import timezone
 import uuid
-from django.db.models import F
 
 class Transaction(models.Model):
     class Status(models.TextChoices):
@@ -12,6 +14,7 @@ class Transaction(models.Model):
     dispenser = models.ForeignKey('dispensers.Dispenser', on_delete=models.CASCADE, related_name='transactions')
     product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='transactions')
     row_number = models.IntegerField()
+    quantity = models.PositiveIntegerField(default=1)
     credits_used = models.IntegerField()
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.SUCCESS)
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -19,40 +22,91 @@ class Transaction(models.Model):
     class Meta:
         db_table = 'transactions'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
+            # Covers the stockout forecast's history scan (dispensers.forecasting)
+            models.Index(fields=['status', 'timestamp', 'dispenser', 'row_number', 'quantity']),
+        ]
     
     def __str__(self):
         return f'{self.user.phone_number} - {self.product.product_name} - {self.status}'
     
     @classmethod
-    def create_transaction(cls, user, dispenser, product, row_number, status=Status.SUCCESS):
-        """Create transaction with proper inventory and wallet updates"""
-        from dispensers.models import DispenserProduct
-        from users.models import Wallet
-        
-        with models.transaction.atomic():
-            # Create transaction record
-            transaction = cls.objects.create(
-                user=user,
-                dispenser=dispenser,
-                product=product,
-                row_number=row_number,
-                credits_used=product.credit_cost,
-                status=status
-            )
-            
-            if status == cls.Status.SUCCESS:
-                # Update dispenser inventory
-                dispenser_product = DispenserProduct.objects.select_for_update().get(
-                    dispenser=dispenser,
-                    row_number=row_number,
-                    product=product
-                )
-                dispenser_product.current_inventory = F('current_inventory') - 1
-                dispenser_product.save()
-                
-                # Update user wallet
-                wallet = Wallet.objects.select_for_update().get(user=user)
-                wallet.balance = F('balance') - product.credit_cost
-                wallet.save()
-            
-            return transaction
\ No newline at end of file
+    def create_transaction(cls, user, dispenser, product, row_number, quantity=1):
+        """Create transaction with proper inventory and wallet updates
+
+        Thin wrapper around transactions.services.purchase; raises a
+        PurchaseError subclass if the purchase is refused.
+        """
+        from .services import purchase
+
+        return purchase(user, dispenser.pk, row_number, product.pk, quantity).transaction
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a request made with an Idempotency-Key header"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        COMPLETED = 'completed', 'Completed'
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='idempotency_keys')
+    endpoint = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = ['user', 'endpoint', 'key']
+
+    def __str__(self):
+        return f'{self.endpoint} {self.key} ({self.status})'
+
+class SalesRollup(models.Model):
+    """Units and credits sold per dispenser, product and local (TIME_ZONE) day"""
+    date = models.DateField()
+    dispenser = models.ForeignKey('dispensers.Dispenser', on_delete=models.CASCADE, related_name='sales_rollups')
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='sales_rollups')
+    units = models.PositiveIntegerField(default=0)
+    credits = models.PositiveIntegerField(default=0)
+    transactions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'sales_rollups'
+        ordering = ['-date']
+        unique_together = ['date', 'dispenser', 'product']
+        indexes = [
+            models.Index(fields=['product', 'date']),
+            models.Index(fields=['dispenser', 'date']),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.dispenser_id} {self.product_id}: {self.units} units'
+
+    @classmethod
+    def add_transactions(cls, transactions):
+        """Add successful, saved Transactions to their daily counters"""
+        totals = defaultdict(Counter)
+        for t in transactions:
+            if t.status != Transaction.Status.SUCCESS:
+                continue
+            counts = totals[(timezone.localdate(t.timestamp), t.dispenser_id, t.product_id)]
+            counts['units'] += t.quantity
+            counts['credits'] += t.credits_used
+            counts['transactions'] += 1
+
+        for (date, dispenser_id, product_id), counts in totals.items():
+            rollups = cls.objects.filter(date=date, dispenser_id=dispenser_id, product_id=product_id)
+            increments = {field: models.F(field) + value for field, value in counts.items()}
+            if rollups.update(**increments):
+                continue
+            try:
+                with db_transaction.atomic():
+                    cls.objects.create(date=date, dispenser_id=dispenser_id, product_id=product_id, **counts)
+            except IntegrityError:
+                # Another purchase created the counter first
+                rollups.update(**increments)
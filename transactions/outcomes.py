@@ -0,0 +1,65 @@
+from collections import namedtuple
+
+from rest_framework import status
+
+# Audit entry (audit_log keyword arguments), response body and status of a
+# single purchase, shared by the sync and async endpoints
+PurchaseOutcome = namedtuple('PurchaseOutcome', ['log', 'body', 'status'])
+
+
+def invalid_purchase(user, ip_address, request_body, errors):
+    return PurchaseOutcome({
+        'level': 'warn',
+        'action': 'TRANSACTION_FAILED',
+        'description': 'Transaction failed - invalid data',
+        'user_id': user.id,
+        'ip_address': ip_address,
+        'request_body': request_body,
+        'error_message': str(errors)
+    }, errors, status.HTTP_400_BAD_REQUEST)
+
+
+def refused_purchase(user, ip_address, error):
+    """``error`` is the PurchaseError the engine raised"""
+    return PurchaseOutcome({
+        'level': 'warn',
+        'action': 'TRANSACTION_FAILED',
+        'description': f'Transaction failed - {error.reason}',
+        'user_id': user.id,
+        'ip_address': ip_address,
+        'metadata': error.metadata
+    }, {'error': error.message}, error.status_code)
+
+
+def failed_purchase(user, ip_address, request_body, error):
+    return PurchaseOutcome({
+        'level': 'error',
+        'action': 'TRANSACTION_ERROR',
+        'description': f'Transaction processing error: {str(error)}',
+        'user_id': user.id,
+        'ip_address': ip_address,
+        'error_message': str(error),
+        'request_body': request_body
+    }, {'error': 'Transaction processing failed'}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def completed_purchase(user, ip_address, result):
+    """``result`` is the engine's PurchaseResult"""
+    return PurchaseOutcome({
+        'level': 'info',
+        'action': 'TRANSACTION_SUCCESS',
+        'description': f'Transaction successful - {result.product.product_name} purchased',
+        'user_id': user.id,
+        'ip_address': ip_address,
+        'metadata': {
+            'transaction_id': str(result.transaction.id),
+            'credits_used': result.transaction.credits_used,
+            'new_balance': result.new_balance
+        }
+    }, {
+        'transaction_id': str(result.transaction.id),
+        'credits_used': result.transaction.credits_used,
+        'new_balance': result.new_balance,
+        'product_name': result.product.product_name,
+        'status': 'success'
+    }, status.HTTP_201_CREATED)
@@ -1,17 +1,17 @@
 from rest_framework import serializers
 from .models import Transaction
 from users.serializers import UserSerializer
-from dispensers.serializers import DispenserSerializer
+from dispensers.serializers import DispenserSummarySerializer
 from products.serializers import ProductSerializer
 
 class TransactionSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    dispenser = DispenserSerializer(read_only=True)
+    dispenser = DispenserSummarySerializer(read_only=True)
     product = ProductSerializer(read_only=True)
     
     class Meta:
         model = Transaction
-        fields = ['id', 'user', 'dispenser', 'product', 'row_number', 
+        fields = ['id', 'user', 'dispenser', 'product', 'row_number', 'quantity',
                   'credits_used', 'status', 'timestamp']
         read_only_fields = fields
 
@@ -22,4 +22,28 @@ class TransactionCreateSerializer(serializers.Serializer):
     
     def validate(self, data):
         # Additional validation can be added here
-        return data
\ No newline at end of file
+        return data
+
+class PurchaseLineSerializer(TransactionCreateSerializer):
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+
+class BatchPurchaseSerializer(serializers.Serializer):
+    lines = PurchaseLineSerializer(many=True, allow_empty=False, max_length=20)
+
+class SalesSeriesSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    units = serializers.IntegerField()
+    credits = serializers.IntegerField()
+    transactions = serializers.IntegerField()
+
+class TopProductSerializer(serializers.Serializer):
+    product_id = serializers.UUIDField()
+    product_name = serializers.CharField()
+    units = serializers.IntegerField()
+    credits = serializers.IntegerField()
+
+class TopDispenserSerializer(serializers.Serializer):
+    dispenser_id = serializers.UUIDField()
+    location_name = serializers.CharField()
+    units = serializers.IntegerField()
+    credits = serializers.IntegerField()
@@ -0,0 +1,185 @@
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from dispensers.events import record_row_changes
+from dispensers.models import DispenserProduct
+from products.models import Product
+from users.models import Wallet
+from .models import SalesRollup, Transaction
+
+
+class PurchaseError(Exception):
+    """A purchase that was refused; nothing has been debited"""
+    status_code = 400
+    message = 'Purchase failed'
+    reason = 'purchase failed'
+
+    def __init__(self, message=None, metadata=None):
+        super().__init__(message or self.message)
+        self.message = message or self.message
+        self.metadata = metadata or {}
+
+
+class ProductUnavailable(PurchaseError):
+    status_code = 404
+    message = 'Product not found or inactive'
+    reason = 'product not found or inactive'
+
+
+class RowNotFound(PurchaseError):
+    status_code = 404
+    message = 'Product not available in this dispenser row'
+    reason = 'dispenser row not found'
+
+
+class OutOfStock(PurchaseError):
+    message = 'Product out of stock'
+    reason = 'product out of stock'
+
+
+class WalletNotFound(PurchaseError):
+    status_code = 404
+    message = 'Wallet not found'
+    reason = 'wallet not found'
+
+
+class InsufficientCredits(PurchaseError):
+    message = 'Insufficient credits'
+    reason = 'insufficient credits'
+
+
+class PurchaseResult:
+    def __init__(self, transactions, products, new_balance):
+        self.transactions = transactions
+        self.products = products
+        self.new_balance = new_balance
+
+    @property
+    def transaction(self):
+        return self.transactions[0]
+
+    @property
+    def product(self):
+        return self.products[self.transaction.product_id]
+
+
+def take_inventory(dispenser_id, row_number, product_id, quantity=1):
+    """Decrement a row's inventory only if enough units are left"""
+    rows = DispenserProduct.objects.filter(
+        dispenser_id=dispenser_id, row_number=row_number, product_id=product_id
+    )
+    updated = rows.filter(current_inventory__gte=quantity).update(
+        current_inventory=F('current_inventory') - quantity,
+        fill_ratio=DispenserProduct.fill_ratio_expression(F('current_inventory') - quantity),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+
+    metadata = {
+        'dispenser_id': str(dispenser_id),
+        'product_id': str(product_id),
+        'row_number': row_number,
+    }
+    if rows.exists():
+        raise OutOfStock(metadata=metadata)
+    raise RowNotFound(metadata=metadata)
+
+
+def debit_wallet(user, amount):
+    """Debit ``amount`` credits only if the balance covers it; returns the new balance"""
+    wallets = Wallet.objects.filter(user=user)
+    updated = wallets.filter(balance__gte=amount).update(
+        balance=F('balance') - amount,
+        updated_at=timezone.now(),
+    )
+    balance = wallets.values_list('balance', flat=True).first()
+    if updated:
+        return balance
+    if balance is None:
+        raise WalletNotFound()
+    raise InsufficientCredits(metadata={'required_credits': amount, 'available_credits': balance})
+
+
+def credit_wallet(user, amount):
+    """Add ``amount`` credits in one UPDATE, creating the wallet if needed; returns the new balance
+
+    Never read-modify-write the balance in Python: purchases debit it with
+    guarded UPDATEs and no lock, so a debit landing in between would be lost.
+    """
+    wallet, _ = Wallet.objects.get_or_create(user=user)
+    Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount, updated_at=timezone.now())
+    return Wallet.objects.filter(pk=wallet.pk).values_list('balance', flat=True).get()
+
+
+def purchase(user, dispenser_id, row_number, product_id, quantity=1):
+    """Sell ``quantity`` units of a product from a dispenser row to ``user``.
+
+    Inventory and balance are changed with guarded conditional UPDATEs
+    (``current_inventory >= quantity``, ``balance >= cost``) instead of
+    row locks, so purchases of the same product in different dispensers
+    never wait on each other and concurrent buyers can neither oversell a
+    row nor overdraw a wallet. Raises a PurchaseError subclass when the
+    purchase is refused; in that case nothing has been written.
+    """
+    return purchase_batch(user, [{
+        'dispenser_id': dispenser_id,
+        'row_number': row_number,
+        'product_id': product_id,
+        'quantity': quantity,
+    }])
+
+
+def purchase_batch(user, lines):
+    """Sell every line of ``lines`` to ``user`` in one all-or-nothing transaction.
+
+    Each line is a dict with dispenser_id, row_number, product_id and
+    quantity. Products are resolved in one query, every row is decremented
+    with a guarded UPDATE, the wallet is debited once for the total and the
+    Transaction rows are inserted with a single bulk_create, followed by
+    their daily SalesRollup counters. A refused line
+    raises a PurchaseError whose metadata carries the line index, and rolls
+    back every other line.
+    """
+    # Products are only read, never locked
+    product_ids = {line['product_id'] for line in lines}
+    products = Product.objects.filter(product_id__in=product_ids, is_active=True).in_bulk()
+    for index, line in enumerate(lines):
+        if line['product_id'] not in products:
+            raise ProductUnavailable(metadata={'line': index, 'product_id': str(line['product_id'])})
+
+    transactions = []
+    for line in lines:
+        product = products[line['product_id']]
+        quantity = line.get('quantity', 1)
+        transactions.append(Transaction(
+            user=user,
+            dispenser_id=line['dispenser_id'],
+            product=product,
+            row_number=line['row_number'],
+            quantity=quantity,
+            credits_used=product.credit_cost * quantity,
+            status=Transaction.Status.SUCCESS
+        ))
+    total_cost = sum(transaction.credits_used for transaction in transactions)
+
+    with db_transaction.atomic():
+        # Writing first keeps the transaction from holding a read lock it
+        # would later have to upgrade, which SQLite cannot wait for
+        for index, transaction in enumerate(transactions):
+            try:
+                take_inventory(transaction.dispenser_id, transaction.row_number,
+                               transaction.product_id, transaction.quantity)
+            except PurchaseError as e:
+                e.metadata['line'] = index
+                raise
+        new_balance = debit_wallet(user, total_cost)
+        Transaction.objects.bulk_create(transactions)
+        # Counted in the same transaction, so the rollups never drift from the rows
+        SalesRollup.add_transactions(transactions)
+        # One INSERT for the inventory streams; their state is read by whoever tails the events
+        record_row_changes([(transaction.dispenser_id, transaction.row_number) for transaction in transactions],
+                           'purchase')
+
+    return PurchaseResult(transactions, products, new_balance)
@@ -1,3 +1,415 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.client import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dispensers.models import Dispenser, DispenserProduct
+from logs.models import Log
+from logs.testing import AuditLogTestMixin
+from products.models import Product
+from users.models import User, Wallet
+from users.views import AuthViewSet
+from . import views
+from .idempotency import get_response_cache
+from .models import IdempotencyKey, SalesRollup, Transaction
+from .services import InsufficientCredits, OutOfStock, credit_wallet, debit_wallet, purchase, purchase_batch
+
+
+class TransactionListQueryTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(phone_number='+966500000001', user_type='admin')
+        self.customer = User.objects.create_user(phone_number='+966500000002')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _create_transactions(self, count):
+        for i in range(count):
+            product = Product.objects.create(product_name=f'Napkin {i}', credit_cost=1)
+            dispenser = Dispenser.objects.create(
+                ble_beacon_id=f'beacon-{Dispenser.objects.count()}',
+                location_name=f'Location {i}',
+                gps_coordinates={'lat': 24.7, 'lng': 46.6},
+            )
+            Transaction.objects.create(user=self.customer, dispenser=dispenser, product=product,
+                                       row_number=1, credits_used=1)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def _assert_constant_queries(self, url):
+        self._create_transactions(2)
+        small, _ = self._count_queries(url)
+        self._create_transactions(13)
+        large, response = self._count_queries(url)
+        self.assertEqual(len(response.data['results']), 15)
+        self.assertEqual(small, large)
+        return response
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        response = self._assert_constant_queries('/api/transactions/')
+        self.assertNotIn('rows', response.data['results'][0]['dispenser'])
+
+    def test_user_transactions_query_count_does_not_grow_with_page_size(self):
+        self._assert_constant_queries(f'/api/transactions/user_transactions/?user_id={self.customer.id}')
+
+    def test_filters(self):
+        self._create_transactions(2)
+        transaction = Transaction.objects.order_by('timestamp').first()
+        for query in (f'dispenser_id={transaction.dispenser_id}', f'product_id={transaction.product_id}',
+                      f'user_id={self.customer.id}&status=success', 'start_date=2000-01-01'):
+            response = self.client.get(f'/api/transactions/?{query}')
+            self.assertEqual(response.status_code, 200, query)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(f'/api/transactions/?dispenser_id={transaction.dispenser_id}')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(transaction.id)])
+
+    def test_invalid_filters_are_rejected(self):
+        for url in ('/api/transactions/?dispenser_id=abc', '/api/transactions/?product_id=abc',
+                    '/api/transactions/?user_id=abc', '/api/transactions/?status=refunded',
+                    '/api/transactions/?start_date=2024-02-30', '/api/transactions/export/?end_date=yesterday',
+                    '/api/transactions/user_transactions/?user_id=abc'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+
+
+class PurchaseBatchTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(phone_number='+966500000002')
+        Wallet.objects.create(user=self.customer, balance=10)
+        self.napkins = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.wipes = Product.objects.create(product_name='Wipes', credit_cost=3)
+        self.dispenser = Dispenser.objects.create(ble_beacon_id='beacon', location_name='Lobby',
+                                                  gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        DispenserProduct.objects.filter(dispenser=self.dispenser, row_number=1).update(
+            product=self.napkins, current_inventory=5, max_capacity=5)
+        DispenserProduct.objects.filter(dispenser=self.dispenser, row_number=2).update(
+            product=self.wipes, current_inventory=2, max_capacity=2)
+
+    def _line(self, row_number, product, quantity):
+        return {'dispenser_id': self.dispenser.dispenser_id, 'row_number': row_number,
+                'product_id': product.product_id, 'quantity': quantity}
+
+    def _state(self):
+        inventory = dict(DispenserProduct.objects.filter(dispenser=self.dispenser, row_number__in=[1, 2])
+                         .values_list('row_number', 'current_inventory'))
+        return (inventory, Wallet.objects.get(user=self.customer).balance,
+                Transaction.objects.count(), SalesRollup.objects.count())
+
+    def test_sells_every_line_with_one_debit(self):
+        result = purchase_batch(self.customer, [self._line(1, self.napkins, 2), self._line(2, self.wipes, 2)])
+        self.assertEqual(result.new_balance, 2)
+        self.assertEqual(self._state(), ({1: 3, 2: 0}, 2, 2, 2))
+        self.assertEqual(sorted(SalesRollup.objects.values_list('units', 'credits')), [(2, 2), (2, 6)])
+
+    def test_a_refused_line_rolls_back_the_others(self):
+        before = self._state()
+        with self.assertRaises(OutOfStock) as refused:
+            purchase_batch(self.customer, [self._line(1, self.napkins, 2), self._line(2, self.wipes, 3)])
+        self.assertEqual(refused.exception.metadata['line'], 1)
+        self.assertEqual(self._state(), before)
+
+    def test_insufficient_credits_roll_back_the_inventory(self):
+        before = self._state()
+        with self.assertRaises(InsufficientCredits):
+            purchase_batch(self.customer, [self._line(1, self.napkins, 5), self._line(2, self.wipes, 2)])
+        self.assertEqual(self._state(), before)
+
+
+class SalesAnalyticsTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(phone_number='+966500000001', user_type='admin'))
+        self.napkins = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.wipes = Product.objects.create(product_name='Wipes', credit_cost=2)
+        self.dispenser = Dispenser.objects.create(ble_beacon_id='beacon', location_name='Lobby',
+                                                  gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        today = timezone.localdate()
+        for days_ago, product, units in ((0, self.napkins, 3), (1, self.napkins, 1), (1, self.wipes, 3)):
+            SalesRollup.objects.create(date=today - timedelta(days=days_ago), dispenser=self.dispenser,
+                                       product=product, units=units, credits=units * product.credit_cost,
+                                       transactions=units)
+
+    def test_totals_series_and_rankings(self):
+        response = self.client.get('/api/transactions/analytics/?metric=credits')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'transactions': 7, 'units': 7, 'credits': 10})
+        self.assertEqual([row['credits'] for row in response.data['series']], [7, 3])
+        self.assertEqual([row['product_name'] for row in response.data['top_products']], ['Wipes', 'Napkins'])
+
+        response = self.client.get(f'/api/transactions/analytics/?product_id={self.napkins.product_id}')
+        self.assertEqual(response.data['totals']['units'], 4)
+
+    def test_invalid_filters_are_rejected(self):
+        for query in ('dispenser_id=abc', 'product_id=abc', 'granularity=year', 'metric=profit', 'top=0',
+                      'start_date=2024-02-30'):
+            response = self.client.get(f'/api/transactions/analytics/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class IdempotencyTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_response_cache().clear()
+        self.customer = User.objects.create_user(phone_number='+966500000002')
+        Wallet.objects.create(user=self.customer, balance=5)
+        self.product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.dispenser = Dispenser.objects.create(ble_beacon_id='beacon', location_name='Lobby',
+                                                  gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        DispenserProduct.objects.filter(dispenser=self.dispenser, row_number__in=[1, 2]).update(
+            product=self.product, current_inventory=5, max_capacity=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def _purchase(self, key='key-1', row_number=1):
+        return self.client.post('/api/transactions/purchase/', {
+            'dispenser_id': str(self.dispenser.dispenser_id),
+            'row_number': row_number,
+            'product_id': str(self.product.product_id),
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def _balance(self):
+        return Wallet.objects.get(user=self.customer).balance
+
+    def test_retry_replays_the_first_response(self):
+        first = self._purchase()
+        self.assertEqual(first.status_code, 201)
+        get_response_cache().clear()
+        for _ in range(2):
+            # From the table, then from the per-process cache
+            retry = self._purchase()
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            self.assertEqual(retry.data, first.data)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(self._balance(), 4)
+
+    def test_reused_key_with_another_request_is_refused(self):
+        self._purchase()
+        response = self._purchase(row_number=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def _pending_duplicate(self):
+        """A stored purchase put back to pending, as if the original request were still running"""
+        first = self._purchase()
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.filter(pk=record.pk).update(status=IdempotencyKey.Status.PENDING)
+        get_response_cache().clear()
+        return first, record
+
+    def test_concurrent_duplicate_waits_for_the_original(self):
+        first, record = self._pending_duplicate()
+
+        def original_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(status=IdempotencyKey.Status.COMPLETED)
+
+        with mock.patch('transactions.idempotency.time.sleep', side_effect=original_finishes):
+            response = self._purchase()
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY={'WAIT_TIMEOUT': 0})
+    def test_concurrent_duplicate_times_out(self):
+        self._pending_duplicate()
+        self.assertEqual(self._purchase().status_code, 409)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_pending_key_is_taken_over_after_its_lease(self):
+        record = IdempotencyKey.objects.create(user=self.customer, endpoint='purchase', key='key-1',
+                                               request_hash='left-by-a-dead-worker',
+                                               expires_at=timezone.now() + timedelta(days=1))
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._purchase()
+            # Audit entries wait for the action's commit
+            self.assertFalse(Log.objects.filter(action='TRANSACTION_SUCCESS').exists())
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(IdempotencyKey.objects.get().status, IdempotencyKey.Status.COMPLETED)
+        self.assertEqual(self._balance(), 4)
+        self.assertEqual(Log.objects.filter(action='TRANSACTION_SUCCESS').count(), 1)
+
+    def test_request_whose_key_was_taken_over_rolls_back(self):
+        def purchase_after_takeover(*args, **kwargs):
+            IdempotencyKey.objects.all().delete()
+            return purchase(*args, **kwargs)
+
+        with mock.patch.object(views, 'purchase', side_effect=purchase_after_takeover), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self._purchase()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self._balance(), 5)
+        self.assertFalse(Log.objects.filter(action='TRANSACTION_SUCCESS').exists())
+
+
+class AsyncPurchaseTests(AuditLogTestMixin, TestCase):
+    URL = '/api/async/transactions/purchase/'
+
+    def setUp(self):
+        super().setUp()
+        self.customer = User.objects.create_user(phone_number='+966500000002')
+        self.admin = User.objects.create_user(phone_number='+966500000001', user_type='admin')
+        Wallet.objects.create(user=self.customer, balance=5)
+        self.product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.dispenser = Dispenser.objects.create(ble_beacon_id='beacon', location_name='Lobby',
+                                                  gps_coordinates={'lat': 24.7, 'lng': 46.6})
+        DispenserProduct.objects.filter(dispenser=self.dispenser, row_number=1).update(
+            product=self.product, current_inventory=5, max_capacity=5)
+        self.body = {'dispenser_id': str(self.dispenser.dispenser_id), 'row_number': 1,
+                     'product_id': str(self.product.product_id)}
+
+    def _headers(self, user):
+        return {'Authorization': f'Bearer {AuthViewSet()._generate_token(user)}'}
+
+    async def _post(self, body, headers=None):
+        return await AsyncClient().post(self.URL, body, content_type='application/json', headers=headers or {})
+
+    async def test_authentication_and_permissions(self):
+        response = await self._post(self.body)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        response = await self._post(self.body, {'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+        response = await self._post(self.body, self._headers(self.admin))
+        self.assertEqual(response.status_code, 403)
+        response = await AsyncClient().get(self.URL, headers=self._headers(self.customer))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_responses_match_the_sync_endpoint(self):
+        headers = self._headers(self.customer)
+        response = await self._post(self.body, headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.json()), {'transaction_id', 'credits_used', 'new_balance',
+                                                'product_name', 'status'})
+        self.assertEqual(response.json()['new_balance'], 4)
+
+        response = await self._post({**self.body, 'row_number': 9}, headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('row_number', response.json())
+        response = await self._post({**self.body, 'row_number': 2}, headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Product not available in this dispenser row'})
+
+
+@override_settings(LOG_WRITER={'BUFFERED': False})
+class CreditWalletTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(phone_number='+966500000090')
+
+    def test_creates_the_wallet(self):
+        self.assertEqual(credit_wallet(self.customer, 3), 3)
+        self.assertEqual(Wallet.objects.get(user=self.customer).balance, 3)
+
+    def test_keeps_a_debit_made_after_the_wallet_was_loaded(self):
+        Wallet.objects.create(user=self.customer, balance=5)
+        stale = Wallet.objects.get(user=self.customer)
+        debit_wallet(self.customer, 2)
+        with mock.patch.object(Wallet.objects, 'get_or_create', return_value=(stale, False)):
+            new_balance = credit_wallet(self.customer, 4)
+        self.assertEqual(new_balance, 7)
+        self.assertEqual(Wallet.objects.get(user=self.customer).balance, 7)
+
+
+class PurchaseConcurrencyTests(TransactionTestCase):
+    """Hammer one dispenser row from many threads and check the books balance"""
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 15
+    INVENTORY = 40
+    BALANCE = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads cannot share an in-memory SQLite test database')
+        self.product = Product.objects.create(product_name='Napkins', credit_cost=1)
+        self.dispenser = Dispenser.objects.create(
+            ble_beacon_id='stress-beacon',
+            location_name='Stress',
+            gps_coordinates={'lat': 24.7, 'lng': 46.6},
+        )
+        DispenserProduct.objects.filter(dispenser=self.dispenser, row_number=1).update(
+            product=self.product, current_inventory=self.INVENTORY, max_capacity=self.INVENTORY
+        )
+        self.customers = []
+        for i in range(self.THREADS):
+            customer = User.objects.create_user(phone_number=f'+96650000010{i}')
+            Wallet.objects.create(user=customer, balance=self.BALANCE)
+            self.customers.append(customer)
+
+    def _buy(self, customer, outcomes):
+        try:
+            for _ in range(self.ATTEMPTS_PER_THREAD):
+                try:
+                    purchase(customer, self.dispenser.dispenser_id, 1, self.product.product_id)
+                    outcomes.append('sold')
+                except OutOfStock:
+                    outcomes.append('out_of_stock')
+                except InsufficientCredits:
+                    outcomes.append('insufficient_credits')
+        finally:
+            connection.close()
+
+    def test_no_oversell_or_negative_balance(self):
+        outcomes = []
+        threads = [threading.Thread(target=self._buy, args=(customer, outcomes))
+                   for customer in self.customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.THREADS * self.ATTEMPTS_PER_THREAD)
+        sold = outcomes.count('sold')
+        row = DispenserProduct.objects.get(dispenser=self.dispenser, row_number=1)
+        self.assertEqual(sold, min(self.INVENTORY, self.THREADS * self.BALANCE))
+        self.assertEqual(row.current_inventory, self.INVENTORY - sold)
+        self.assertEqual(Transaction.objects.count(), sold)
+
+        for customer in self.customers:
+            wallet = Wallet.objects.get(user=customer)
+            bought = Transaction.objects.filter(user=customer).count()
+            self.assertGreaterEqual(wallet.balance, 0)
+            self.assertEqual(wallet.balance, self.BALANCE - bought)
+
+    def _top_up_and_buy(self, customer, outcomes):
+        try:
+            for _ in range(self.ATTEMPTS_PER_THREAD):
+                credit_wallet(customer, 1)
+                outcomes.append('credited')
+                try:
+                    purchase(customer, self.dispenser.dispenser_id, 1, self.product.product_id)
+                    outcomes.append('sold')
+                except (OutOfStock, InsufficientCredits):
+                    pass
+        finally:
+            connection.close()
+
+    def test_credits_and_debits_interleave_without_losing_either(self):
+        # Two threads per wallet so credits race debits on the same row
+        outcomes = []
+        threads = [threading.Thread(target=self._top_up_and_buy, args=(customer, outcomes))
+                   for customer in self.customers for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('credited'), 2 * self.THREADS * self.ATTEMPTS_PER_THREAD)
+        for customer in self.customers:
+            wallet = Wallet.objects.get(user=customer)
+            bought = Transaction.objects.filter(user=customer).count()
+            self.assertEqual(wallet.balance, self.BALANCE + 2 * self.ATTEMPTS_PER_THREAD - bought)
 
-# Create your tests here.
@@ -2,38 +2,105 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.shortcuts import get_object_or_404
-from .models import Transaction
-from .serializers import TransactionSerializer, TransactionCreateSerializer
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from .idempotency import idempotent
+from .models import SalesRollup, Transaction
+from .outcomes import completed_purchase, failed_purchase, invalid_purchase, refused_purchase
+from .serializers import (TransactionSerializer, TransactionCreateSerializer, BatchPurchaseSerializer,
+                          SalesSeriesSerializer, TopDispenserSerializer, TopProductSerializer)
+from .services import PurchaseError, purchase, purchase_batch
+from napkin_dispenser.export import export_response
+from napkin_dispenser.pagination import TimestampCursorPagination
+from napkin_dispenser.query_params import parse_choice_param, parse_datetime_param, parse_uuid_param
 from users.permissions import IsAdmin, IsCustomer
-from users.models import User, Wallet
-from dispensers.models import Dispenser, DispenserProduct
-from products.models import Product
-from logs.models import Log
+from users.models import User
+from logs.services import audit_log
 
 class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TransactionSerializer
+    pagination_class = TimestampCursorPagination
     permission_classes = [IsAuthenticated]
+    EXPORT_FIELDS = ['id', 'timestamp', 'user_id', 'user__phone_number', 'dispenser_id',
+                     'dispenser__location_name', 'row_number', 'product_id', 'product__product_name',
+                     'quantity', 'credits_used', 'status']
+    # SalesRollup already has one row per day, so a day period is the date
+    # column itself; weeks and months truncate it
+    ANALYTICS_GRANULARITIES = {'day': lambda field: F(field), 'week': TruncWeek, 'month': TruncMonth}
 
     def get_queryset(self):
         user = self.request.user
 
         if user.is_admin:
-            return Transaction.objects.select_related('user', 'dispenser', 'product').all()
+            queryset = self._base_queryset()
+            user_id = parse_uuid_param(self.request, 'user_id')
+            if user_id:
+                queryset = queryset.filter(user_id=user_id)
+        else:
+            # Users can only see their own transactions
+            queryset = self._base_queryset().filter(user=user)
+
+        # Apply filters
+        for param in ('dispenser_id', 'product_id'):
+            value = parse_uuid_param(self.request, param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+
+        transaction_status = parse_choice_param(self.request, 'status', Transaction.Status.values)
+        if transaction_status:
+            queryset = queryset.filter(status=transaction_status)
+
+        start_date = parse_datetime_param(self.request, 'start_date')
+        if start_date:
+            queryset = queryset.filter(timestamp__gte=start_date)
+
+        end_date = parse_datetime_param(self.request, 'end_date')
+        if end_date:
+            queryset = queryset.filter(timestamp__lte=end_date)
 
-        # Users can only see their own transactions
-        return Transaction.objects.select_related('user', 'dispenser', 'product').filter(user=user)
+        return queryset.order_by('-timestamp', '-id')
+
+    def _base_queryset(self):
+        # Everything TransactionSerializer renders comes from these joins
+        return Transaction.objects.select_related('user', 'dispenser', 'product')
 
     @action(detail=False, methods=['post'], permission_classes=[IsCustomer])
+    @idempotent('purchase')
     def purchase(self, request):
         """Process a purchase transaction"""
+        user = request.user
+        ip_address = self._get_client_ip(request)
         serializer = TransactionCreateSerializer(data=request.data)
         if not serializer.is_valid():
-            Log.objects.create(
+            outcome = invalid_purchase(user, ip_address, request.data, serializer.errors)
+        else:
+            data = serializer.validated_data
+            try:
+                result = purchase(user, data['dispenser_id'], data['row_number'], data['product_id'])
+            except PurchaseError as e:
+                outcome = refused_purchase(user, ip_address, e)
+            except Exception as e:
+                outcome = failed_purchase(user, ip_address, request.data, e)
+            else:
+                outcome = completed_purchase(user, ip_address, result)
+
+        audit_log(**outcome.log)
+        return Response(outcome.body, status=outcome.status)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsCustomer])
+    @idempotent('purchase_batch')
+    def purchase_batch(self, request):
+        """Purchase several lines (dispenser row, product, quantity) at once, all or nothing"""
+        serializer = BatchPurchaseSerializer(data=request.data)
+        if not serializer.is_valid():
+            audit_log(
                 level='warn',
                 action='TRANSACTION_FAILED',
-                description='Transaction failed - invalid data',
+                description='Batch transaction failed - invalid data',
                 user_id=request.user.id,
                 ip_address=self._get_client_ip(request),
                 request_body=request.data,
@@ -41,105 +108,26 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             )
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        data = serializer.validated_data
+        lines = serializer.validated_data['lines']
         user = request.user
 
         try:
-            with db_transaction.atomic():
-                # Get product with lock
-                product = get_object_or_404(Product.objects.select_for_update(),
-                                          product_id=data['product_id'], is_active=True)
-
-                # Get dispenser
-                dispenser = get_object_or_404(Dispenser, dispenser_id=data['dispenser_id'])
-
-                # Get dispenser product row with lock
-                dispenser_product = get_object_or_404(
-                    DispenserProduct.objects.select_for_update(),
-                    dispenser=dispenser,
-                    row_number=data['row_number'],
-                    product=product
-                )
-
-                # Get user wallet with lock
-                wallet = get_object_or_404(Wallet.objects.select_for_update(), user=user)
-
-                # Validate transaction
-                if dispenser_product.current_inventory <= 0:
-                    Log.objects.create(
-                        level='warn',
-                        action='TRANSACTION_FAILED',
-                        description=f'Transaction failed - product out of stock',
-                        user_id=user.id,
-                        ip_address=self._get_client_ip(request),
-                        metadata={
-                            'dispenser_id': str(dispenser.id),
-                            'product_id': str(product.id),
-                            'row_number': data['row_number']
-                        }
-                    )
-                    return Response({'error': 'Product out of stock'},
-                                  status=status.HTTP_400_BAD_REQUEST)
-
-                if wallet.balance < product.credit_cost:
-                    Log.objects.create(
-                        level='warn',
-                        action='TRANSACTION_FAILED',
-                        description=f'Transaction failed - insufficient credits',
-                        user_id=user.id,
-                        ip_address=self._get_client_ip(request),
-                        metadata={
-                            'required_credits': product.credit_cost,
-                            'available_credits': wallet.balance
-                        }
-                    )
-                    return Response({'error': 'Insufficient credits'},
-                                  status=status.HTTP_400_BAD_REQUEST)
-
-                # Process transaction
-                dispenser_product.current_inventory -= 1
-                dispenser_product.save()
-
-                wallet.balance -= product.credit_cost
-                wallet.save()
-
-                # Create transaction record
-                transaction = Transaction.objects.create(
-                    user=user,
-                    dispenser=dispenser,
-                    product=product,
-                    row_number=data['row_number'],
-                    credits_used=product.credit_cost,
-                    status=Transaction.Status.SUCCESS
-                )
-
-                # Log successful transaction
-                Log.objects.create(
-                    level='info',
-                    action='TRANSACTION_SUCCESS',
-                    description=f'Transaction successful - {product.product_name} purchased',
-                    user_id=user.id,
-                    ip_address=self._get_client_ip(request),
-                    metadata={
-                        'transaction_id': str(transaction.id),
-                        'credits_used': product.credit_cost,
-                        'new_balance': wallet.balance
-                    }
-                )
-
-                return Response({
-                    'transaction_id': str(transaction.id),
-                    'credits_used': product.credit_cost,
-                    'new_balance': wallet.balance,
-                    'product_name': product.product_name,
-                    'status': 'success'
-                }, status=status.HTTP_201_CREATED)
-
+            result = purchase_batch(user, lines)
+        except PurchaseError as e:
+            audit_log(
+                level='warn',
+                action='TRANSACTION_FAILED',
+                description=f'Batch transaction failed - {e.reason}',
+                user_id=user.id,
+                ip_address=self._get_client_ip(request),
+                metadata=e.metadata
+            )
+            return Response({'error': e.message, 'line': e.metadata.get('line')}, status=e.status_code)
         except Exception as e:
-            Log.objects.create(
+            audit_log(
                 level='error',
                 action='TRANSACTION_ERROR',
-                description=f'Transaction processing error: {str(e)}',
+                description=f'Batch transaction processing error: {str(e)}',
                 user_id=user.id,
                 ip_address=self._get_client_ip(request),
                 error_message=str(e),
@@ -148,16 +136,114 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({'error': 'Transaction processing failed'},
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        total_credits = sum(transaction.credits_used for transaction in result.transactions)
+        audit_log(
+            level='info',
+            action='TRANSACTION_BATCH_SUCCESS',
+            description=f'Batch transaction successful - {len(result.transactions)} lines purchased',
+            user_id=user.id,
+            ip_address=self._get_client_ip(request),
+            metadata={
+                'transaction_ids': [str(transaction.id) for transaction in result.transactions],
+                'credits_used': total_credits,
+                'new_balance': result.new_balance
+            }
+        )
+
+        return Response({
+            'lines': [{
+                'line': index,
+                'transaction_id': str(transaction.id),
+                'dispenser_id': str(transaction.dispenser_id),
+                'row_number': transaction.row_number,
+                'product_id': str(transaction.product_id),
+                'product_name': result.products[transaction.product_id].product_name,
+                'quantity': transaction.quantity,
+                'credits_used': transaction.credits_used,
+                'status': 'success'
+            } for index, transaction in enumerate(result.transactions)],
+            'total_credits': total_credits,
+            'new_balance': result.new_balance
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def export(self, request):
+        """Stream every matching transaction as NDJSON or CSV
+
+        Takes the list filters plus ``file_format`` (ndjson or csv) and
+        ``gzip``.
+        """
+        return export_response(request, self.get_queryset(), self.EXPORT_FIELDS, 'transactions')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def analytics(self, request):
+        """Sales totals, time series and top products/dispensers from the daily rollups
+
+        ``start_date``/``end_date`` are local dates (default: the last 30
+        days); ``granularity`` is day, week or month; ``top`` caps the
+        rankings, ordered by ``metric`` (credits or units). Optional
+        ``dispenser_id`` and ``product_id`` filters.
+        """
+        try:
+            end_date = self._parse_day_param('end_date') or timezone.localdate()
+            start_date = self._parse_day_param('start_date') or end_date - timedelta(days=29)
+            top = int(request.query_params.get('top', 10))
+            if start_date > end_date or not 1 <= top <= 100:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'Invalid start_date, end_date or top'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in self.ANALYTICS_GRANULARITIES:
+            return Response({'error': f'granularity must be one of {", ".join(self.ANALYTICS_GRANULARITIES)}'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        metric = request.query_params.get('metric', 'credits')
+        if metric not in ('credits', 'units'):
+            return Response({'error': 'metric must be credits or units'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = SalesRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+        for param in ('dispenser_id', 'product_id'):
+            value = parse_uuid_param(request, param)
+            if value:
+                rollups = rollups.filter(**{param: value})
+
+        sums = {'units': Sum('units'), 'credits': Sum('credits')}
+        totals = rollups.aggregate(transactions=Sum('transactions'), **sums)
+
+        series = rollups.annotate(
+            period=self.ANALYTICS_GRANULARITIES[granularity]('date')
+        ).values('period').annotate(transactions=Sum('transactions'), **sums).order_by('period')
+
+        top_products = rollups.values(
+            'product_id', product_name=F('product__product_name')
+        ).annotate(**sums).order_by(f'-{metric}', 'product_id')[:top]
+
+        top_dispensers = rollups.values(
+            'dispenser_id', location_name=F('dispenser__location_name')
+        ).annotate(**sums).order_by(f'-{metric}', 'dispenser_id')[:top]
+
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'granularity': granularity,
+            'totals': {key: value or 0 for key, value in totals.items()},
+            'series': SalesSeriesSerializer(series, many=True).data,
+            'top_products': TopProductSerializer(top_products, many=True).data,
+            'top_dispensers': TopDispenserSerializer(top_dispensers, many=True).data
+        })
+
     @action(detail=False, methods=['get'])
     def user_transactions(self, request):
         """Get transactions for a specific user (admin can view any, users can view only their own)"""
-        user_id = request.query_params.get('user_id')
+        user_id = parse_uuid_param(request, 'user_id')
 
         if user_id and request.user.is_admin:
             user = get_object_or_404(User, id=user_id)
-            transactions = Transaction.objects.filter(user=user)
+            transactions = self._base_queryset().filter(user=user)
         else:
-            transactions = Transaction.objects.filter(user=request.user)
+            transactions = self._base_queryset().filter(user=request.user)
 
         page = self.paginate_queryset(transactions)
         if page is not None:
@@ -167,6 +253,15 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(transactions, many=True)
         return Response(serializer.data)
 
+    def _parse_day_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid {name}')
+        return day
+
     def _get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
\ No newline at end of file
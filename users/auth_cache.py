@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from napkin_dispenser.cache import TTLCache
+
+AuthState = namedtuple('AuthState', [
+    'is_active', 'user_type', 'token_version',
+    # Carried along so subscription checks on a cached user never query
+    'subscription_type', 'subscription_start_date', 'subscription_end_date',
+])
+
+_cache = None
+
+
+def get_auth_state_cache():
+    """Per-process cache of user auth state, keyed by the user id string"""
+    global _cache
+    if _cache is None:
+        config = getattr(settings, 'JWT_AUTH_CACHE', {})
+        _cache = TTLCache(maxsize=config.get('MAX_ENTRIES', 10000), ttl=config.get('TTL', 30))
+    return _cache
+
+
+def auth_state(user):
+    return AuthState(*(getattr(user, name) for name in AuthState._fields))
+
+
+def cache_auth_state(user):
+    """Cache and return ``user``'s AuthState, never past the end of its subscription.
+
+    expire_subscriptions runs in its own process and cannot reach this
+    cache, so an entry must not outlive the subscription it describes. An
+    ended subscription that has not been swept yet is not cached at all,
+    and the sweep shows on the next request.
+    """
+    state = auth_state(user)
+    cache = get_auth_state_cache()
+    ttl = cache.ttl
+    if state.subscription_type != user.SubscriptionType.NONE and state.subscription_end_date is not None:
+        ttl = min(ttl, (state.subscription_end_date - timezone.now()).total_seconds())
+    if ttl > 0:
+        cache.set(str(user.pk), state, ttl=ttl)
+    return state
+
+
+def invalidate_auth_state(user_id):
+    get_auth_state_cache().delete(str(user_id))
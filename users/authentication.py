@@ -1,28 +1,108 @@
+import uuid
+
 import jwt
 from django.conf import settings
+from django.db import router
 from rest_framework import authentication
 from rest_framework.exceptions import AuthenticationFailed
+from .auth_cache import auth_state, cache_auth_state, get_auth_state_cache
 from .models import User
 
 class JWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
-        
+
         if not auth_header:
             return None
-        
+
         try:
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-            user = User.objects.get(id=payload['user_id'])
-            
-            if not user.is_active:
-                raise AuthenticationFailed('Account is deactivated')
-            
+            token, payload = self.decode(auth_header)
+            user = self.get_user(payload)
             return (user, token)
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token expired')
-        except jwt.InvalidTokenError:
+        except (jwt.InvalidTokenError, IndexError, KeyError, ValueError):
             raise AuthenticationFailed('Invalid token')
         except User.DoesNotExist:
-            raise AuthenticationFailed('User not found')
\ No newline at end of file
+            raise AuthenticationFailed('User not found')
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views: same checks, async ORM for the user lookup"""
+        auth_header = request.headers.get('Authorization')
+
+        if not auth_header:
+            return None
+
+        try:
+            token, payload = self.decode(auth_header)
+            user = await self.aget_user(payload)
+            return (user, token)
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed('Token expired')
+        except (jwt.InvalidTokenError, IndexError, KeyError, ValueError):
+            raise AuthenticationFailed('Invalid token')
+        except User.DoesNotExist:
+            raise AuthenticationFailed('User not found')
+
+    def decode(self, auth_header):
+        token = auth_header.split(' ')[1]
+        return token, jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+
+    def get_user(self, payload):
+        user = User.objects.get(id=payload['user_id'])
+        self.check_state(auth_state(user), payload)
+        return user
+
+    async def aget_user(self, payload):
+        user = await User.objects.aget(id=payload['user_id'])
+        self.check_state(auth_state(user), payload)
+        return user
+
+    def check_state(self, state, payload):
+        if not state.is_active:
+            raise AuthenticationFailed('Account is deactivated')
+
+        # Tokens issued before token versions existed carry no 'ver' claim
+        if payload.get('ver', 0) != state.token_version:
+            raise AuthenticationFailed('Token has been revoked')
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication that serves user auth state from a per-process cache.
+
+    Steady-state requests authenticate without any SQL: the returned user
+    only has id and the AuthState fields (auth and subscription state)
+    loaded, and other fields are fetched on first access. Such a user must
+    not be saved as a whole; views that write to the requesting user fetch
+    it first. Local saves invalidate the entry immediately; changes made in
+    other workers take effect within ``JWT_AUTH_CACHE['TTL']`` seconds.
+    """
+    def get_user(self, payload):
+        user_id = str(uuid.UUID(payload['user_id']))
+        state = get_auth_state_cache().get(user_id)
+
+        if state is None:
+            return self._cache_user(User.objects.get(id=user_id), payload)
+        return self._cached_user(user_id, state, payload)
+
+    async def aget_user(self, payload):
+        user_id = str(uuid.UUID(payload['user_id']))
+        state = get_auth_state_cache().get(user_id)
+
+        if state is None:
+            return self._cache_user(await User.objects.aget(id=user_id), payload)
+        return self._cached_user(user_id, state, payload)
+
+    def _cache_user(self, user, payload):
+        state = cache_auth_state(user)
+        self.check_state(state, payload)
+        return user
+
+    def _cached_user(self, user_id, state, payload):
+        self.check_state(state, payload)
+        values = {'id': uuid.UUID(user_id), **state._asdict()}
+        # from_db() expects values in model field order
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+        user = User.from_db(router.db_for_read(User), field_names, [values[name] for name in field_names])
+        # The cached fields may be up to TTL seconds old; User.save() refuses to write them back
+        user.from_auth_cache = True
+        return user
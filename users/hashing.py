@@ -0,0 +1,110 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULTS = {
+    'ROUNDS': 12,  # bcrypt cost factor; every +1 doubles the work per hash
+    'MAX_WORKERS': None,  # hashing threads per process, defaults to the CPU count
+    'MAX_PENDING': 32,  # hashes running or queued before new ones are turned away
+    'QUEUE_TIMEOUT': 2.0,  # seconds a request waits for a free slot before a 503
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'BCRYPT', {})}
+
+
+class PasswordHasherBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins in progress, try again shortly.'
+    default_code = 'password_hasher_busy'
+    wait = 1  # rendered as Retry-After by DRF's exception handler
+
+
+class BcryptExecutor:
+    """Run bcrypt on a bounded thread pool instead of the request thread.
+
+    bcrypt releases the GIL, so ``MAX_WORKERS`` hashes run in parallel
+    while request threads wait. At most ``MAX_PENDING`` hashes may be
+    running or queued; a caller that cannot get a slot within
+    ``QUEUE_TIMEOUT`` gets PasswordHasherBusy (503) instead of piling up
+    behind a burst of logins and starving purchases of CPU.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _ensure_pool(self, config):
+        if self._executor is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            workers = config['MAX_WORKERS'] or os.cpu_count() or 1
+            self._slots = threading.BoundedSemaphore(max(config['MAX_PENDING'], workers))
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            self._pid = os.getpid()
+
+    def run(self, fn, *args):
+        config = get_config()
+        self._ensure_pool(config)
+        slots = self._slots
+        if not slots.acquire(timeout=config['QUEUE_TIMEOUT']):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _reset_after_fork(self):
+        # Pool threads do not survive fork; each worker builds its own
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+
+
+bcrypt_executor = BcryptExecutor()
+
+
+def hash_password(raw_password, rounds=None):
+    rounds = rounds or get_config()['ROUNDS']
+    hashed = bcrypt_executor.run(bcrypt.hashpw, raw_password.encode('utf-8'), bcrypt.gensalt(rounds))
+    return hashed.decode('utf-8')
+
+
+def verify_password(raw_password, hashed):
+    if not hashed or not hashed.startswith('$2'):
+        return False
+    return bcrypt_executor.run(bcrypt.checkpw, raw_password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed):
+    """Cost factor of a ``$2b$12$...`` hash, or None if it is not a bcrypt hash"""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed):
+    return hash_rounds(hashed) != get_config()['ROUNDS']
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import bcrypt
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users.hashing import BcryptExecutor, get_config
+
+
+class Command(BaseCommand):
+    help = 'Measure bcrypt password checks per second per core at each cost factor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13],
+                            help='Cost factors to measure')
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time spent on each measurement')
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1,
+                            help='Hashing threads for the parallel run (0 to skip)')
+
+    def handle(self, *args, **options):
+        configured = get_config()['ROUNDS']
+        threads = options['threads']
+        header = f'{"rounds":<8}{"ms/login":>10}{"logins/s/core":>15}'
+        if threads:
+            header += f'{f"logins/s x{threads}":>18}{"per thread":>12}'
+        self.stdout.write(header)
+
+        for rounds in options['rounds']:
+            hashed = bcrypt.hashpw(b'bench-pass', bcrypt.gensalt(rounds))
+            checks, elapsed = self._serial(hashed, options['seconds'])
+            line = f'{rounds:<8}{elapsed / checks * 1000:>10.1f}{checks / elapsed:>15.1f}'
+            if threads:
+                checks, elapsed = self._parallel(hashed, rounds, threads, options['seconds'])
+                line += f'{checks / elapsed:>18.1f}{checks / elapsed / threads:>12.1f}'
+            if rounds == configured:
+                line += '  <- BCRYPT["ROUNDS"]'
+            self.stdout.write(line)
+
+    def _serial(self, hashed, seconds):
+        checks = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            bcrypt.checkpw(b'bench-pass', hashed)
+            checks += 1
+        return checks, time.perf_counter() - started
+
+    def _parallel(self, hashed, rounds, threads, seconds):
+        """Drive the bounded executor from as many request threads as it has workers"""
+        config = {'ROUNDS': rounds, 'MAX_WORKERS': threads, 'MAX_PENDING': threads, 'QUEUE_TIMEOUT': 60}
+        executor = BcryptExecutor()
+        counts = [0] * threads
+        deadline = time.perf_counter() + seconds
+
+        def login(index):
+            while time.perf_counter() < deadline:
+                executor.run(bcrypt.checkpw, b'bench-pass', hashed)
+                counts[index] += 1
+
+        with override_settings(BCRYPT=config):
+            started = time.perf_counter()
+            workers = [threading.Thread(target=login, args=(i,)) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        executor.shutdown()
+        return sum(counts), elapsed
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.subscriptions import expire_subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Move users whose subscription has ended to the "none" subscription in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = expire_subscriptions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {total} subscriptions.'))
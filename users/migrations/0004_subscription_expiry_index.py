@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('subscription_type', 'none'), _negated=True), fields=['subscription_end_date'], name='users_subscription_expiry_idx'),
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 import uuid
-import bcrypt
+from .hashing import hash_password, needs_rehash, verify_password
 
 class UserManager(BaseUserManager):
     def create_user(self, phone_number, password=None, **extra_fields):
@@ -50,6 +50,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     account_verified = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    token_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -60,15 +61,49 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Only subscriptions that can still expire, for expire_subscriptions
+            models.Index(fields=['subscription_end_date'], name='users_subscription_expiry_idx',
+                         condition=~models.Q(subscription_type='none')),
+        ]
 
     def __str__(self):
         return f'{self.phone_number} ({self.user_type})'
 
+    # Set on users CachedJWTAuthentication rebuilds from its cache
+    from_auth_cache = False
+
+    def save(self, *args, **kwargs):
+        """Refuse to write cached, possibly stale auth state back over the database row"""
+        if self.from_auth_cache:
+            from .auth_cache import AuthState
+
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None or set(update_fields) & set(AuthState._fields):
+                raise ValueError('Users built from the auth cache can only be saved with update_fields '
+                                 'that leave out the cached fields; fetch the user first')
+        super().save(*args, **kwargs)
+
     def set_password(self, raw_password):
-        self.password = bcrypt.hashpw(raw_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password = hash_password(raw_password)
 
     def check_password(self, raw_password):
-        return bcrypt.checkpw(raw_password.encode('utf-8'), self.password.encode('utf-8'))
+        """Verify ``raw_password``, rehashing it when BCRYPT['ROUNDS'] has changed"""
+        if not verify_password(raw_password, self.password):
+            return False
+        if needs_rehash(self.password):
+            self.set_password(raw_password)
+            if self.pk:
+                User.objects.filter(pk=self.pk).update(password=self.password)
+        return True
+
+    def revoke_tokens(self):
+        """Invalidate every JWT issued to this user so far"""
+        from .auth_cache import invalidate_auth_state
+
+        User.objects.filter(pk=self.pk).update(token_version=models.F('token_version') + 1)
+        self.refresh_from_db(fields=['token_version'])
+        invalidate_auth_state(self.pk)
 
     @property
     def is_admin(self):
@@ -82,6 +117,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     def is_maintenance(self):
         return self.user_type == self.UserType.MAINTENANCE
 
+    @property
+    def has_active_subscription(self):
+        """Whether the subscription is current; also false for expired ones expire_subscriptions has not swept yet"""
+        if self.subscription_type == self.SubscriptionType.NONE:
+            return False
+        return self.subscription_end_date is None or self.subscription_end_date > timezone.now()
+
 class Wallet(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
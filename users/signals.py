@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .auth_cache import invalidate_auth_state
+from .models import User
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_auth_state(sender, instance, **kwargs):
+    """Drop the cached auth state so deactivation takes effect immediately"""
+    invalidate_auth_state(instance.pk)
@@ -0,0 +1,35 @@
+from django.utils import timezone
+
+from .auth_cache import invalidate_auth_state
+from .models import User
+
+
+def expired_subscriptions(now):
+    return User.objects.exclude(subscription_type=User.SubscriptionType.NONE) \
+        .filter(subscription_end_date__lte=now)
+
+
+def expire_batch(ids, now):
+    """Move the users ``ids`` to the "none" subscription if theirs has still ended at ``now``"""
+    # Re-checked by the UPDATE, so a subscription renewed since the SELECT is kept
+    expired = expired_subscriptions(now).filter(id__in=ids)
+    count = expired.update(subscription_type=User.SubscriptionType.NONE, updated_at=now)
+    # Only reaches this process's cache; others never cache an ended subscription (see cache_auth_state)
+    for user_id in ids:
+        invalidate_auth_state(user_id)
+    return count
+
+
+def expire_subscriptions(batch_size=1000, now=None):
+    """Sweep every subscription that ended by ``now`` in batches of bulk UPDATEs; returns the count"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = list(expired_subscriptions(now).order_by('subscription_end_date')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        total += expire_batch(ids, now)
+        if len(ids) < batch_size:
+            break
+    return total
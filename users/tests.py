@@ -1,3 +1,260 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+
+from logs.models import LogRollup
+from logs.testing import AuditLogTestMixin
+from .auth_cache import get_auth_state_cache
+from .authentication import CachedJWTAuthentication
+from .hashing import BcryptExecutor, PasswordHasherBusy, hash_rounds
+from .models import User
+from .subscriptions import expire_batch, expire_subscriptions
+from .throttling import rejections, take_token
+from .views import AuthViewSet
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def bearer(user):
+    return f'Bearer {AuthViewSet()._generate_token(user)}'
+
+
+@override_settings(BCRYPT={'ROUNDS': 4})
+class CachedJWTAuthenticationTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_auth_state_cache().clear()
+        self.user = User.objects.create_user(phone_number='+966500000001', password='old-password',
+                                             user_type=User.UserType.MAINTENANCE)
+        self.authentication = CachedJWTAuthentication()
+
+    def _authenticate(self, auth=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=auth or bearer(self.user))
+        return self.authentication.authenticate(request)[0]
+
+    def test_cache_hit_needs_no_query(self):
+        self._authenticate()
+        with self.assertNumQueries(0):
+            user = self._authenticate()
+        self.assertTrue(user.from_auth_cache)
+
+    def test_cached_user_has_its_own_field_values(self):
+        self._authenticate()
+        with self.assertNumQueries(0):
+            user = self._authenticate()
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.user_type, User.UserType.MAINTENANCE)
+            self.assertTrue(user.is_active)
+            self.assertEqual(user.token_version, 0)
+
+    def test_changes_from_other_workers_apply_after_the_ttl(self):
+        self._authenticate()
+        # A queryset update sends no signal, like a change made in another process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self._authenticate()
+
+        expired = time.monotonic() + get_auth_state_cache().ttl + 1
+        with mock.patch('napkin_dispenser.cache.time.monotonic', return_value=expired):
+            with self.assertRaisesMessage(AuthenticationFailed, 'Account is deactivated'):
+                self._authenticate()
+
+    def test_revoke_tokens_rejects_cached_tokens_at_once(self):
+        auth = bearer(self.user)
+        self._authenticate(auth)
+        self.user.revoke_tokens()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has been revoked'):
+            self._authenticate(auth)
+        self._authenticate(bearer(self.user))
+
+    def test_cached_user_refuses_to_overwrite_cached_fields(self):
+        self._authenticate()
+        user = self._authenticate()
+        with self.assertRaises(ValueError):
+            user.save()
+        with self.assertRaises(ValueError):
+            user.save(update_fields=['is_active'])
+
+    def test_change_password_keeps_changes_made_elsewhere(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=bearer(self.user))
+        client.get('/api/users/my_subscription/')
+        User.objects.filter(pk=self.user.pk).update(is_active=False, token_version=5)
+
+        response = client.post('/api/auth/change_password/',
+                               {'current_password': 'old-password', 'new_password': 'new-password'},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.is_active)
+        self.assertEqual(user.token_version, 5)
+        self.assertTrue(user.check_password('new-password'))
+
+
+class SubscriptionTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_auth_state_cache().clear()
+        self.now = timezone.now()
+
+    def _user(self, number, subscription_type, days=None):
+        end = self.now + timedelta(days=days) if days is not None else None
+        return User.objects.create_user(phone_number=f'+9665000001{number:02d}', subscription_type=subscription_type,
+                                        subscription_end_date=end)
+
+    def test_has_active_subscription(self):
+        self.assertTrue(self._user(1, User.SubscriptionType.BASIC).has_active_subscription)
+        self.assertTrue(self._user(2, User.SubscriptionType.PREMIUM, days=3).has_active_subscription)
+        self.assertFalse(self._user(3, User.SubscriptionType.PREMIUM, days=-1).has_active_subscription)
+        self.assertFalse(self._user(4, User.SubscriptionType.CORPORATE, days=-1).has_active_subscription)
+        self.assertFalse(self._user(5, User.SubscriptionType.NONE).has_active_subscription)
+
+    def test_my_subscription_needs_no_query_on_a_cached_user(self):
+        user = self._user(1, User.SubscriptionType.PREMIUM, days=3)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=bearer(user))
+        client.get('/api/users/my_subscription/')
+        with self.assertNumQueries(0):
+            response = client.get('/api/users/my_subscription/')
+        self.assertEqual(response.data['subscription_type'], User.SubscriptionType.PREMIUM)
+        self.assertTrue(response.data['has_active_subscription'])
+
+    def test_sweep_expires_in_batches(self):
+        expired = [self._user(i, User.SubscriptionType.PREMIUM, days=-i) for i in range(1, 6)]
+        current = self._user(10, User.SubscriptionType.CORPORATE, days=5)
+        basic = self._user(11, User.SubscriptionType.BASIC)
+
+        # Two full batches and a final short one, each a SELECT and an UPDATE
+        with self.assertNumQueries(6):
+            self.assertEqual(expire_subscriptions(batch_size=2, now=self.now), 5)
+        self.assertFalse(User.objects.filter(pk__in=[user.pk for user in expired])
+                         .exclude(subscription_type=User.SubscriptionType.NONE).exists())
+        current.refresh_from_db()
+        basic.refresh_from_db()
+        self.assertEqual(current.subscription_type, User.SubscriptionType.CORPORATE)
+        self.assertEqual(basic.subscription_type, User.SubscriptionType.BASIC)
+
+    def test_sweep_keeps_a_subscription_renewed_after_it_was_selected(self):
+        user = self._user(1, User.SubscriptionType.PREMIUM, days=-1)
+        User.objects.filter(pk=user.pk).update(subscription_end_date=self.now + timedelta(days=30))
+        self.assertEqual(expire_batch([user.pk], self.now), 0)
+        user.refresh_from_db()
+        self.assertEqual(user.subscription_type, User.SubscriptionType.PREMIUM)
+
+    def test_cached_state_does_not_outlive_the_subscription(self):
+        user = self._user(1, User.SubscriptionType.PREMIUM)
+        User.objects.filter(pk=user.pk).update(subscription_end_date=timezone.now() + timedelta(seconds=5))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=bearer(user))
+        client.get('/api/users/my_subscription/')
+        self.assertIsNotNone(get_auth_state_cache().get(str(user.pk)))
+        with mock.patch('napkin_dispenser.cache.time.monotonic', return_value=time.monotonic() + 6):
+            self.assertIsNone(get_auth_state_cache().get(str(user.pk)))
+
+        User.objects.filter(pk=user.pk).update(subscription_end_date=self.now - timedelta(minutes=1))
+        get_auth_state_cache().clear()
+        client.get('/api/users/my_subscription/')
+        # Ended but not swept yet: not cached, so the sweep shows on the next request
+        self.assertIsNone(get_auth_state_cache().get(str(user.pk)))
+        call_command('expire_subscriptions', stdout=mock.Mock())
+        response = client.get('/api/users/my_subscription/')
+        self.assertEqual(response.data['subscription_type'], User.SubscriptionType.NONE)
+        self.assertFalse(response.data['has_active_subscription'])
+
+
+class BcryptExecutorTests(TestCase):
+    @override_settings(BCRYPT={'MAX_WORKERS': 1, 'MAX_PENDING': 1, 'QUEUE_TIMEOUT': 0.05})
+    def test_turns_hashes_away_once_every_slot_is_taken(self):
+        executor = BcryptExecutor()
+        self.addCleanup(executor.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=executor.run, args=(slow_hash,))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        with self.assertRaises(PasswordHasherBusy):
+            executor.run(lambda: 'hashed')
+        release.set()
+        thread.join()
+        self.assertEqual(executor.run(lambda: 'hashed'), 'hashed')
+
+
+@override_settings(BCRYPT={'ROUNDS': 4}, CACHES=LOCMEM_CACHE)
+class LoginHashingTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+966500000001', password='password')
+
+    def _login(self):
+        return APIClient().post('/api/auth/login/', {'phone_number': '+966500000001', 'password': 'password'},
+                                format='json')
+
+    def test_busy_hasher_answers_503_with_retry_after(self):
+        with mock.patch('users.hashing.bcrypt_executor.run', side_effect=PasswordHasherBusy()):
+            response = self._login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_login_rehashes_with_the_configured_rounds(self):
+        self.assertEqual(hash_rounds(self.user.password), 4)
+        with override_settings(BCRYPT={'ROUNDS': 5}):
+            self.assertEqual(self._login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(hash_rounds(self.user.password), 5)
+        self.assertTrue(self.user.check_password('password'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AuthThrottleTests(AuditLogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        rejections.flush()
+        self.addCleanup(rejections.flush)
+
+    def test_token_bucket_refill_and_refusal(self):
+        # Two tokens, refilled at one a second
+        self.assertEqual(take_token('bucket', 2, 1.0, now=100.0), (True, 0.0))
+        self.assertEqual(take_token('bucket', 2, 1.0, now=100.0), (True, 0.0))
+        self.assertEqual(take_token('bucket', 2, 1.0, now=100.0), (False, 1.0))
+        self.assertEqual(take_token('bucket', 2, 1.0, now=100.25), (False, 0.75))
+        self.assertEqual(take_token('bucket', 2, 1.0, now=101.0), (True, 0.0))
+        # Refills never exceed the capacity
+        self.assertEqual(take_token('bucket', 2, 1.0, now=200.0), (True, 0.0))
+        self.assertEqual(take_token('bucket', 2, 1.0, now=200.0), (True, 0.0))
+        self.assertFalse(take_token('bucket', 2, 1.0, now=200.0)[0])
+
+    @override_settings(AUTH_THROTTLE={'BUCKETS': {'login_ip': {'CAPACITY': 1, 'REFILL_PER_MINUTE': 1}}})
+    def test_refusals_are_counted_into_log_rollups(self):
+        client = APIClient()
+        body = {'phone_number': '+966500000009', 'password': 'password'}
+        self.assertEqual(client.post('/api/auth/login/', body, format='json').status_code, 401)
+        response = client.post('/api/auth/login/', body, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), 60)
+
+        rejections.flush()
+        self.assertEqual(rejections.pending, 0)
+        rollup = LogRollup.objects.get(action='LOGIN_IP_THROTTLED')
+        self.assertEqual((rollup.level, rollup.count), ('security', 1))
+
+    @override_settings(AUTH_THROTTLE={'BUCKETS': {'login_ip': {'CAPACITY': 1, 'REFILL_PER_MINUTE': 1}}})
+    def test_forged_forwarded_for_does_not_reset_the_ip_bucket(self):
+        client = APIClient()
+        body = {'phone_number': '+966500000009', 'password': 'password'}
+        statuses = [client.post('/api/auth/login/', body, format='json',
+                                HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [401, 429, 429])
@@ -0,0 +1,168 @@
+import abc
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.throttling import BaseThrottle
+
+from logs.models import Log, LogRollup, truncate_to_hour
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Bucket size (burst) and tokens added back per minute, per scope
+    'BUCKETS': {
+        'login_ip': {'CAPACITY': 30, 'REFILL_PER_MINUTE': 10},
+        'login_identity': {'CAPACITY': 10, 'REFILL_PER_MINUTE': 2},
+        'register_ip': {'CAPACITY': 10, 'REFILL_PER_MINUTE': 2},
+        'register_identity': {'CAPACITY': 3, 'REFILL_PER_MINUTE': 1},
+    },
+    'FLUSH_INTERVAL': 60,  # seconds between writes of the rejection counters
+}
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'AUTH_THROTTLE', {})}
+    config['BUCKETS'] = {**DEFAULTS['BUCKETS'], **config['BUCKETS']}
+    return config
+
+
+def take_token(key, capacity, refill_per_second, now=None):
+    """Take one token from the bucket stored under ``key``.
+
+    Returns (allowed, wait) where ``wait`` is the seconds until a token is
+    available again. State lives in the shared Django cache so every worker
+    draws from the same bucket; like DRF's own throttles the read-modify-
+    write is not atomic, so concurrent requests may overdraw by a token.
+    """
+    now = time.time() if now is None else now
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+    if tokens < 1:
+        return False, (1 - tokens) / refill_per_second
+    cache.set(key, (tokens - 1, now), timeout=int(capacity / refill_per_second) + 1)
+    return True, 0.0
+
+
+class RejectionCounter:
+    """Count throttled requests in memory and add them to LogRollup periodically.
+
+    A flood of rejected attempts costs one counter update per action and
+    hour every ``FLUSH_INTERVAL`` seconds instead of a Log row each. The
+    totals show up in the log stats like any other action.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._atexit_registered = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def record(self, action):
+        key = (truncate_to_hour(timezone.now()), Log.Level.SECURITY, action)
+        with self._lock:
+            self._counts[key] += 1
+            due = time.monotonic() - self._last_flush >= get_config()['FLUSH_INTERVAL']
+            if not self._atexit_registered:
+                atexit.register(self.flush)
+                self._atexit_registered = True
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+        try:
+            with transaction.atomic(using=router.db_for_write(LogRollup)):
+                LogRollup.add_counts(counts)
+        except Exception:
+            logger.exception('Failed to record %d throttled requests', sum(counts.values()))
+
+    @property
+    def pending(self):
+        return sum(self._counts.values())
+
+    def _reset_after_fork(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+
+rejections = RejectionCounter()
+
+
+class AuthTokenBucketThrottle(BaseThrottle, metaclass=abc.ABCMeta):
+    """Token bucket for an AuthViewSet action, keyed by ``kind``.
+
+    The scope is ``<action>_<kind>`` (e.g. ``login_ip``), configured in
+    AUTH_THROTTLE['BUCKETS']. DRF checks throttles in ``initial()``, so a
+    refused request never reaches the user lookup or bcrypt. Refusals are
+    counted per scope as ``<SCOPE>_THROTTLED`` (e.g. LOGIN_IP_THROTTLED).
+    """
+    kind = None
+
+    @abc.abstractmethod
+    def get_ident_key(self, request):
+        """What the bucket is keyed on for this request, or None to let it through"""
+
+    def allow_request(self, request, view):
+        config = get_config()
+        self.wait_seconds = None
+        scope = f'{view.action}_{self.kind}'
+        bucket = config['BUCKETS'].get(scope)
+        if not config['ENABLED'] or not bucket:
+            return True
+        ident = self.get_ident_key(request)
+        if not ident:
+            return True
+
+        digest = hashlib.sha1(ident.encode('utf-8')).hexdigest()
+        allowed, wait = take_token(f'throttle:{scope}:{digest}', bucket['CAPACITY'],
+                                   bucket['REFILL_PER_MINUTE'] / 60)
+        if not allowed:
+            self.wait_seconds = wait
+            rejections.record(f'{scope.upper()}_THROTTLED')
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AuthIPThrottle(AuthTokenBucketThrottle):
+    """Per client address; X-Forwarded-For is only trusted up to REST_FRAMEWORK['NUM_PROXIES']"""
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class AuthIdentityThrottle(AuthTokenBucketThrottle):
+    """Per phone number or email, so one account cannot be guessed at from many IPs"""
+    kind = 'identity'
+
+    def get_ident_key(self, request):
+        try:
+            data = request.data
+        except ParseError:
+            return None
+        if not hasattr(data, 'get'):
+            return None
+        identity = data.get('phone_number') or data.get('email')
+        if not isinstance(identity, str):
+            return None
+        return identity.strip().lower()
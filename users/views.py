@@ -9,15 +9,20 @@ import jwt
 from django.conf import settings
 from datetime import datetime, timedelta
 from .models import User, Wallet
-from .serializers import UserSerializer, UserCreateSerializer, UserLoginSerializer, WalletSerializer
+from .serializers import (SubscriptionUpdateSerializer, UserSerializer, UserCreateSerializer, UserLoginSerializer,
+                          WalletSerializer)
 from .permissions import IsAdmin, IsOwnerOrAdmin
-from logs.models import Log
+from .throttling import AuthIdentityThrottle, AuthIPThrottle
+from logs.services import audit_log
+from transactions.idempotency import idempotent
+from transactions.services import credit_wallet
 from django.utils import timezone
 
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
+    auth_throttle_classes = [AuthIPThrottle, AuthIdentityThrottle]
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=auth_throttle_classes)
     def register(self, request):
         serializer = UserCreateSerializer(data=request.data)
         if serializer.is_valid():
@@ -32,7 +37,7 @@ class AuthViewSet(viewsets.ViewSet):
             token = self._generate_token(user)
 
             # Log the registration
-            Log.objects.create(
+            audit_log(
                 level='info',
                 action='REGISTRATION_SUCCESS',
                 description=f'Customer {user.phone_number} registered successfully',
@@ -49,7 +54,7 @@ class AuthViewSet(viewsets.ViewSet):
             }, status=status.HTTP_201_CREATED)
 
         # Log failed registration
-        Log.objects.create(
+        audit_log(
             level='warn',
             action='REGISTRATION_FAILED',
             description=f'Registration failed for {request.data.get("phone_number")}',
@@ -60,7 +65,7 @@ class AuthViewSet(viewsets.ViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=auth_throttle_classes)
     def login(self, request):
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -75,7 +80,7 @@ class AuthViewSet(viewsets.ViewSet):
                 else:
                     user = User.objects.get(email=email)
             except User.DoesNotExist:
-                Log.objects.create(
+                audit_log(
                     level='warn',
                     action='LOGIN_FAILED',
                     description=f'Login failed - user not found',
@@ -86,7 +91,7 @@ class AuthViewSet(viewsets.ViewSet):
 
             # Check password
             if not user.check_password(password):
-                Log.objects.create(
+                audit_log(
                     level='warn',
                     action='LOGIN_FAILED',
                     description=f'Login failed - invalid password for {user.phone_number}',
@@ -97,7 +102,7 @@ class AuthViewSet(viewsets.ViewSet):
 
             # Check if user is active
             if not user.is_active:
-                Log.objects.create(
+                audit_log(
                     level='warn',
                     action='LOGIN_FAILED',
                     description=f'Login failed - account deactivated for {user.phone_number}',
@@ -110,7 +115,7 @@ class AuthViewSet(viewsets.ViewSet):
             token = self._generate_token(user)
 
             # Log successful login
-            Log.objects.create(
+            audit_log(
                 level='info',
                 action='LOGIN_SUCCESS',
                 description=f'User {user.phone_number} logged in successfully',
@@ -137,10 +142,11 @@ class AuthViewSet(viewsets.ViewSet):
             return Response({'error': 'Both current and new password are required'},
                           status=status.HTTP_400_BAD_REQUEST)
 
-        user = request.user
+        # request.user may come from the auth cache; never write its stale fields back
+        user = User.objects.get(pk=request.user.pk)
 
         if not user.check_password(current_password):
-            Log.objects.create(
+            audit_log(
                 level='warn',
                 action='PASSWORD_CHANGE_FAILED',
                 description=f'Password change failed - incorrect current password',
@@ -151,9 +157,9 @@ class AuthViewSet(viewsets.ViewSet):
                           status=status.HTTP_401_UNAUTHORIZED)
 
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password', 'updated_at'])
 
-        Log.objects.create(
+        audit_log(
             level='info',
             action='PASSWORD_CHANGED',
             description=f'Password changed successfully for {user.phone_number}',
@@ -166,6 +172,7 @@ class AuthViewSet(viewsets.ViewSet):
     def _generate_token(self, user):
         payload = {
             'user_id': str(user.id),
+            'ver': user.token_version,
             'exp': datetime.utcnow() + settings.JWT_EXPIRATION_DELTA,
             'iat': datetime.utcnow()
         }
@@ -210,13 +217,13 @@ class UserViewSet(viewsets.ModelViewSet):
             if user.user_type == User.UserType.CUSTOMER:
                 Wallet.objects.create(user=user)
 
-            Log.objects.create(
+            audit_log(
                 level='info',
                 action='ADMIN_USER_CREATION',
                 description=f'Admin created {user.user_type} user {user.phone_number}',
                 user_id=user.id,
-                admin_id=request.user.id,
-                ip_address=self._get_client_ip(request)
+                ip_address=self._get_client_ip(request),
+                metadata={'admin_id': str(request.user.id)}
             )
 
             return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
@@ -224,6 +231,7 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
+    @idempotent('add_credits')
     def add_credits(self, request, pk=None):
         user = self.get_object()
         credits = request.data.get('credits', 0)
@@ -237,25 +245,40 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Invalid credits value'},
                           status=status.HTTP_400_BAD_REQUEST)
 
-        wallet, created = Wallet.objects.get_or_create(user=user)
-        wallet.balance += credits
-        wallet.save()
+        new_balance = credit_wallet(user, credits)
 
-        Log.objects.create(
+        audit_log(
             level='info',
             action='CREDITS_ADDED',
             description=f'Admin added {credits} credits to user {user.phone_number}',
             user_id=user.id,
-            admin_id=request.user.id,
             ip_address=self._get_client_ip(request),
-            metadata={'credits_added': credits, 'new_balance': wallet.balance}
+            metadata={'admin_id': str(request.user.id), 'credits_added': credits,
+                      'new_balance': new_balance}
         )
 
         return Response({
             'message': f'Added {credits} credits to user',
-            'new_balance': wallet.balance
+            'new_balance': new_balance
         })
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
+    def revoke_tokens(self, request, pk=None):
+        """Revoke all outstanding tokens of a user (Admin only)"""
+        user = self.get_object()
+        user.revoke_tokens()
+
+        audit_log(
+            level='security',
+            action='TOKENS_REVOKED',
+            description=f'Admin revoked all tokens of user {user.phone_number}',
+            user_id=user.id,
+            ip_address=self._get_client_ip(request),
+            metadata={'admin_id': str(request.user.id), 'token_version': user.token_version}
+        )
+
+        return Response({'message': 'All tokens revoked', 'token_version': user.token_version})
+
     def _get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
@@ -277,27 +300,25 @@ class UserViewSet(viewsets.ModelViewSet):
 
             if subscription_type == User.SubscriptionType.CORPORATE:
                 user.subscription_end_date = timezone.now() + timedelta(days=duration_days)
-                wallet, created = Wallet.objects.get_or_create(user=user)
-                wallet.balance += 7
-                wallet.save()
+                credit_wallet(user, 7)
             elif subscription_type == User.SubscriptionType.BASIC:
                 user.subscription_end_date = None  # Basic is ongoing
-                wallet, created = Wallet.objects.get_or_create(user=user)
-                wallet.balance += 1
-                wallet.save()
+                credit_wallet(user, 1)
             elif subscription_type == User.SubscriptionType.PREMIUM:
                 user.subscription_end_date = timezone.now() + timedelta(days=duration_days)
             else:  # NONE
                 user.subscription_end_date = None
 
-            user.save()
+            user.save(update_fields=['subscription_type', 'subscription_start_date',
+                                     'subscription_end_date', 'updated_at'])
 
             return Response({
                 'message': f'Subscription updated to {subscription_type}',
                 'subscription_type': user.subscription_type,
                 'subscription_end_date': user.subscription_end_date,
             })
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_subscription(self, request):
         """Get current user's subscription details"""
@@ -306,6 +327,7 @@ class UserViewSet(viewsets.ModelViewSet):
             'subscription_type': user.subscription_type,
             'subscription_start_date': user.subscription_start_date,
             'subscription_end_date': user.subscription_end_date,
+            'has_active_subscription': user.has_active_subscription,
             'days_remaining': None
         }
 